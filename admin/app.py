@@ -7,10 +7,21 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, g
 from flask_cors import CORS
-from datetime import datetime
-from db.connection import Database
+from datetime import datetime, date
+import base64
+import csv
+import hashlib
+import io
+import json
+import time
+import urllib.request
+from db.cache import TTLCache
+from db.connection import Database, EXPORT_COLUMNS
+from classes.metrics import CONTENT_TYPE, Registry, register_cache_metrics, register_pool_metrics
+from db.query_stats import begin_scope, end_scope
+from tg_bot.config import LOCAL_TIMEZONE, places, workday_start, workday_end
 
 app = Flask(__name__, 
     static_folder='static',
@@ -21,20 +32,210 @@ CORS(app)
 # Get database instance
 db = Database()
 
+# Rows fetched per server-side cursor round trip in streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Page size limits of the keyset-paginated listing
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# /metrics also serves the bot process' metrics, fetched from its metrics server
+BOT_METRICS_URL = os.getenv("BOT_METRICS_URL", "http://127.0.0.1:9101/metrics")
+BOT_METRICS_TIMEOUT = 2  # seconds
+
+# /api/stats bodies per date range, the dashboard polls them. Writes of the admin
+# app clear the cache, bookings made through the bot show up within the TTL.
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "10"))  # seconds
+stats_cache = TTLCache(maxsize=64, ttl_seconds=STATS_CACHE_TTL)
+
+metrics = Registry('admin')
+register_pool_metrics(metrics, db)
+register_cache_metrics(metrics, {'availability': db.availability_cache, 'stats': stats_cache})
+REQUEST_DURATION = metrics.histogram(
+    'request_duration_seconds', 'Time spent serving an admin API request', ('endpoint', 'method', 'status')
+)
+BOT_METRICS_UP = metrics.gauge('bot_metrics_up', 'Whether the last fetch of the bot metrics succeeded')
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def stream_reservations_ndjson():
+    """One JSON object per line, same fields as the JSON export"""
+    for batch in db.iter_reservation_batches(EXPORT_BATCH_SIZE):
+        yield ''.join(
+            json.dumps({column: _json_value(value) for column, value in zip(EXPORT_COLUMNS, row)}) + '\n'
+            for row in batch
+        )
+
+
+def stream_reservations_csv():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in db.iter_reservation_batches(EXPORT_BATCH_SIZE):
+        writer.writerows([_json_value(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when the table is empty
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def encode_cursor(row) -> str:
+    """Opaque cursor pointing after row in (day, time_from, id) order"""
+    key = [row.day.isoformat(), row.time_from.isoformat(), row.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(day, time_from, id) of an encode_cursor() cursor, ValueError for anything else"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(key, list) or len(key) != 3:
+            raise ValueError
+        day, time_from, reservation_id = key
+        return date.fromisoformat(day), datetime.fromisoformat(time_from), int(reservation_id)
+    except (ValueError, TypeError):  # binascii.Error and JSONDecodeError are ValueErrors
+        raise ValueError(f'malformed cursor {cursor!r}') from None
+
+
+def reservation_to_json(res) -> dict:
+    return {
+        'id': res.id,
+        'order_id': res.order_id,
+        'telegram_id': res.telegram_id,
+        'name': res.name,
+        'type': res.type,
+        'place': res.place,
+        'day': res.day.isoformat() if res.day else None,
+        'time_from': res.time_from.isoformat() if res.time_from else None,
+        'time_to': res.time_to.isoformat() if res.time_to else None,
+        'period': res.period,
+        'sum' : res.sum,
+        'payed': res.payed,
+    }
+
+def parse_stats_range(args) -> tuple:
+    """(first day, last day) of ?date= or ?from=&to=, today by default"""
+    if 'date' in args:
+        day = datetime.strptime(args['date'], '%Y-%m-%d').date()
+        return day, day
+    today = datetime.now(LOCAL_TIMEZONE).date()
+    date_from = datetime.strptime(args['from'], '%Y-%m-%d').date() if 'from' in args else today
+    date_to = datetime.strptime(args['to'], '%Y-%m-%d').date() if 'to' in args else date_from
+    if date_to < date_from:
+        raise ValueError('to is before from')
+    return date_from, date_to
+
+
+def build_stats(date_from: date, date_to: date):
+    """Totals and per-type stats of the range, None on database error"""
+    per_type = db.get_reservation_stats(date_from, date_to)
+    if per_type is None:
+        return None
+
+    days = (date_to - date_from).days + 1
+    workday_hours = (datetime.combine(date_from, workday_end) - datetime.combine(date_from, workday_start)).seconds / 3600
+    empty = {'bookings': 0, 'pending': 0, 'awaiting_confirmation': 0, 'revenue': 0.0, 'booked_hours': 0.0}
+
+    by_type = {}
+    # Occupancy is booked hours over the opening hours of all places of the type
+    for reservation_type in {**dict.fromkeys(places), **per_type}:
+        row = per_type.get(reservation_type, empty)
+        capacity_hours = len(places.get(reservation_type, ())) * workday_hours * days
+        by_type[reservation_type] = {
+            'bookings': row['bookings'],
+            'pendingPayments': row['pending'],
+            'awaitingConfirmation': row['awaiting_confirmation'],
+            'revenue': row['revenue'],
+            'bookedHours': row['booked_hours'],
+            'occupancy': round(row['booked_hours'] / capacity_hours, 4) if capacity_hours else None,
+        }
+
+    booked_hours = sum(row['booked_hours'] for row in per_type.values())
+    capacity_hours = sum(len(type_places) for type_places in places.values()) * workday_hours * days
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'bookings': sum(row['bookings'] for row in per_type.values()),
+        'pendingPayments': sum(row['pending'] for row in per_type.values()),
+        'awaitingConfirmation': sum(row['awaiting_confirmation'] for row in per_type.values()),
+        'revenue': sum(row['revenue'] for row in per_type.values()),
+        'occupancy': round(booked_hours / capacity_hours, 4) if capacity_hours else None,
+        'byType': by_type,
+    }
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    g.query_scope = begin_scope(f'{request.method} {request.path}')
+
+
+@app.after_request
+def observe_request(response):
+    started_at = g.get('request_started_at')
+    if started_at is not None and request.endpoint != 'get_metrics':
+        REQUEST_DURATION.observe(
+            time.perf_counter() - started_at,
+            endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code
+        )
+    return response
+
+
+@app.teardown_request
+def end_query_scope(exc):
+    end_scope(g.pop('query_scope', None))
+
+
+def fetch_bot_metrics() -> str:
+    try:
+        with urllib.request.urlopen(BOT_METRICS_URL, timeout=BOT_METRICS_TIMEOUT) as response:
+            text = response.read().decode()
+        BOT_METRICS_UP.set(1)
+        return text
+    except OSError as e:
+        app.logger.warning(f"Failed to fetch bot metrics from {BOT_METRICS_URL}: {e}")
+        BOT_METRICS_UP.set(0)
+        return ''
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics of the admin app and the bot"""
+    bot_metrics = fetch_bot_metrics()
+    return Response(metrics.render() + bot_metrics, mimetype=None, content_type=CONTENT_TYPE)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
-    today = datetime.now().date()
-    todays_reservations = db.get_reservations_for_date(today)
-    pending_payments = len([r for r in todays_reservations if r.payed == "False"])
-    
-    return jsonify({
-        'todayBookings': len(todays_reservations),
-        'pendingPayments': pending_payments
-    })
+    """Aggregate stats of ?date= or ?from=&to= (today by default), 304 when If-None-Match is current"""
+    try:
+        date_from, date_to = parse_stats_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameters: {e}'}), 400
+
+    key = (date_from, date_to)
+    cached = stats_cache.get(key)
+    if cached is None:
+        stats = build_stats(date_from, date_to)
+        if stats is None:
+            return jsonify({'error': 'Failed to load stats'}), 500
+        body = json.dumps(stats).encode()
+        cached = (hashlib.sha1(body).hexdigest(), body)
+        stats_cache.set(key, cached)
+
+    etag, body = cached
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Revalidate on every poll, unchanged stats cost a 304 without a body
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/api/reservations', methods=['GET'])
 def get_reservations():
@@ -44,23 +245,34 @@ def get_reservations():
         # Get reservations for specific date
         reservations = db.get_reservations_for_date(target_date)
         # Convert to list of dictionaries
-        reservations_list = []
-        for res in reservations:
-            reservations_list.append({
-                'id': res.id,
-                'order_id': res.order_id,
-                'telegram_id': res.telegram_id,
-                'name': res.name,
-                'type': res.type,
-                'place': res.place,
-                'day': res.day.isoformat() if res.day else None,
-                'time_from': res.time_from.isoformat() if res.time_from else None,
-                'time_to': res.time_to.isoformat() if res.time_to else None,
-                'period': res.period,
-                'sum' : res.sum,
-                'payed': res.payed,
-            })
+        reservations_list = [reservation_to_json(res) for res in reservations]
         return jsonify(reservations_list)
+    elif any(arg in request.args for arg in ('from', 'to', 'limit', 'cursor')):
+        # Keyset-paginated range listing ordered by (day, time_from, id)
+        try:
+            date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if 'from' in request.args else None
+            date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if 'to' in request.args else None
+            limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+            after = decode_cursor(request.args['cursor']) if 'cursor' in request.args else None
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameters: {e}'}), 400
+
+        # One extra row tells whether there is a next page
+        rows = db.get_reservations_page(date_from, date_to, limit=limit + 1, after=after)
+        page = rows[:limit]
+        return jsonify({
+            'reservations': [reservation_to_json(row) for row in page],
+            'next_cursor': encode_cursor(page[-1]) if len(rows) > limit else None
+        })
+    elif request.args.get('format') == 'ndjson':
+        # Stream all reservations, memory stays constant regardless of table size
+        return Response(stream_reservations_ndjson(), mimetype='application/x-ndjson')
+    elif request.args.get('format') == 'csv':
+        return Response(
+            stream_reservations_csv(),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=reservations.csv'}
+        )
     else:
         # For all reservations, use the existing to_dataframe method
         reservations_df = db.to_dataframe()
@@ -69,12 +281,14 @@ def get_reservations():
 @app.route('/api/reservations/<order_id>', methods=['DELETE'])
 def delete_reservation(order_id):
     result = db.delete_reservation(order_id)
+    stats_cache.clear()
     return jsonify({'success': result is not None})
 
 @app.route('/api/reservations/<order_id>', methods=['PUT'])
 def update_reservation(order_id):
     data = request.json
     success = db.update_reservation_paid_field(order_id, data)
+    stats_cache.clear()
     return jsonify({'success': success})
 
 if __name__ == '__main__':
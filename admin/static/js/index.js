@@ -35,7 +35,7 @@ const formatDisplayDate = (date) => {
     return `${day}.${month}.${year}`;
 };
 
-const StatsCard = ({ reservations, date }) => {
+const StatsCard = ({ reservations, stats, date }) => {
     // Filter reservations for selected date and calculate stats
     const selectedDateReservations = reservations.filter(res => {
         const resDate = new Date(res.day);
@@ -64,7 +64,21 @@ const StatsCard = ({ reservations, date }) => {
                     </div>
                     <div>
                         <p className="text-sm text-gray-600">Pending Payments</p>
-                        <p className="text-3xl font-bold text-yellow-600">{pendingPaymentsCount}</p>
+                        <p className="text-3xl font-bold text-yellow-600">{stats.pendingPayments}</p>
+                    </div>
+                    <div>
+                        <p className="text-sm text-gray-600">Awaiting Confirmation</p>
+                        <p className="text-3xl font-bold text-orange-600">{stats.awaitingConfirmation}</p>
+                    </div>
+                    <div>
+                        <p className="text-sm text-gray-600">Revenue</p>
+                        <p className="text-3xl font-bold text-green-600">{stats.revenue} CZK</p>
+                    </div>
+                    <div>
+                        <p className="text-sm text-gray-600">Occupancy</p>
+                        <p className="text-3xl font-bold text-purple-600">
+                            {stats.occupancy === null ? '-' : `${Math.round(stats.occupancy * 100)}%`}
+                        </p>
                     </div>
                 </div>
             </div>
@@ -293,9 +307,28 @@ const ResourceTimeline = ({ reservations, date, workdayStart = 9, workdayEnd = 2
     );
 };
 
+const PAGE_SIZE = 200;
+
+// Follow keyset cursors until the whole range [from, to] (YYYY-MM-DD, inclusive) is loaded
+const fetchReservationRange = async (from, to) => {
+    const reservations = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({ from, to, limit: PAGE_SIZE });
+        if (cursor) params.set('cursor', cursor);
+
+        const response = await fetch(`/api/reservations?${params}`);
+        if (!response.ok) throw new Error('Failed to fetch reservations');
+        const page = await response.json();
+        reservations.push(...page.reservations);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return reservations;
+};
+
 const AdminDashboard = () => {
     const [reservations, setReservations] = useState([]);
-    const [stats, setStats] = useState({ todayBookings: 0, pendingPayments: 0 });
+    const [stats, setStats] = useState({ bookings: 0, pendingPayments: 0, awaitingConfirmation: 0, revenue: 0, occupancy: 0, byType: {} });
     const [date, setDate] = useState(new Date());
     const [searchTerm, setSearchTerm] = useState('');
     const [filterType, setFilterType] = useState('all');
@@ -328,9 +361,7 @@ const AdminDashboard = () => {
             const day = String(date.getDate()).padStart(2, '0');
             const dateStr = `${year}-${month}-${day}`;
 
-            const response = await fetch(`/api/reservations?date=${dateStr}`);
-            if (!response.ok) throw new Error('Failed to fetch reservations');
-            const data = await response.json();
+            const data = await fetchReservationRange(dateStr, dateStr);
             setReservations(data);
         } catch (error) {
             console.error('Error fetching reservations:', error);
@@ -341,7 +372,11 @@ const AdminDashboard = () => {
 
     const fetchStats = async () => {
         try {
-            const response = await fetch('/api/stats');
+            const year = date.getFullYear();
+            const month = String(date.getMonth() + 1).padStart(2, '0');
+            const day = String(date.getDate()).padStart(2, '0');
+            // Revalidate with If-None-Match, unchanged stats come back as a 304 served from the browser cache
+            const response = await fetch(`/api/stats?date=${year}-${month}-${day}`, { cache: 'no-cache' });
             if (!response.ok) throw new Error('Failed to fetch stats');
             const data = await response.json();
             setStats(data);
@@ -358,6 +393,7 @@ const AdminDashboard = () => {
             });
             if (!response.ok) throw new Error('Failed to delete reservation');
             fetchReservations();
+            fetchStats();
         } catch (error) {
             console.error('Error deleting reservation:', error);
         }
@@ -378,6 +414,7 @@ const AdminDashboard = () => {
             if (!response.ok) throw new Error('Failed to update reservation');
             setIsEditModalOpen(false);
             fetchReservations();
+            fetchStats();
         } catch (error) {
             console.error('Error updating reservation:', error);
         }
@@ -395,6 +432,7 @@ const AdminDashboard = () => {
                 <div className="grid grid-cols-1 md:grid-cols-3 gap-4 mb-6">
                     <StatsCard
                         reservations={reservations}
+                        stats={stats}
                         date={date}
                     />
 
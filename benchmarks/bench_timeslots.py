@@ -0,0 +1,97 @@
+"""
+Benchmark of the timeslot engine against the old iterrows scan.
+
+Both implementations get the same synthetic day of reservations, the results
+are compared and the timings are printed for a growing number of reservations
+per day.
+
+Usage:
+    python -m benchmarks.bench_timeslots
+"""
+import random
+import sys
+import timeit
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+import pandas as pd
+import pytz
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from db.availability import DayOccupancy, period_to_slots
+
+STRIDE_MINS = 30
+WORKDAY_START = 9
+WORKDAY_END = 21
+PLACES = tuple(range(1, 9))
+PERIOD_HOURS = 1
+
+
+def make_reservations(day: datetime, count: int, seed: int = 0) -> list[tuple[datetime, datetime, int]]:
+    """Random (time_from, time_to, place) rows on the stride grid, aware UTC like the DB returns"""
+    rng = random.Random(seed)
+    n_slots = (WORKDAY_END - WORKDAY_START) * 60 // STRIDE_MINS
+    rows = []
+    for _ in range(count):
+        start_slot = rng.randrange(n_slots)
+        length = rng.randint(1, 4)
+        time_from = day + timedelta(minutes=start_slot * STRIDE_MINS)
+        time_to = time_from + timedelta(minutes=length * STRIDE_MINS)
+        rows.append((pytz.utc.localize(time_from), pytz.utc.localize(time_to), rng.choice(PLACES)))
+    return rows
+
+
+def legacy_timeslots(day: datetime, rows) -> dict[str, list[int]]:
+    """The pre-bitmap algorithm from Database.get_available_timeslots"""
+    reservations_df = pd.DataFrame(
+        [{'time_from': f, 'time_to': t, 'place': p} for f, t, p in rows],
+        columns=['time_from', 'time_to', 'place']
+    )
+    available_slots = {}
+    slot_duration = timedelta(minutes=STRIDE_MINS)
+    reservation_duration = timedelta(hours=PERIOD_HOURS)
+    current_time = day.replace(hour=WORKDAY_START)
+    day_end = day.replace(hour=WORKDAY_END)
+    while current_time + reservation_duration <= day_end:
+        available_places = []
+        slot_end_time = current_time + reservation_duration
+        for place in PLACES:
+            is_available = True
+            for _, reservation in reservations_df.iterrows():
+                if (pytz.utc.localize(current_time) < reservation['time_to'] and
+                    pytz.utc.localize(slot_end_time) > reservation['time_from'] and
+                    place == reservation['place']):
+                    is_available = False
+                    break
+            if is_available:
+                available_places.append(place)
+        if available_places:
+            available_slots[current_time.strftime('%H:%M')] = available_places
+        current_time += slot_duration
+    return available_slots
+
+
+def occupancy_timeslots(day: datetime, rows) -> dict[str, list[int]]:
+    day_start = datetime.combine(day.date(), time(hour=WORKDAY_START))
+    day_end = datetime.combine(day.date(), time(hour=WORKDAY_END))
+    occupancy = DayOccupancy(day_start, day_end, STRIDE_MINS).add_all(rows)
+    free_slots = occupancy.free_slots(PLACES, period_to_slots(PERIOD_HOURS, STRIDE_MINS))
+    return {occupancy.slot_start(slot).strftime('%H:%M'): free for slot, free in free_slots.items()}
+
+
+def main():
+    day = datetime(2030, 1, 7, WORKDAY_START)
+    print(f"{'reservations':>12} {'legacy ms':>12} {'bitmap ms':>12} {'speedup':>10}")
+    for count in (0, 5, 10, 25, 50, 100, 200):
+        rows = make_reservations(day, count, seed=count)
+        assert legacy_timeslots(day, rows) == occupancy_timeslots(day, rows), f"Mismatch for {count} reservations"
+
+        repeats = 3 if count > 50 else 10
+        legacy = min(timeit.repeat(lambda: legacy_timeslots(day, rows), number=1, repeat=repeats))
+        bitmap = min(timeit.repeat(lambda: occupancy_timeslots(day, rows), number=1, repeat=repeats))
+        print(f"{count:>12} {legacy * 1000:>12.2f} {bitmap * 1000:>12.3f} {legacy / bitmap:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+Implements the methods the bot calls (getMe, getUpdates, setWebhook,
+deleteWebhook, sendMessage, sendPhoto, editMessageText, editMessageCaption,
+deleteMessage, answerCallbackQuery, setMessageReaction, forwardMessage) well
+enough for TelegramBot to run unchanged against it, and keeps what the bot
+sent per chat so simulated users can read their replies and press buttons.
+
+Updates are handed out through getUpdates, or posted to the webhook once the
+bot has set one (503 answers are retried like Telegram does). Uploaded photos
+get a file_id, sending a file_id this server never issued fails with 400.
+
+Usage:
+    python -m benchmarks.fake_telegram --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=1:fake python bot_run.py
+"""
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict, deque
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake bot', 'username': 'fake_bot'}
+
+# Methods that produce a message the user sees
+REPLY_METHODS = ('sendMessage', 'sendPhoto', 'editMessageText', 'editMessageCaption')
+
+
+class FakeTelegram:
+    """
+    In-memory Bot API state behind the HTTP server.
+
+    Every API call is recorded, calls of REPLY_METHODS are also queued per chat
+    for wait_reply(). `latency` adds a fixed delay to every call to mimic the
+    round trip to the real API.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0):
+        self.logger = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.latency = latency
+
+        self._updates: List[dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._replies: Dict[int, deque] = defaultdict(deque)
+        self._condition = threading.Condition()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.file_ids: Set[str] = set()  # Photos uploaded to this server
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def start(self) -> None:
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True, name='fake-telegram').start()
+        self.logger.info(f"Fake Telegram API on {self.url}")
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # Simulated users
+
+    def new_message_id(self) -> int:
+        return next(self._message_ids)
+
+    def push_update(self, update: dict) -> int:
+        """Deliver an update (without update_id) to the bot, returns its update_id"""
+        update = dict(update, update_id=next(self._update_ids))
+        with self._condition:
+            webhook_url = self.webhook_url
+            if webhook_url is None:
+                self._updates.append(update)
+                self._condition.notify_all()
+        if webhook_url is not None:
+            threading.Thread(target=self._post_update, args=(webhook_url, update), daemon=True).start()
+        return update['update_id']
+
+    def wait_reply(self, chat_id: int, timeout: float = 10) -> Optional[dict]:
+        """Next message the bot sent or edited in `chat_id`, None on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            replies = self._replies[chat_id]
+            while not replies:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return replies.popleft()
+
+    def clear_replies(self, chat_id: int) -> None:
+        """Forget replies nobody waited for, e.g. late ones after a timeout"""
+        with self._condition:
+            self._replies.pop(chat_id, None)
+
+    def _post_update(self, url: str, update: dict) -> None:
+        body = json.dumps(update).encode()
+        headers = {'Content-Type': 'application/json'}
+        if self.webhook_secret:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.webhook_secret
+        while True:
+            try:
+                urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers), timeout=30).read()
+                return
+            except urllib.error.HTTPError as e:
+                if e.code != HTTPStatus.SERVICE_UNAVAILABLE:
+                    self.logger.error(f"Webhook refused update {update['update_id']}: {e.code}")
+                    return
+                time.sleep(float(e.headers.get('Retry-After') or 1))
+
+    # Bot API methods
+
+    def call(self, method: str, params: dict):
+        """Result of an API method, raises KeyError for unknown methods"""
+        with self._condition:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'getUpdates':
+            return self._get_updates(params)
+
+        handler = {
+            'getMe': lambda: BOT_USER,
+            'setWebhook': lambda: self._set_webhook(params.get('url') or None, params.get('secret_token')),
+            'deleteWebhook': lambda: self._set_webhook(None, None),
+            'sendMessage': lambda: self._message(params, text=params.get('text')),
+            'sendPhoto': lambda: self._send_photo(params),
+            'editMessageText': lambda: self._message(params, text=params.get('text'), edited=True),
+            'editMessageCaption': lambda: self._message(params, caption=params.get('caption'), edited=True),
+            'forwardMessage': lambda: self._message(params, text='forwarded'),
+            'deleteMessage': lambda: True,
+            'answerCallbackQuery': lambda: True,
+            'setMessageReaction': lambda: True,
+        }[method]
+        return handler()
+
+    def _send_photo(self, params: dict) -> dict:
+        """Uploads (multipart, no photo param) get a new file_id, sends by file_id must use a known one"""
+        file_id = params.get('photo')
+        with self._condition:
+            if file_id is None:
+                self.calls['sendPhoto[upload]'] += 1
+                file_id = f'fake-photo-{len(self.file_ids) + 1}'
+                self.file_ids.add(file_id)
+            elif file_id not in self.file_ids:
+                raise ValueError('wrong file identifier/HTTP URL specified')
+        return self._message(params, caption=params.get('caption'), photo=[_photo_size(file_id)])
+
+    def _get_updates(self, params: dict) -> List[dict]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        with self._condition:
+            # Updates below the offset are confirmed
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            return self._updates[:limit]
+
+    def _set_webhook(self, url: Optional[str], secret: Optional[str]) -> bool:
+        with self._condition:
+            self.webhook_url = url
+            self.webhook_secret = secret
+            # Updates waiting for getUpdates go to the webhook once there is one
+            pending, self._updates = (self._updates, []) if url else ([], self._updates)
+        for update in pending:
+            threading.Thread(target=self._post_update, args=(url, update), daemon=True).start()
+        return True
+
+    def _message(self, params: dict, edited: bool = False, **content) -> dict:
+        chat_id = int(params['chat_id'])
+        message_id = int(params['message_id']) if edited else self.new_message_id()
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+            'from': BOT_USER,
+            **{key: value for key, value in content.items() if value is not None},
+        }
+        if params.get('reply_markup'):
+            message['reply_markup'] = json.loads(params['reply_markup'])
+        if edited:
+            message['edit_date'] = message['date']
+        return message
+
+    def record_reply(self, method: str, result) -> None:
+        if method in REPLY_METHODS and isinstance(result, dict):
+            with self._condition:
+                self._replies[result['chat']['id']].append(result)
+                self._condition.notify_all()
+
+    # HTTP
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes, Nagle would hold the body for the delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._dispatch()
+
+            def do_POST(self):
+                self._dispatch()
+
+            def _dispatch(self):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                # Files are uploaded as multipart, their content is not needed
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if body and self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode()))
+
+                method = url.path.rsplit('/', 1)[-1]
+                try:
+                    result = api.call(method, params)
+                except KeyError:
+                    return self._reply(HTTPStatus.NOT_FOUND, {
+                        'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'
+                    })
+                except (ValueError, TypeError) as e:
+                    return self._reply(HTTPStatus.BAD_REQUEST, {
+                        'ok': False, 'error_code': 400, 'description': f'Bad Request: {e}'
+                    })
+                self._reply(HTTPStatus.OK, {'ok': True, 'result': result})
+                api.record_reply(method, result)
+
+            def _reply(self, status: HTTPStatus, payload: dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                api.logger.debug(format % args)
+
+        return Handler
+
+
+def _photo_size(file_id: str) -> dict:
+    return {'file_id': file_id, 'file_unique_id': file_id, 'width': 800, 'height': 600}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay added to every API call")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    api = FakeTelegram(args.host, args.port, latency=args.latency_ms / 1000)
+    api.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
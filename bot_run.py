@@ -1,10 +1,51 @@
 from tg_bot.bot import TelegramBot
+from tg_bot import config
+from tg_bot.metrics import REGISTRY, register_outbox_metrics
+from classes.metrics import register_cache_metrics, register_pool_metrics, start_metrics_server
+from tg_bot.state_storage import PostgresStateStorage
 from db.connection import Database
 from dotenv import load_dotenv
+from telebot import apihelper
+from telebot.storage import StateMemoryStorage
 import os
+import secrets
 
 if __name__ == '__main__':
     load_dotenv()
     reservations_db = Database()
-    tg_bot = TelegramBot(bot_token=os.environ.get('BOT_TOKEN'), reservations_db=reservations_db)
-    tg_bot.run_bot()
\ No newline at end of file
+
+    # TELEGRAM_API_URL points the bot at a local Bot API server or a stand-in for it
+    api_url = os.environ.get('TELEGRAM_API_URL')
+    if api_url:
+        apihelper.API_URL = api_url.rstrip('/') + '/bot{0}/{1}'
+        apihelper.FILE_URL = api_url.rstrip('/') + '/file/bot{0}/{1}'
+
+    # STATE_STORAGE=postgres keeps user sessions across restarts and shares them between bot processes
+    if os.environ.get('STATE_STORAGE', 'memory') == 'postgres':
+        state_storage = PostgresStateStorage(reservations_db, cache_size=config.state_cache_size, cache_ttl=config.state_cache_ttl)
+    else:
+        state_storage = StateMemoryStorage()
+
+    tg_bot = TelegramBot(bot_token=os.environ.get('BOT_TOKEN'), reservations_db=reservations_db, state_storage=state_storage)
+
+    # Scraped through the admin app's /metrics, BOT_METRICS_PORT=0 turns it off
+    register_pool_metrics(REGISTRY, reservations_db)
+    register_cache_metrics(REGISTRY, {
+        'availability': reservations_db.availability_cache,
+        'calendar': tg_bot.calendar_cache,
+    })
+    register_outbox_metrics(REGISTRY, tg_bot.outbox)
+    metrics_port = int(os.environ.get('BOT_METRICS_PORT', config.metrics_port))
+    if metrics_port:
+        start_metrics_server(REGISTRY, os.environ.get('BOT_METRICS_HOST', '127.0.0.1'), metrics_port)
+
+    # BOT_MODE=webhook receives updates on WEBHOOK_URL instead of long polling getUpdates
+    if os.environ.get('BOT_MODE', 'polling') == 'webhook':
+        tg_bot.run_webhook(
+            url=os.environ['WEBHOOK_URL'],
+            secret_token=os.environ.get('WEBHOOK_SECRET') or secrets.token_urlsafe(32),
+            host=os.environ.get('WEBHOOK_HOST', '0.0.0.0'),
+            port=int(os.environ.get('WEBHOOK_PORT', 8443)),
+        )
+    else:
+        tg_bot.run_bot()
@@ -1,7 +1,17 @@
 from datetime import datetime
 
+# Slots holding datetimes, stored as ISO strings in the state data
+_DATETIME_SLOTS = ('day', 'time_from', 'time_to')
+
 
 class Reservation():
+    # Drafts of every user in the booking flow stay in memory, keep them small
+    __slots__ = (
+        'order_id', 'telegram_id', 'name', 'type', 'place', 'period', 'day',
+        'time_from', 'time_to', 'sum', 'payed', 'payment_confirmation_link',
+        'payment_confirmation_file_id', 'available_places'
+    )
+
     order_id : str
     telegram_id : str
     name : str
@@ -31,6 +41,7 @@ class Reservation():
         self.payed = None
         self.payment_confirmation_link = None
         self.payment_confirmation_file_id = None
+        self.available_places = None
 
     def to_dict(self) -> dict:
         return {
@@ -49,6 +60,25 @@ class Reservation():
             'payment_confirmation_file_id' : self.payment_confirmation_file_id
         }
     
+    def to_state(self) -> dict:
+        """JSON-serializable copy of all slots, drafts live in the telebot state data"""
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        for slot in _DATETIME_SLOTS:
+            if isinstance(state[slot], datetime):
+                state[slot] = state[slot].isoformat()
+        return state
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'Reservation':
+        """Reservation of a to_state dict"""
+        reservation = cls(telegramId=state.get('telegram_id'), name=state.get('name'))
+        for slot in cls.__slots__:
+            value = state.get(slot)
+            if slot in _DATETIME_SLOTS and value:
+                value = datetime.fromisoformat(value)
+            setattr(reservation, slot, value)
+        return reservation
+
     @classmethod
     def from_dataframe_row(cls, row):
         # Create instance with required parameters
@@ -0,0 +1,246 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Prometheus client defaults, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, registry: 'Registry', name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = f'{registry.namespace}_{name}' if registry.namespace else name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(name, labels, value) of every series"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. handled updates or errors"""
+    type = 'counter'
+
+    def __init__(self, registry: 'Registry', name: str, *args, **kwargs):
+        super().__init__(registry, f'{name}_total', *args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [
+                (self.name, dict(zip(self.labelnames, key)), value)
+                for key, value in self._values.items()
+            ]
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down.
+
+    With `callback` the value is read when the metrics are rendered, the
+    callback returns a number (no labels) or a {label values tuple: number} dict.
+    """
+    type = 'gauge'
+
+    def __init__(self, *args, callback: Optional[Callable] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception:
+                # Not available right now (e.g. no database), leave the series out
+                return []
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """Distribution of durations (or sizes) in cumulative buckets, with sum and count"""
+    type = 'histogram'
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        samples = []
+        for key, series in values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((f'{self.name}_sum', labels, series[-2]))
+            samples.append((f'{self.name}_count', labels, series[-1]))
+        return samples
+
+
+class Registry:
+    """
+    Metrics of one process, rendered in the Prometheus text format.
+
+    `namespace` prefixes every metric name, so the bot and the admin app can
+    be exposed on one /metrics page without their families clashing.
+    """
+
+    def __init__(self, namespace: str = ''):
+        self.namespace = namespace
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics.append(metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return Counter(self, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback: Optional[Callable] = None) -> Gauge:
+        return Gauge(self, name, documentation, labelnames, callback=callback)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return Histogram(self, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def register_pool_metrics(registry: Registry, database) -> None:
+    """Connection pool gauges of a db.connection.Database"""
+    for stat, documentation in (
+        ('size', 'Configured size of the connection pool'),
+        ('checked_out', 'Connections currently in use'),
+        ('checked_in', 'Idle connections in the pool'),
+        ('overflow', 'Connections open beyond the pool size'),
+    ):
+        registry.gauge(f'db_pool_{stat}', documentation, callback=lambda stat=stat: database.pool_stats()[stat])
+
+
+def register_cache_metrics(registry: Registry, caches: Dict[str, object]) -> None:
+    """Size and hit/miss/eviction gauges of db.cache caches, labelled by the name they are passed under"""
+    for stat, documentation in (
+        ('size', 'Entries in the cache'),
+        ('maxsize', 'Entries the cache holds before evicting the least recently used'),
+        ('hits', 'Lookups answered from the cache'),
+        ('misses', 'Lookups that found no entry or an expired one'),
+        ('evictions', 'Entries dropped to stay within maxsize'),
+        ('invalidations', 'Entries dropped by writes (availability cache)'),
+        ('stale_sets', 'Results not cached because a write invalidated them meanwhile (availability cache)'),
+    ):
+        def values(stat=stat):
+            all_stats = {name: cache.stats() for name, cache in caches.items()}
+            return {(name,): stats[stat] for name, stats in all_stats.items() if stat in stats}
+        registry.gauge(f'cache_{stat}', documentation, ('cache',), callback=values)
+
+
+def start_metrics_server(registry: Registry, host: str, port: int) -> ThreadingHTTPServer:
+    """Serve registry.render() on GET /metrics from a background thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-http').start()
+    return server
@@ -0,0 +1,669 @@
+from typing import AsyncGenerator, Optional, List, Set
+from contextlib import asynccontextmanager
+from datetime import datetime, date, time, timedelta
+import pytz
+from sqlalchemy import delete, func, select, and_, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+import logging
+
+from db import models
+from db.availability import DayOccupancy, first_bookable_slot, month_window, period_to_slots
+from db.cache import AvailabilityCache
+from db.query_stats import QueryStats
+from db.connection import (
+    DatabaseConfig, DatabaseError, AVAILABLE_DAYS_SQL, EXCLUSION_VIOLATION,
+    ClaimedReminderJobs, claim_reminder_jobs_query, finish_claim_statements, reminder_jobs_for, reminder_jobs_statement
+)
+from tg_bot.config import (
+    places, days_lookforward, LOCAL_TIMEZONE, stride_mins, time_buffer_mins,
+    reminder_thresholds_from_creation, reminder_thresholds_from_start
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _upcoming(current_datetime: datetime):
+    """Reservations on a later day, or today with a later start"""
+    current_date = current_datetime.date()
+    return or_(
+        # Future dates
+        models.Reservation.day > current_date,
+        # Today but future time
+        and_(
+            models.Reservation.day == current_date,
+            models.Reservation.time_from > current_datetime
+        )
+    )
+
+
+class AsyncDatabase:
+    """
+    asyncio counterpart of db.connection.Database.
+
+    Exposes the same methods as coroutines on top of an asyncpg engine, so one
+    event loop can keep many queries in flight without a thread per query.
+    Pool size is configured separately via ASYNC_DB_* variables.
+    """
+
+    def __init__(self):
+        self.config = DatabaseConfig()
+        self.engine = self._create_engine()
+        self.SessionLocal = self._create_session_factory()
+        self.availability_cache = AvailabilityCache(**self.config.cache_settings)
+        # Cursor events are only emitted by the sync engine underneath
+        self.query_stats = QueryStats(**self.config.query_settings)
+        self.query_stats.install(self.engine.sync_engine)
+
+    def _create_engine(self) -> AsyncEngine:
+        return create_async_engine(
+            self.config.async_database_url,
+            **self.config.async_pool_settings
+        )
+
+    def _create_session_factory(self) -> async_sessionmaker:
+        return async_sessionmaker(
+            bind=self.engine,
+            autoflush=False,
+            expire_on_commit=False
+        )
+
+    @asynccontextmanager
+    async def get_db(self) -> AsyncGenerator[AsyncSession, None]:
+        session = self.SessionLocal()
+        try:
+            yield session
+            await session.commit()
+        except SQLAlchemyError as e:
+            await session.rollback()
+            logger.error(f"Database error: {str(e)}")
+            raise DatabaseError(f"Database operation failed: {str(e)}")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Unexpected error: {str(e)}")
+            raise
+        finally:
+            await session.close()
+
+    async def dispose(self):
+        """Close all pooled connections"""
+        await self.engine.dispose()
+
+    async def find_available_days(self, new_reservation: 'Reservation') -> List[datetime]:
+        """Find available days for a new reservation"""
+        cache_key = (new_reservation.type, float(new_reservation.period), None)
+        available_days = self.availability_cache.get(cache_key)
+
+        if available_days is None:
+            since = self.availability_cache.generation()
+            try:
+                async with self.get_db() as session:
+                    if self.config.available_days_mode == 'sql':
+                        available_days = await self._find_available_days_sql(session, new_reservation)
+                    else:
+                        available_days = await self._find_available_days(session, new_reservation)
+            except Exception as e:
+                logger.error(f"Error finding available days: {str(e)}")
+                return []
+            self.availability_cache.set(cache_key, available_days, since=since)
+
+        return await self._drop_passed_days(available_days, new_reservation)
+
+    async def find_available_days_in_month(self, new_reservation: 'Reservation', year: int, month: int) -> Set[date]:
+        """Available days of one calendar month, cached under (type, period, (year, month))"""
+        now = datetime.now(LOCAL_TIMEZONE)
+        window = month_window(year, month, now.date(), days_lookforward)
+        if window is None:
+            return set()
+
+        cache_key = (new_reservation.type, float(new_reservation.period), (year, month))
+        available_days = self.availability_cache.get(cache_key)
+
+        if available_days is None:
+            since = self.availability_cache.generation()
+            first_day, last_day = window
+            try:
+                async with self.get_db() as session:
+                    if self.config.available_days_mode == 'sql':
+                        available_days = await self._find_available_days_sql(session, new_reservation, first_day, last_day)
+                    else:
+                        available_days = await self._find_available_days(session, new_reservation, first_day, last_day)
+            except Exception as e:
+                logger.error(f"Error finding available days of {year}-{month:02d}: {str(e)}")
+                return set()
+            self.availability_cache.set(cache_key, available_days, since=since)
+
+        return {day.date() for day in await self._drop_passed_days(available_days, new_reservation)}
+
+    async def _find_available_days(
+        self,
+        session: AsyncSession,
+        new_reservation: 'Reservation',
+        first_day: Optional[date] = None,
+        last_day: Optional[date] = None
+    ) -> List[datetime]:
+        all_places = places.get(new_reservation.type)
+        if not all_places:
+            return []
+
+        workday_start = self.config.workday_settings['workday_start']
+        workday_end = self.config.workday_settings['workday_end']
+        now = datetime.now(LOCAL_TIMEZONE)
+        first_day = max(first_day or now.date(), now.date())
+        last_day = min(last_day or date.max, (now + timedelta(days=days_lookforward)).date())
+
+        since = self.availability_cache.generation()
+        result = await session.execute(
+            select(
+                models.Reservation.day,
+                models.Reservation.time_from,
+                models.Reservation.time_to,
+                models.Reservation.place
+            ).where(
+                models.Reservation.type == new_reservation.type,
+                models.Reservation.day >= first_day,
+                models.Reservation.day <= last_day
+            )
+        )
+        rows_by_day = {}
+        for day, time_from, time_to, place in result:
+            rows_by_day.setdefault(day, []).append((time_from, time_to, place))
+
+        length = period_to_slots(new_reservation.period, stride_mins)
+        not_before = now + timedelta(minutes=time_buffer_mins)
+        available_days = []
+        day = first_day
+        while day <= last_day:
+            day_start = datetime.combine(day, time(hour=workday_start))
+            day_end = datetime.combine(day, time(hour=workday_end))
+            occupancy = DayOccupancy(day_start, day_end, stride_mins).add_all(rows_by_day.get(day, ()))
+            free_slots = occupancy.free_slots(all_places, length)
+            # Whole-day result is what get_available_timeslots needs, keep it
+            self.availability_cache.set((new_reservation.type, float(new_reservation.period), day), free_slots, since=since)
+
+            first_slot = first_bookable_slot(day_start, stride_mins, not_before, LOCAL_TIMEZONE)
+            if any(slot >= first_slot for slot in free_slots):
+                available_days.append(LOCAL_TIMEZONE.localize(day_start))
+            day += timedelta(days=1)
+
+        return available_days
+
+    async def _find_available_days_sql(
+        self,
+        session: AsyncSession,
+        new_reservation: 'Reservation',
+        first_day: Optional[date] = None,
+        last_day: Optional[date] = None
+    ) -> List[datetime]:
+        all_places = places.get(new_reservation.type)
+        if not all_places:
+            return []
+
+        workday_start = self.config.workday_settings['workday_start']
+        now = datetime.now(LOCAL_TIMEZONE)
+        not_before = now + timedelta(minutes=time_buffer_mins)
+
+        result = await session.execute(AVAILABLE_DAYS_SQL, {
+            'type': new_reservation.type,
+            'places': list(all_places),
+            'period_mins': float(new_reservation.period) * 60,
+            'workday_start': workday_start,
+            'workday_end': self.config.workday_settings['workday_end'],
+            'stride_mins': stride_mins,
+            'first_day': max(first_day or now.date(), now.date()),
+            'last_day': min(last_day or date.max, (now + timedelta(days=days_lookforward)).date()),
+            'not_before': not_before.replace(tzinfo=None),
+        })
+
+        return [
+            LOCAL_TIMEZONE.localize(datetime.combine(row.day, time(hour=workday_start)))
+            for row in result.all()
+        ]
+
+    async def _drop_passed_days(self, available_days: List[datetime], new_reservation: 'Reservation') -> List[datetime]:
+        """Remove days that passed since the list was cached and today if it has no bookable slot left"""
+        now = datetime.now(LOCAL_TIMEZONE)
+        today = now.date()
+        result = []
+        for day in available_days:
+            if day.date() < today:
+                continue
+            if day.date() == today:
+                try:
+                    free_slots = await self._get_free_slots(new_reservation.type, new_reservation.period, today)
+                except Exception as e:
+                    logger.error(f"Error checking today's timeslots: {str(e)}")
+                    continue
+                day_start = datetime.combine(today, time(hour=self.config.workday_settings['workday_start']))
+                first_slot = first_bookable_slot(
+                    day_start, stride_mins, now + timedelta(minutes=time_buffer_mins), LOCAL_TIMEZONE
+                )
+                if not any(slot >= first_slot for slot in free_slots):
+                    continue
+            result.append(day)
+        return result
+
+    async def get_last_reservation_by_telegram_id(self, telegram_id: str) -> Optional[models.Reservation]:
+        """Get the most recent reservation for a user"""
+        async with self.get_db() as session:
+            result = await session.scalars(
+                select(models.Reservation)
+                .where(models.Reservation.telegram_id == telegram_id)
+                .order_by(models.Reservation.created_at.desc())
+                .limit(1)
+            )
+            return result.first()
+
+    async def get_reservation_by_order_id(self, order_id: str) -> Optional[models.Reservation]:
+        """Get a reservation by its order ID"""
+        try:
+            async with self.get_db() as session:
+                result = await session.scalars(
+                    select(models.Reservation).where(models.Reservation.order_id == order_id)
+                )
+                return result.first()
+        except Exception as e:
+            logger.error(f"Error getting reservation by order ID: {str(e)}")
+            return None
+
+    async def get_reservation_by_id(self, reservation_id: int) -> Optional[models.Reservation]:
+        """Get a reservation by its primary key"""
+        try:
+            async with self.get_db() as session:
+                return await session.get(models.Reservation, reservation_id)
+        except Exception as e:
+            logger.error(f"Error getting reservation by ID: {str(e)}")
+            return None
+
+    async def get_upcoming_reservations_by_telegram_id(self, telegram_id: str) -> List[models.Reservation]:
+        """Get all upcoming reservations for a specific telegram user id"""
+        try:
+            async with self.get_db() as session:
+                current_datetime = datetime.now(LOCAL_TIMEZONE).replace(tzinfo=pytz.UTC)  # Kostyl
+                result = await session.scalars(
+                    select(models.Reservation)
+                    .where(
+                        models.Reservation.telegram_id == telegram_id,
+                        _upcoming(current_datetime)
+                    )
+                    .order_by(models.Reservation.day, models.Reservation.time_from)
+                )
+                return list(result)
+        except Exception as e:
+            logger.error(f"Error getting upcoming reservations: {str(e)}")
+            return []
+
+    async def get_unpaid_reservations_by_telegram_id(self, telegram_id: str) -> List[models.Reservation]:
+        """Get all future unpaid reservations without payment confirmation for a user"""
+        async with self.get_db() as session:
+            result = await session.scalars(
+                select(models.Reservation)
+                .where(
+                    models.Reservation.telegram_id == telegram_id,
+                    or_(
+                        models.Reservation.payment_confirmation_link.is_(None),
+                        models.Reservation.payment_confirmation_link == ''
+                    ),
+                    _upcoming(datetime.now(LOCAL_TIMEZONE))
+                )
+                .order_by(models.Reservation.created_at.desc())
+            )
+            return list(result)
+
+    async def get_paid_unconfirmed_reservations(self) -> List[models.Reservation]:
+        """Get all future reservations that have payment confirmation but are not marked as paid"""
+        async with self.get_db() as session:
+            result = await session.scalars(
+                select(models.Reservation)
+                .where(
+                    models.Reservation.payed == False,
+                    models.Reservation.payment_confirmation_link.isnot(None),
+                    models.Reservation.payment_confirmation_link != '',
+                    _upcoming(datetime.now(LOCAL_TIMEZONE))
+                )
+                .order_by(models.Reservation.created_at.desc())
+            )
+            return list(result)
+
+    async def get_upcoming_unpaid_reservations(self) -> List[models.Reservation]:
+        """Get all upcoming reservations that don't have a payment confirmation link"""
+        try:
+            async with self.get_db() as session:
+                result = await session.scalars(
+                    select(models.Reservation)
+                    .where(
+                        or_(
+                            models.Reservation.payment_confirmation_link.is_(None),
+                            models.Reservation.payment_confirmation_link == ''
+                        ),
+                        _upcoming(datetime.now(LOCAL_TIMEZONE))
+                    )
+                    .order_by(models.Reservation.created_at.desc())
+                )
+                return list(result)
+        except Exception as e:
+            logger.error(f"Error getting reservations without payment: {str(e)}")
+            return []
+
+    async def get_reservations_for_date(self, target_date: date) -> List[models.Reservation]:
+        """Get all reservations for a specific date"""
+        try:
+            async with self.get_db() as session:
+                result = await session.scalars(
+                    select(models.Reservation)
+                    .where(models.Reservation.day == target_date)
+                    .order_by(models.Reservation.time_from)
+                )
+                return list(result)
+        except Exception as e:
+            logger.error(f"Error getting reservations for date {target_date}: {str(e)}")
+            return []
+
+    async def get_available_timeslots(self, new_reservation: 'Reservation') -> dict[str, list[int]]:
+        """
+        Get all available timeslots for the day specified in the new reservation.
+
+        Returns:
+            Dictionary with time slots as keys (format "HH:MM") and lists of available places as values
+        """
+        try:
+            if not new_reservation.day:
+                logger.error("No day specified in reservation")
+                return {}
+
+            day = new_reservation.day.date()
+            free_slots = await self._get_free_slots(new_reservation.type, new_reservation.period, day)
+            if not free_slots:
+                return {}
+
+            day_start = datetime.combine(day, time(hour=self.config.workday_settings['workday_start']))
+            now = datetime.now(LOCAL_TIMEZONE) + timedelta(minutes=time_buffer_mins)
+            first_slot = first_bookable_slot(day_start, stride_mins, now, LOCAL_TIMEZONE)
+
+            return {
+                (day_start + timedelta(minutes=slot * stride_mins)).strftime('%H:%M'): list(available_places)
+                for slot, available_places in free_slots.items()
+                if slot >= first_slot
+            }
+        except Exception as e:
+            logger.error(f"Error getting available timeslots: {str(e)}")
+            return {}
+
+    async def _get_free_slots(self, reservation_type: str, period: float, day: date) -> dict[int, list[int]]:
+        """Free places per start slot index for the whole working day, served from the cache when possible"""
+        cache_key = (reservation_type, float(period), day)
+        free_slots = self.availability_cache.get(cache_key)
+        if free_slots is not None:
+            return free_slots
+        since = self.availability_cache.generation()
+
+        all_places = places.get(reservation_type)
+        if not all_places:
+            return {}
+
+        async with self.get_db() as session:
+            result = await session.execute(
+                select(
+                    models.Reservation.time_from,
+                    models.Reservation.time_to,
+                    models.Reservation.place
+                ).where(models.Reservation.day == day)
+            )
+            rows = result.all()
+
+        day_start = datetime.combine(day, time(hour=self.config.workday_settings['workday_start']))
+        day_end = datetime.combine(day, time(hour=self.config.workday_settings['workday_end']))
+        occupancy = DayOccupancy(day_start, day_end, stride_mins).add_all(rows)
+        free_slots = occupancy.free_slots(all_places, period_to_slots(period, stride_mins))
+
+        self.availability_cache.set(cache_key, free_slots, since=since)
+        return free_slots
+
+    def generate_order_id(self, r: 'Reservation'):
+        return f'{r.day.strftime("%Y-%m-%d")}_{r.period}h_{r.time_from.strftime("%H-%M")}_p{r.place}_{r.telegram_id}'
+
+    async def create_reservation(self, reservation: 'Reservation') -> Optional[models.Reservation]:
+        """
+        Create a new reservation in the database
+
+        Returns:
+            Created Reservation model object or None if creation failed
+        """
+        try:
+            async with self.get_db() as session:
+                reservation_data = reservation.to_dict()
+                db_reservation = models.Reservation(
+                    order_id=reservation_data['order_id'],
+                    telegram_id=reservation_data['telegram_id'],
+                    name=reservation_data['name'],
+                    type=reservation_data['type'],
+                    place=reservation_data['place'],
+                    day=reservation_data['day'],
+                    time_from=reservation_data['time_from'],
+                    time_to=reservation_data['time_to'],
+                    period=float(reservation_data['period']),
+                    sum=reservation_data['sum'],
+                    payed=reservation_data.get('payed', False),
+                    payment_confirmation_link=reservation_data.get('payment_confirmation_link')
+                )
+
+                # Add and flush, overlaps are rejected by the reservations_no_overlap constraint
+                session.add(db_reservation)
+                try:
+                    await session.flush()
+                except IntegrityError as e:
+                    await session.rollback()
+                    if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+                        logger.error(f"Reservation slot not available for order {db_reservation.order_id}")
+                        return None
+                    raise
+
+                # Reminders are queued in the same transaction as the reservation
+                await session.execute(reminder_jobs_statement(db_reservation, datetime.now(LOCAL_TIMEZONE)))
+                await session.commit()
+                self.availability_cache.invalidate_day(db_reservation.day)
+
+                return db_reservation
+
+        except Exception as e:
+            logger.error(f"Error creating reservation: {str(e)}")
+            return None
+
+    async def delete_reservation(self, order_id: str) -> Optional[models.Reservation]:
+        """Delete a reservation by its order_id, returns the deleted reservation or None"""
+        try:
+            async with self.get_db() as session:
+                result = await session.scalars(
+                    select(models.Reservation).where(models.Reservation.order_id == order_id)
+                )
+                reservation = result.first()
+
+                if not reservation:
+                    logger.error(f"Reservation not found for order_id: {order_id}")
+                    return None
+
+                await session.delete(reservation)
+                await session.commit()
+                self.availability_cache.invalidate_day(reservation.day)
+
+                return reservation
+
+        except Exception as e:
+            logger.error(f"Error deleting reservation {order_id}: {str(e)}")
+            return None
+
+    async def expire_unpaid_reservations(self, now: datetime) -> List[models.Reservation]:
+        """Delete every unpaid reservation past a deletion threshold in one statement, returns the deleted rows"""
+        now = now.astimezone(LOCAL_TIMEZONE)
+        start_deadline = pytz.UTC.localize(now.replace(tzinfo=None)) + reminder_thresholds_from_start[0]  # Kostyl
+        created_deadline = now - reminder_thresholds_from_creation[0]
+        try:
+            async with self.get_db() as session:
+                result = await session.scalars(
+                    delete(models.Reservation)
+                    .where(
+                        or_(
+                            models.Reservation.payment_confirmation_link.is_(None),
+                            models.Reservation.payment_confirmation_link == ''
+                        ),
+                        _upcoming(now),
+                        or_(
+                            models.Reservation.created_at < created_deadline,
+                            and_(
+                                models.Reservation.payed.isnot(True),
+                                models.Reservation.time_from <= start_deadline
+                            )
+                        )
+                    )
+                    .returning(models.Reservation),
+                    execution_options={'synchronize_session': False}
+                )
+                expired = list(result)
+                await session.commit()
+
+            for day in {reservation.day for reservation in expired}:
+                self.availability_cache.invalidate_day(day)
+            return expired
+        except Exception as e:
+            logger.error(f"Error expiring unpaid reservations: {str(e)}")
+            return []
+
+    @asynccontextmanager
+    async def claim_due_reminder_jobs(
+        self, now: datetime, limit: int = 100, retry_in: timedelta = timedelta(minutes=1)
+    ) -> AsyncGenerator[ClaimedReminderJobs, None]:
+        """Claim up to `limit` due reminder jobs with SKIP LOCKED, deleted or postponed when the block exits (see Database)"""
+        async with self.get_db() as session:
+            claimed = ClaimedReminderJobs((await session.execute(claim_reminder_jobs_query(now, limit))).all())
+            yield claimed
+            for statement in finish_claim_statements(claimed, now, retry_in):
+                await session.execute(statement, execution_options={'synchronize_session': False})
+            await session.commit()
+
+    async def next_reminder_due(self) -> Optional[datetime]:
+        """Due time of the earliest queued reminder job, None if the queue is empty"""
+        try:
+            async with self.get_db() as session:
+                return await session.scalar(select(func.min(models.ReminderJob.due_at)))
+        except Exception as e:
+            logger.error(f"Error getting next reminder due time: {str(e)}")
+            return None
+
+    async def queue_reminder_jobs(self) -> int:
+        """Queue reminder jobs for every upcoming unpaid reservation, returns the number of reservations"""
+        unpaid_reservations = await self.get_upcoming_unpaid_reservations()
+        current_time = datetime.now(LOCAL_TIMEZONE)
+        try:
+            jobs = [
+                job for reservation in unpaid_reservations if not reservation.payed
+                for job in reminder_jobs_for(reservation, current_time)
+            ]
+            async with self.get_db() as session:
+                for i in range(0, len(jobs), 1000):
+                    await session.execute(
+                        pg_insert(models.ReminderJob).values(jobs[i:i + 1000])
+                        .on_conflict_do_nothing(constraint='reminder_jobs_unique')
+                    )
+                await session.commit()
+            return len(unpaid_reservations)
+        except Exception as e:
+            logger.error(f"Error queueing reminder jobs: {str(e)}")
+            return 0
+
+    async def update_reservation_paid_field(self, order_id: str, update_data: dict, force: bool = False):
+        """
+        Update payment fields of a reservation.
+
+        Args:
+            order_id: Unique identifier of the reservation
+            update_data: Dictionary containing fields to update
+            force: If True, override all fields including payed status. If False, respect existing payed status.
+
+        Returns:
+            Updated reservation or False
+        """
+        try:
+            async with self.get_db() as session:
+                result = await session.scalars(
+                    select(models.Reservation).where(models.Reservation.order_id == order_id)
+                )
+                reservation = result.first()
+
+                if not reservation:
+                    logger.error(f"Reservation not found for order_id: {order_id}")
+                    return False
+
+                allowed_fields = {
+                    'payed',
+                    'payment_confirmation_link',
+                    'payment_confirmation_file_id'
+                }
+
+                for key, value in update_data.items():
+                    if key in allowed_fields:
+                        if key == 'payed' and not force and getattr(reservation, 'payed'):
+                            return False
+                        setattr(reservation, key, value)
+
+                if not await self._validate_reservation_update(session, reservation):
+                    await session.rollback()
+                    return False
+
+                await session.execute(reminder_jobs_statement(reservation, datetime.now(LOCAL_TIMEZONE)))
+                await session.commit()
+                self.availability_cache.invalidate_day(reservation.day)
+                return reservation
+
+        except Exception as e:
+            logger.error(f"Error updating reservation {order_id}: {str(e)}")
+            return False
+
+    async def update_payment_confirmation(self, reservation_id: str, payment_confirmation_link: str, payment_confirmation_file_id: str) -> models.Reservation|None:
+        """Update payment confirmation link for a reservation"""
+        async with self.get_db() as session:
+            result = await session.scalars(
+                select(models.Reservation).where(models.Reservation.order_id == reservation_id)
+            )
+            reservation = result.first()
+            if reservation:
+                reservation.payment_confirmation_link = payment_confirmation_link
+                reservation.payment_confirmation_file_id = payment_confirmation_file_id
+                await session.execute(reminder_jobs_statement(reservation, datetime.now(LOCAL_TIMEZONE)))
+                await session.commit()
+                return reservation
+            return None
+
+    async def _validate_reservation_update(self, session: AsyncSession, reservation: models.Reservation) -> bool:
+        """Validate that the updated reservation doesn't conflict with existing ones"""
+        try:
+            result = await session.scalars(
+                select(models.Reservation.id).where(
+                    models.Reservation.type == reservation.type,
+                    models.Reservation.place == reservation.place,
+                    models.Reservation.day == reservation.day,
+                    models.Reservation.id != reservation.id,  # Exclude current reservation
+                    models.Reservation.time_from < reservation.time_to,
+                    models.Reservation.time_to > reservation.time_from
+                ).limit(1)
+            )
+            if result.first() is not None:
+                logger.error(f"Update would create booking conflict for order_id: {reservation.order_id}")
+                return False
+
+            if (reservation.time_from >= reservation.time_to or
+                (reservation.time_to - reservation.time_from).total_seconds() / 3600 != reservation.period):
+                logger.error(f"Invalid time range for order_id: {reservation.order_id}")
+                return False
+
+            workday_start = self.config.workday_settings['workday_start']
+            workday_end = self.config.workday_settings['workday_end']
+            if reservation.time_from.hour < workday_start or reservation.time_to.hour > workday_end:
+                logger.error(f"Reservation outside working hours for order_id: {reservation.order_id}")
+                return False
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Error validating reservation update: {str(e)}")
+            return False
@@ -0,0 +1,122 @@
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import math
+import pytz
+
+
+class DayOccupancy:
+    """
+    Occupancy bitmap of one working day, split into stride-sized slots.
+
+    Every place gets an int bitmask where bit i is set when slot i
+    (day_start + i * stride) overlaps an existing reservation. Checking a
+    candidate period is then a single AND per place instead of a scan over
+    all reservations of the day.
+    """
+    __slots__ = ('day_start', 'stride_mins', 'n_slots', 'masks')
+
+    def __init__(self, day_start: datetime, day_end: datetime, stride_mins: int):
+        """
+        Args:
+            day_start: Naive start of the working day (treated as UTC, same as the DB)
+            day_end: Naive end of the working day
+            stride_mins: Slot length in minutes
+        """
+        self.day_start = day_start
+        self.stride_mins = stride_mins
+        self.n_slots = int((day_end - day_start).total_seconds() // 60) // stride_mins
+        self.masks: Dict[int, int] = {}
+
+    def _offset_mins(self, value: datetime) -> float:
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.utc).replace(tzinfo=None)
+        return (value - self.day_start).total_seconds() / 60
+
+    def add(self, place: int, time_from: datetime, time_to: datetime) -> None:
+        """Mark the slots touched by [time_from, time_to) as occupied for place"""
+        first = max(0, math.floor(self._offset_mins(time_from) / self.stride_mins))
+        last = min(self.n_slots, math.ceil(self._offset_mins(time_to) / self.stride_mins))
+        if last <= first:
+            return
+        span = ((1 << (last - first)) - 1) << first
+        self.masks[place] = self.masks.get(place, 0) | span
+
+    def add_all(self, rows: Iterable[Tuple[datetime, datetime, int]]) -> 'DayOccupancy':
+        """Add (time_from, time_to, place) rows, returns self for chaining"""
+        for time_from, time_to, place in rows:
+            self.add(place, time_from, time_to)
+        return self
+
+    def free_places(self, slot: int, length: int, all_places: Iterable[int]) -> List[int]:
+        """Places that are free for `length` slots starting at `slot`"""
+        window = ((1 << length) - 1) << slot
+        return [place for place in all_places if not self.masks.get(place, 0) & window]
+
+    def free_slots(
+        self,
+        all_places: Iterable[int],
+        length: int,
+        first_slot: int = 0
+    ) -> Dict[int, List[int]]:
+        """
+        Free places for every start slot that fits into the working day.
+
+        Args:
+            all_places: Places to check
+            length: Reservation length in slots
+            first_slot: First slot that may be offered (used to skip past times today)
+
+        Returns:
+            Dictionary slot index -> list of free places, only non-empty entries
+        """
+        all_places = tuple(all_places)
+        result = {}
+        for slot in range(max(0, first_slot), self.n_slots - length + 1):
+            free = self.free_places(slot, length, all_places)
+            if free:
+                result[slot] = free
+        return result
+
+    def slot_start(self, slot: int) -> datetime:
+        return self.day_start + timedelta(minutes=slot * self.stride_mins)
+
+
+def period_to_slots(period_hours: float, stride_mins: int) -> int:
+    """Number of stride slots covered by a reservation period (rounded up)"""
+    return math.ceil(period_hours * 60 / stride_mins)
+
+
+def first_bookable_slot(
+    day_start: datetime,
+    stride_mins: int,
+    now_local: Optional[datetime],
+    timezone
+) -> int:
+    """
+    Index of the first slot that starts strictly after now_local.
+
+    Slot starts are naive wall-clock times of the local timezone. Returns 0 when
+    now_local is None or lies on another day.
+    """
+    if now_local is None or now_local.date() != day_start.date():
+        return 0
+    local_start = timezone.localize(day_start)
+    elapsed_mins = (now_local - local_start).total_seconds() / 60
+    if elapsed_mins < 0:
+        return 0
+    return math.floor(elapsed_mins / stride_mins) + 1
+
+
+def month_window(year: int, month: int, today: date, lookforward_days: int) -> Optional[Tuple[date, date]]:
+    """
+    First and last bookable day of a calendar month.
+
+    The month is clipped to [today, today + lookforward_days], None when no
+    day of it lies in the booking horizon.
+    """
+    first_day = max(date(year, month, 1), today)
+    last_day = min(date(year, month, calendar.monthrange(year, month)[1]), today + timedelta(days=lookforward_days))
+    if first_day > last_day:
+        return None
+    return first_day, last_day
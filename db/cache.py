@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Hashable, Optional, Tuple, Union
+import threading
+import time
+
+# (type, period, day) with day a date, a (year, month) tuple or None, see AvailabilityCache
+AvailabilityKey = Tuple[str, float, Union[date, Tuple[int, int], None]]
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire ttl_seconds after they were set, thread-safe"""
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 300):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value or None on miss / expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        """Caller holds the lock"""
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Counters for sizing the cache"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class AvailabilityCache(TTLCache):
+    """
+    TTLCache of availability lookups, invalidated per day by reservation writes.
+
+    Keys are (type, period, day) tuples. `day` is a date for per-day entries
+    (timeslots), a (year, month) tuple for the available days of one calendar
+    month and None for entries that span the whole booking horizon (available
+    days), so a write on a day drops all three kinds covering it.
+
+    A reader that queried before a write committed must not put its result
+    back after the write invalidated the day: take generation() before the
+    query and pass it to set() as `since`, the value is dropped if its day,
+    month or the horizon was invalidated in between.
+
+    Only writes of this process invalidate entries, writes of other processes
+    (admin app, other bot workers) show up once the entries expire.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 300):
+        super().__init__(maxsize, ttl_seconds)
+        self.invalidations = 0
+        self.stale_sets = 0
+        self._generation = 0
+        self._invalidated_at: Dict[Union[date, Tuple[int, int], None], int] = {}  # day / month / None -> generation
+        self._cleared_at = 0
+
+    def generation(self) -> int:
+        """Counter of invalidations, read before the query whose result goes to set()"""
+        with self._lock:
+            return self._generation
+
+    def set(self, key: AvailabilityKey, value: Any, since: Optional[int] = None) -> None:
+        """Cache `value`, unless `key` was invalidated after generation `since`"""
+        with self._lock:
+            if since is not None and max(self._invalidated_at.get(key[2], 0), self._cleared_at) > since:
+                self.stale_sets += 1
+                return
+            self._store(key, value)
+
+    def invalidate_day(self, day: Optional[date]) -> None:
+        """Drop entries for `day`, its month and all horizon-wide entries"""
+        if day is None:
+            return
+        if hasattr(day, 'date'):
+            day = day.date()
+        month = (day.year, day.month)
+        with self._lock:
+            self._generation += 1
+            for scope in (day, month, None):
+                self._invalidated_at[scope] = self._generation
+            stale = [key for key in self._entries if key[2] is None or key[2] == day or key[2] == month]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._cleared_at = self._generation
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats.update(invalidations=self.invalidations, stale_sets=self.stale_sets)
+        return stats
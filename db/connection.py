@@ -1,26 +1,175 @@
-from typing import Generator, Optional, List
+from typing import TYPE_CHECKING, Generator, Optional, List, Set
 from contextlib import contextmanager
 import os
 from datetime import datetime, date, time, timedelta
 import pytz
 from urllib.parse import urlparse
-import pandas as pd
-from sqlalchemy import create_engine, event, and_, or_
+from sqlalchemy import create_engine, event, and_, or_, delete, func, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.pool import QueuePool
-from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from sqlalchemy.exc import SQLAlchemyError, OperationalError, IntegrityError
 import logging
 from functools import lru_cache
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from db import models
-from tg_bot.config import places, workday_start, workday_end, days_lookforward, LOCAL_TIMEZONE, stride_mins, time_buffer_mins
+from db.availability import DayOccupancy, first_bookable_slot, month_window, period_to_slots
+from db.cache import AvailabilityCache
+from db.query_stats import QueryStats
+from tg_bot.config import (
+    places, workday_start, workday_end, days_lookforward, LOCAL_TIMEZONE, stride_mins, time_buffer_mins,
+    reminder_thresholds_from_creation, reminder_thresholds_from_start
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns of the full reservations export (to_dataframe)
+EXPORT_COLUMNS = [
+    'id', 'created_at', 'order_id', 'telegram_id', 'name',
+    'type', 'place', 'day', 'time_from', 'time_to', 'period',
+    'sum', 'payed', 'payment_confirmation_link'
+]
+
+# Columns of the admin reservation listing
+LISTING_COLUMNS = [
+    'id', 'order_id', 'telegram_id', 'name', 'type', 'place', 'day',
+    'time_from', 'time_to', 'period', 'sum', 'payed'
+]
+
+# SQLSTATE raised by the reservations_no_overlap exclusion constraint
+EXCLUSION_VIOLATION = '23P01'
+
+# expire_unpaid_reservations() compares strictly, queue the expiry just after the threshold
+EXPIRY_GRACE = timedelta(seconds=1)
+
+# Days in [first_day, last_day] that still have at least one free (slot, place) pair.
+# Slot times are wall-clock timestamps compared against the DB as UTC, the same way
+# get_available_timeslots does it.
+AVAILABLE_DAYS_SQL = text("""
+WITH booked AS (
+    SELECT day, place, time_from, time_to
+    FROM reservations
+    WHERE type = CAST(:type AS varchar)
+      AND day BETWEEN CAST(:first_day AS date) AND CAST(:last_day AS date)
+),
+slots AS (
+    SELECT d::date AS day,
+           s AS slot_from,
+           s + CAST(:period_mins AS float8) * interval '1 minute' AS slot_to
+    FROM generate_series(CAST(:first_day AS date)::timestamp, CAST(:last_day AS date)::timestamp, interval '1 day') AS d
+    CROSS JOIN LATERAL generate_series(
+        d + CAST(:workday_start AS integer) * interval '1 hour',
+        d + CAST(:workday_end AS integer) * interval '1 hour' - CAST(:period_mins AS float8) * interval '1 minute',
+        CAST(:stride_mins AS integer) * interval '1 minute'
+    ) AS s
+)
+SELECT DISTINCT slots.day
+FROM slots
+CROSS JOIN unnest(CAST(:places AS integer[])) AS p(place)
+WHERE slots.slot_from > CAST(:not_before AS timestamp)
+  AND NOT EXISTS (
+      SELECT 1
+      FROM booked b
+      WHERE b.place = p.place
+        AND b.day = slots.day
+        AND b.time_from < slots.slot_to AT TIME ZONE 'UTC'
+        AND b.time_to > slots.slot_from AT TIME ZONE 'UTC'
+  )
+ORDER BY slots.day
+""")
+
+def reminder_jobs_for(reservation: models.Reservation, current_time: datetime) -> List[dict]:
+    """
+    reminder_jobs rows of a reservation waiting for payment.
+
+    One 'creation' job per reminder_thresholds_from_creation[1:] (the latest is
+    level 0), one 'start' job per reminder_thresholds_from_start[1:] and one
+    'expire' job at the earlier deletion threshold. Reminders already past are
+    left out, so re-queueing never repeats a sent reminder; a past expiry is due now.
+    """
+    # time_from holds local wall-clock time marked as UTC (naive until it round-trips the DB)
+    start = LOCAL_TIMEZONE.localize(reservation.time_from.replace(tzinfo=None))  # Kostyl
+    created_at = reservation.created_at
+
+    jobs = []
+    for i, threshold in enumerate(reminder_thresholds_from_creation[1:][::-1]):
+        jobs.append(('creation', i, created_at + threshold))
+    for i, threshold in enumerate(reminder_thresholds_from_start[1:]):
+        jobs.append(('start', i, start - threshold))
+    jobs = [job for job in jobs if job[2] > current_time]
+
+    expires_at = min(
+        created_at + reminder_thresholds_from_creation[0],
+        start - reminder_thresholds_from_start[0]
+    ) + EXPIRY_GRACE
+    jobs.append(('expire', 0, max(expires_at, current_time)))
+
+    return [
+        {'order_id': reservation.order_id, 'kind': kind, 'level': level, 'due_at': due_at}
+        for kind, level, due_at in jobs
+    ]
+
+
+def reminder_jobs_statement(reservation: models.Reservation, current_time: datetime):
+    """Statement bringing the reminder_jobs rows of a reservation in line with its payment state"""
+    if reservation.payed or reservation.payment_confirmation_link:
+        return delete(models.ReminderJob).where(models.ReminderJob.order_id == reservation.order_id)
+    return pg_insert(models.ReminderJob).values(
+        reminder_jobs_for(reservation, current_time)
+    ).on_conflict_do_nothing(constraint='reminder_jobs_unique')
+
+
+def claim_reminder_jobs_query(now: datetime, limit: int):
+    """Due jobs with their reservation, rows locked by other workers are skipped"""
+    return (
+        select(models.ReminderJob, models.Reservation)
+        .join(models.Reservation, models.Reservation.order_id == models.ReminderJob.order_id)
+        .where(models.ReminderJob.due_at <= now)
+        .order_by(models.ReminderJob.due_at)
+        .limit(limit)
+        .with_for_update(of=models.ReminderJob, skip_locked=True)
+    )
+
+
+class ClaimedReminderJobs(list):
+    """
+    (ReminderJob, Reservation) rows of one claim_due_reminder_jobs() block.
+
+    The jobs are deleted when the block exits, except the postpone()d ones:
+    they stay queued and are due again `retry_in` later (send failed or not
+    confirmed yet).
+    """
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.postponed: Set[int] = set()
+
+    def postpone(self, job: models.ReminderJob) -> None:
+        self.postponed.add(job.id)
+
+
+def finish_claim_statements(claimed: ClaimedReminderJobs, now: datetime, retry_in: timedelta) -> list:
+    """Statements ending a claim: delete the handled jobs, move the postponed ones to now + retry_in"""
+    done = [job.id for job, _ in claimed if job.id not in claimed.postponed]
+    statements = []
+    if done:
+        statements.append(delete(models.ReminderJob).where(models.ReminderJob.id.in_(done)))
+    if claimed.postponed:
+        statements.append(
+            update(models.ReminderJob)
+            .where(models.ReminderJob.id.in_(sorted(claimed.postponed)))
+            .values(due_at=now + retry_in)
+        )
+    return statements
+
+
 class DatabaseConfig:
     def __init__(self):
         self.database_url = self._get_database_url()
@@ -37,6 +186,27 @@ class DatabaseConfig:
             'time_buffer': int(os.getenv("TIME_BUFFER", "30")),
             'lookforward_days': int(os.getenv("LOOKFORWARD_DAYS", "30"))
         }
+        self.async_pool_settings = {
+            'pool_size': int(os.getenv("ASYNC_DB_POOL_SIZE", "20")),
+            'max_overflow': int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20")),
+            'pool_timeout': int(os.getenv("ASYNC_DB_POOL_TIMEOUT", "30")),
+            'pool_recycle': int(os.getenv("ASYNC_DB_POOL_RECYCLE", "1800")),
+            'pool_pre_ping': True
+        }
+        # 'python' evaluates days in the app, 'sql' lets Postgres return them in one query
+        self.available_days_mode = os.getenv("AVAILABLE_DAYS_MODE", "python")
+        # A process only invalidates entries on its own writes, bookings and deletions of the
+        # admin app or other bot workers show up after AVAILABILITY_CACHE_TTL seconds. Raise it
+        # only when a single process writes reservations.
+        self.cache_settings = {
+            'maxsize': int(os.getenv("AVAILABILITY_CACHE_SIZE", "1024")),
+            'ttl_seconds': float(os.getenv("AVAILABILITY_CACHE_TTL", "30"))
+        }
+        # Statements slower than this go to the db.slow_queries logger (and the file if set)
+        self.query_settings = {
+            'slow_query_ms': float(os.getenv("SLOW_QUERY_MS", "200")),
+            'slow_query_log': os.getenv("SLOW_QUERY_LOG")
+        }
         
     def _get_database_url(self) -> str:
         url = os.getenv("DATABASE_URL")
@@ -53,6 +223,11 @@ class DatabaseConfig:
             raise DatabaseConfigError("No database URL configured")
             
         return url
+
+    @property
+    def async_database_url(self) -> str:
+        """Same database, asyncpg driver"""
+        return make_url(self.database_url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
     
     @staticmethod
     def _construct_db_url() -> Optional[str]:
@@ -68,6 +243,8 @@ class Database:
         self.config = DatabaseConfig()
         self.engine = self._create_engine()
         self.SessionLocal = self._create_session_factory()
+        self.availability_cache = AvailabilityCache(**self.config.cache_settings)
+        self.query_stats = QueryStats(**self.config.query_settings)
         self._setup_engine_events()
 
     def _create_engine(self) -> Engine:
@@ -94,14 +271,92 @@ class Database:
         def checkout(dbapi_connection, connection_record, connection_proxy):
             logger.debug("Connection checked out from pool")
 
+        self.query_stats.install(self.engine)
+
+    def pool_stats(self) -> dict:
+        """Size and usage of the connection pool"""
+        pool = self.engine.pool
+        return {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        }
+
     def find_available_days(self, new_reservation: 'Reservation') -> List[datetime]:
         """Find available days for a new reservation"""
-        try:
-            with self.get_db() as session:
-                return self._find_available_days(session, new_reservation)
-        except Exception as e:
-            logger.error(f"Error finding available days: {str(e)}")
-            return []
+        cache_key = (new_reservation.type, float(new_reservation.period), None)
+        available_days = self.availability_cache.get(cache_key)
+
+        if available_days is None:
+            since = self.availability_cache.generation()
+            try:
+                with self.get_db() as session:
+                    if self.config.available_days_mode == 'sql':
+                        available_days = self._find_available_days_sql(session, new_reservation)
+                    else:
+                        available_days = self._find_available_days(session, new_reservation)
+            except Exception as e:
+                logger.error(f"Error finding available days: {str(e)}")
+                return []
+            self.availability_cache.set(cache_key, available_days, since=since)
+
+        return self._drop_passed_days(available_days, new_reservation)
+
+    def find_available_days_in_month(self, new_reservation: 'Reservation', year: int, month: int) -> Set[date]:
+        """
+        Available days of one calendar month, for rendering the calendar page of that month.
+
+        Only the part of the month inside the booking horizon is evaluated, and
+        the result is cached under (type, period, (year, month)) until a write
+        on one of its days.
+        """
+        now = datetime.now(LOCAL_TIMEZONE)
+        window = month_window(year, month, now.date(), days_lookforward)
+        if window is None:
+            return set()
+
+        cache_key = (new_reservation.type, float(new_reservation.period), (year, month))
+        available_days = self.availability_cache.get(cache_key)
+
+        if available_days is None:
+            since = self.availability_cache.generation()
+            first_day, last_day = window
+            try:
+                with self.get_db() as session:
+                    if self.config.available_days_mode == 'sql':
+                        available_days = self._find_available_days_sql(session, new_reservation, first_day, last_day)
+                    else:
+                        available_days = self._find_available_days(session, new_reservation, first_day, last_day)
+            except Exception as e:
+                logger.error(f"Error finding available days of {year}-{month:02d}: {str(e)}")
+                return set()
+            self.availability_cache.set(cache_key, available_days, since=since)
+
+        return {day.date() for day in self._drop_passed_days(available_days, new_reservation)}
+
+    def _drop_passed_days(self, available_days: List[datetime], new_reservation: 'Reservation') -> List[datetime]:
+        """Remove days that passed since the list was cached and today if it has no bookable slot left"""
+        now = datetime.now(LOCAL_TIMEZONE)
+        today = now.date()
+        result = []
+        for day in available_days:
+            if day.date() < today:
+                continue
+            if day.date() == today:
+                try:
+                    free_slots = self._get_free_slots(new_reservation.type, new_reservation.period, today)
+                except Exception as e:
+                    logger.error(f"Error checking today's timeslots: {str(e)}")
+                    continue
+                day_start = datetime.combine(today, time(hour=self.config.workday_settings['workday_start']))
+                first_slot = first_bookable_slot(
+                    day_start, stride_mins, now + timedelta(minutes=time_buffer_mins), LOCAL_TIMEZONE
+                )
+                if not any(slot >= first_slot for slot in free_slots):
+                    continue
+            result.append(day)
+        return result
 
     def get_last_reservation_by_telegram_id(self, telegram_id: str):
         """Get the most recent reservation for a user"""
@@ -123,6 +378,15 @@ class Database:
             logger.error(f"Error getting reservation by order ID: {str(e)}")
             return None
         
+    def get_reservation_by_id(self, reservation_id: int) -> Optional[models.Reservation]:
+        """Get a reservation by its primary key"""
+        try:
+            with self.get_db() as session:
+                return session.get(models.Reservation, reservation_id)
+        except Exception as e:
+            logger.error(f"Error getting reservation by ID: {str(e)}")
+            return None
+
     def get_upcoming_reservations_by_telegram_id(self, telegram_id: str) -> List[models.Reservation]:
         """
         Get all upcoming reservations for a specific telegram user id.
@@ -251,6 +515,85 @@ class Database:
             logger.error(f"Error getting reservations for date {target_date}: {str(e)}")
             return []
 
+    def get_reservations_page(
+        self,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        limit: int = 100,
+        after: Optional[tuple] = None
+    ) -> list:
+        """
+        One page of reservations ordered by (day, time_from, id), served by idx_reservations_day_time_id.
+        
+        Args:
+            date_from: First day to include, open range if None
+            date_to: Last day to include, open range if None
+            limit: Maximum number of rows
+            after: (day, time_from, id) of the last row of the previous page
+            
+        Returns:
+            List of rows with LISTING_COLUMNS attributes
+        """
+        order = (models.Reservation.day, models.Reservation.time_from, models.Reservation.id)
+        query = select(*(getattr(models.Reservation, column) for column in LISTING_COLUMNS))
+        if date_from:
+            query = query.where(models.Reservation.day >= date_from)
+        if date_to:
+            query = query.where(models.Reservation.day <= date_to)
+        if after:
+            query = query.where(tuple_(*order) > tuple_(*after))
+
+        try:
+            with self.get_db() as session:
+                return session.execute(query.order_by(*order).limit(limit)).all()
+        except Exception as e:
+            logger.error(f"Error getting reservations page: {str(e)}")
+            return []
+
+    def get_reservation_stats(self, date_from: date, date_to: date) -> Optional[dict]:
+        """
+        Booking counts, revenue and booked hours per type in one aggregate query.
+
+        Pending counts reservations neither payed nor with a payment confirmation,
+        awaiting_confirmation those with a confirmation the admin hasn't accepted yet
+        (same conditions as get_unpaid_reservations_by_telegram_id and
+        get_paid_unconfirmed_reservations). Revenue sums the payed reservations.
+
+        Args:
+            date_from: First day to include
+            date_to: Last day to include
+
+        Returns:
+            {type: {'bookings', 'pending', 'awaiting_confirmation', 'revenue', 'booked_hours'}},
+            None on database error
+        """
+        r = models.Reservation
+        no_confirmation = or_(r.payment_confirmation_link.is_(None), r.payment_confirmation_link == '')
+        query = select(
+            r.type,
+            func.count().label('bookings'),
+            func.count().filter(and_(r.payed.isnot(True), no_confirmation)).label('pending'),
+            func.count().filter(and_(r.payed == False, ~no_confirmation)).label('awaiting_confirmation'),
+            func.coalesce(func.sum(r.sum).filter(r.payed == True), 0).label('revenue'),
+            func.coalesce(func.sum(func.extract('epoch', r.time_to - r.time_from)), 0).label('booked_seconds'),
+        ).where(r.day.between(date_from, date_to)).group_by(r.type)
+
+        try:
+            with self.get_db() as session:
+                return {
+                    row.type: {
+                        'bookings': row.bookings,
+                        'pending': row.pending,
+                        'awaiting_confirmation': row.awaiting_confirmation,
+                        'revenue': float(row.revenue),
+                        'booked_hours': float(row.booked_seconds) / 3600,
+                    }
+                    for row in session.execute(query)
+                }
+        except Exception as e:
+            logger.error(f"Error getting reservation stats for {date_from} - {date_to}: {str(e)}")
+            return None
+
     def get_available_timeslots(self, new_reservation: 'Reservation') -> dict[str, list[int]]:
         """
         Get all available timeslots for the day specified in the new reservation.
@@ -267,95 +610,64 @@ class Database:
                 logger.error("No day specified in reservation")
                 return {}
 
-            with self.get_db() as session:
-                # Get existing reservations for the day
-                existing_reservations = session.query(models.Reservation).filter(
-                    and_(
-                        # models.Reservation.type == new_reservation.type,
-                        models.Reservation.day == new_reservation.day.date()
-                    )
-                ).all()
-                
-                # Convert to DataFrame for easier processing
-                if existing_reservations:
-                    reservations_df = pd.DataFrame([{
-                        'time_from': r.time_from,
-                        'time_to': r.time_to,
-                        'place': r.place
-                    } for r in existing_reservations])
-                else:
-                    reservations_df = pd.DataFrame(columns=['time_from', 'time_to', 'place'])
-
-                # Get configuration
-                workday_start = self.config.workday_settings['workday_start']
-                workday_end = self.config.workday_settings['workday_end']
-                all_places = places.get(new_reservation.type)
-                
-                if not all_places:
-                    return {}
+            day = new_reservation.day.date()
+            free_slots = self._get_free_slots(new_reservation.type, new_reservation.period, day)
+            if not free_slots:
+                return {}
 
-                # Initialize result dictionary
-                available_slots = {}
-                
-                # Calculate time slots
-                slot_duration = timedelta(minutes=stride_mins)  # 30-minute intervals
-                reservation_duration = timedelta(hours=new_reservation.period)
-                
-                # Set time boundaries
-                day_start = new_reservation.day.replace(
-                    hour=workday_start,
-                    minute=0,
-                    second=0,
-                    microsecond=0
-                )
-                day_end = new_reservation.day.replace(
-                    hour=workday_end,
-                    minute=0,
-                    second=0,
-                    microsecond=0
-                )
-                
-                # Current time for today's checks
-                now = datetime.now(LOCAL_TIMEZONE) + timedelta(minutes=time_buffer_mins)
-                
-                # Iterate through time slots
-                current_time : pd.Timestamp = day_start
-                while current_time + reservation_duration <= day_end:
-                    # Skip past times for today
-                    if new_reservation.day.date() == now.date() and LOCAL_TIMEZONE.localize(current_time.to_pydatetime()) <= now:
-                        current_time += slot_duration
-                        continue
-                    
-                    available_places = []
-                    slot_end_time = current_time + reservation_duration
-                    
-                    # Check each place
-                    for place in all_places:
-                        is_available = True
-                        # Check for overlapping reservations
-                        for _, reservation in reservations_df.iterrows():
-                            if (pytz.utc.localize(current_time) < reservation['time_to'] and 
-                                pytz.utc.localize(slot_end_time) > reservation['time_from'] and 
-                                place == reservation['place']):
-                                is_available = False
-                                break
-                        
-                        if is_available:
-                            available_places.append(place)
-                    
-                    # Add to results if there are available places
-                    if available_places:
-                        time_key = current_time.strftime('%H:%M')
-                        available_slots[time_key] = available_places
-
-                    current_time += slot_duration
-                
-                return available_slots
+            # Past slots are cut at read time so cached entries for today stay correct
+            day_start = datetime.combine(day, time(hour=self.config.workday_settings['workday_start']))
+            now = datetime.now(LOCAL_TIMEZONE) + timedelta(minutes=time_buffer_mins)
+            first_slot = first_bookable_slot(day_start, stride_mins, now, LOCAL_TIMEZONE)
+
+            return {
+                (day_start + timedelta(minutes=slot * stride_mins)).strftime('%H:%M'): list(available_places)
+                for slot, available_places in free_slots.items()
+                if slot >= first_slot
+            }
         except Exception as e:
             logger.error(f"Error getting available timeslots: {str(e)}")
             return {}
 
 
+    def _get_free_slots(self, reservation_type: str, period: float, day: date) -> dict[int, list[int]]:
+        """
+        Free places per start slot index for the whole working day, ignoring the current time.
+        Served from the availability cache when possible.
+        """
+        cache_key = (reservation_type, float(period), day)
+        free_slots = self.availability_cache.get(cache_key)
+        if free_slots is not None:
+            return free_slots
+        since = self.availability_cache.generation()
+
+        all_places = places.get(reservation_type)
+        if not all_places:
+            return {}
+
+        with self.get_db() as session:
+            # Get existing reservations for the day
+            existing_reservations = session.execute(
+                select(
+                    models.Reservation.time_from,
+                    models.Reservation.time_to,
+                    models.Reservation.place
+                ).where(
+                    # models.Reservation.type == reservation_type,
+                    models.Reservation.day == day
+                )
+            ).all()
+
+        # Set time boundaries
+        day_start = datetime.combine(day, time(hour=self.config.workday_settings['workday_start']))
+        day_end = datetime.combine(day, time(hour=self.config.workday_settings['workday_end']))
+
+        occupancy = DayOccupancy(day_start, day_end, stride_mins).add_all(existing_reservations)
+        free_slots = occupancy.free_slots(all_places, period_to_slots(period, stride_mins))
+
+        self.availability_cache.set(cache_key, free_slots, since=since)
+        return free_slots
+
     def get_upcoming_unpaid_reservations(self) -> List[models.Reservation]:
         """
         Get all upcoming reservations that don't have a payment confirmation link.
@@ -402,6 +714,136 @@ class Database:
             return []
 
 
+    def expire_unpaid_reservations(self, now: datetime) -> List[models.Reservation]:
+        """
+        Delete every upcoming reservation without payment confirmation that is past
+        a deletion threshold, in a single DELETE ... RETURNING statement.
+
+        A reservation expires when it was created more than
+        reminder_thresholds_from_creation[0] ago, or when it is not payed and starts
+        within reminder_thresholds_from_start[0].
+
+        Args:
+            now: Current time, timezone aware
+
+        Returns:
+            List[models.Reservation]: The deleted reservations, empty if none expired or on error
+        """
+        current_date = now.astimezone(LOCAL_TIMEZONE).date()
+        # time_from holds local wall-clock time marked as UTC
+        start_deadline = now.astimezone(LOCAL_TIMEZONE).replace(tzinfo=None)  # Kostyl
+        start_deadline = pytz.UTC.localize(start_deadline) + reminder_thresholds_from_start[0]
+        created_deadline = now - reminder_thresholds_from_creation[0]
+
+        statement = delete(models.Reservation).where(
+            or_(
+                models.Reservation.payment_confirmation_link.is_(None),
+                models.Reservation.payment_confirmation_link == ''
+            ),
+            or_(
+                models.Reservation.day > current_date,
+                and_(
+                    models.Reservation.day == current_date,
+                    models.Reservation.time_from > now
+                )
+            ),
+            or_(
+                models.Reservation.created_at < created_deadline,
+                and_(
+                    models.Reservation.payed.isnot(True),
+                    models.Reservation.time_from <= start_deadline
+                )
+            )
+        ).returning(models.Reservation)
+
+        try:
+            with self.get_db() as session:
+                expired = session.scalars(
+                    statement, execution_options={'synchronize_session': False}
+                ).all()
+                session.commit()
+
+            for day in {reservation.day for reservation in expired}:
+                self.availability_cache.invalidate_day(day)
+            if expired:
+                logger.info(f"Expired {len(expired)} unpaid reservations")
+            return expired
+        except SQLAlchemyError as e:
+            logger.error(f"Database error expiring unpaid reservations: {str(e)}")
+            return []
+        except Exception as e:
+            logger.error(f"Error expiring unpaid reservations: {str(e)}")
+            return []
+
+
+    @contextmanager
+    def claim_due_reminder_jobs(
+        self, now: datetime, limit: int = 100, retry_in: timedelta = timedelta(minutes=1)
+    ) -> Generator[ClaimedReminderJobs, None, None]:
+        """
+        Claim up to `limit` due reminder jobs for this worker.
+
+        Jobs are locked with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+        workers never get the same job, and stay locked until the block exits.
+        Then the jobs are deleted, postpone()d ones are moved `retry_in` later
+        instead. If the block raises, the transaction rolls back and the jobs
+        stay queued. Don't delete reservations inside the block, the cascade
+        would wait on the locked jobs.
+
+        Args:
+            now: Jobs due at or before this time are claimed
+            limit: Maximum number of jobs per claim
+            retry_in: Delay of the postponed jobs
+
+        Yields:
+            ClaimedReminderJobs, (ReminderJob, Reservation) rows ordered by due_at
+        """
+        with self.get_db() as session:
+            claimed = ClaimedReminderJobs(session.execute(claim_reminder_jobs_query(now, limit)).all())
+            yield claimed
+            for statement in finish_claim_statements(claimed, now, retry_in):
+                session.execute(statement, execution_options={'synchronize_session': False})
+            session.commit()
+
+    def next_reminder_due(self) -> Optional[datetime]:
+        """Due time of the earliest queued reminder job, None if the queue is empty"""
+        try:
+            with self.get_db() as session:
+                return session.scalar(select(func.min(models.ReminderJob.due_at)))
+        except Exception as e:
+            logger.error(f"Error getting next reminder due time: {str(e)}")
+            return None
+
+    def queue_reminder_jobs(self) -> int:
+        """
+        Queue reminder jobs for every upcoming unpaid reservation.
+
+        Idempotent: existing jobs are kept and reminders already past are not
+        queued again. Fills the queue for reservations created before it existed.
+
+        Returns:
+            Number of reservations the jobs were queued for
+        """
+        unpaid_reservations = self.get_upcoming_unpaid_reservations()
+        current_time = datetime.now(LOCAL_TIMEZONE)
+        try:
+            jobs = [
+                job for reservation in unpaid_reservations if not reservation.payed
+                for job in reminder_jobs_for(reservation, current_time)
+            ]
+            with self.get_db() as session:
+                # Chunks keep each INSERT under the bind parameter limit
+                for i in range(0, len(jobs), 1000):
+                    session.execute(
+                        pg_insert(models.ReminderJob).values(jobs[i:i + 1000])
+                        .on_conflict_do_nothing(constraint='reminder_jobs_unique')
+                    )
+                session.commit()
+            return len(unpaid_reservations)
+        except Exception as e:
+            logger.error(f"Error queueing reminder jobs: {str(e)}")
+            return 0
+
     # def get_available_places_for_timeslot(self, new_reservation: 'Reservation', time_from: time, time_to: time) -> List[int] | None:
     #     """
     #     Find available places for a given timeslot.
@@ -474,6 +916,32 @@ class Database:
     #         logger.error(f"Error getting available places: {str(e)}")
     #         return None
         
+    def get_telegram_file_id(self, content_hash: str) -> Optional[str]:
+        """file_id of an image uploaded before, by the sha256 of its content"""
+        try:
+            with self.get_db() as session:
+                return session.scalar(
+                    select(models.TelegramFile.file_id).where(models.TelegramFile.content_hash == content_hash)
+                )
+        except Exception as e:
+            logger.error(f"Error getting telegram file_id: {str(e)}")
+            return None
+
+    def save_telegram_file_id(self, content_hash: str, file_id: str) -> bool:
+        """Remember (or replace) the file_id Telegram assigned to an uploaded image"""
+        try:
+            with self.get_db() as session:
+                statement = pg_insert(models.TelegramFile).values(content_hash=content_hash, file_id=file_id)
+                session.execute(statement.on_conflict_do_update(
+                    index_elements=[models.TelegramFile.content_hash],
+                    set_={'file_id': statement.excluded.file_id, 'updated_at': func.now()}
+                ))
+                session.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error saving telegram file_id: {str(e)}")
+            return False
+
     def generate_order_id(self, r: 'Reservation'):
         return f'{r.day.strftime("%Y-%m-%d")}_{r.period}h_{r.time_from.strftime("%H-%M")}_p{r.place}_{r.telegram_id}'
 
@@ -508,15 +976,21 @@ class Database:
                     payment_confirmation_link=reservation_data.get('payment_confirmation_link')
                 )
                 
-                # Validate time slots are available
-                if not self._validate_reservation_slot(session, db_reservation):
-                    logger.error(f"Reservation slot not available for order {db_reservation.order_id}")
-                    return None
-
-                # Add and commit
+                # Add and flush, overlaps are rejected by the reservations_no_overlap constraint
                 session.add(db_reservation)
+                try:
+                    session.flush()
+                except IntegrityError as e:
+                    session.rollback()
+                    if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+                        logger.error(f"Reservation slot not available for order {db_reservation.order_id}")
+                        return None
+                    raise
+
+                # Reminders are queued in the same transaction as the reservation
+                session.execute(reminder_jobs_statement(db_reservation, datetime.now(LOCAL_TIMEZONE)))
                 session.commit()
-                session.refresh(db_reservation)
+                self.availability_cache.invalidate_day(db_reservation.day)
                 
                 return db_reservation
                 
@@ -551,6 +1025,7 @@ class Database:
                 # Delete the reservation
                 session.delete(reservation)
                 session.commit()
+                self.availability_cache.invalidate_day(reservation.day)
                 
                 return reservation
                 
@@ -685,8 +1160,11 @@ class Database:
                 if not self._validate_reservation_update(session, reservation):
                     session.rollback()
                     return False
-                
+
+                # Paid or confirmation sent: drop reminders, rejected confirmation: queue them again
+                session.execute(reminder_jobs_statement(reservation, datetime.now(LOCAL_TIMEZONE)))
                 session.commit()
+                self.availability_cache.invalidate_day(reservation.day)
                 return reservation
             
         except SQLAlchemyError as e:
@@ -706,6 +1184,7 @@ class Database:
             if reservation:
                 reservation.payment_confirmation_link = payment_confirmation_link
                 reservation.payment_confirmation_file_id = payment_confirmation_file_id
+                session.execute(reminder_jobs_statement(reservation, datetime.now(LOCAL_TIMEZONE)))
                 session.commit()
                 return reservation
             return None
@@ -764,88 +1243,114 @@ class Database:
             logger.error(f"Error validating reservation update: {str(e)}")
             return False
         
-    def _validate_reservation_slot(self, session: Session, reservation: models.Reservation) -> bool:
-        """
-        Validate that the requested time slot is available
-        
-        Args:
-            session: Database session
-            reservation: Reservation model to validate
-            
-        Returns:
-            bool indicating if slot is available
-        """
-        # Check for overlapping reservations
-        overlapping = session.query(models.Reservation).filter(
-            and_(
-                models.Reservation.type == reservation.type,
-                models.Reservation.place == reservation.place,
-                models.Reservation.day == reservation.day,
-                or_(
-                    and_(
-                        models.Reservation.time_from < reservation.time_to,
-                        models.Reservation.time_to > reservation.time_from
-                    )
-                )
-            )
-        ).first()
-        
-        return overlapping is None
-
-    def _find_available_days(self, session: Session, new_reservation: 'Reservation') -> List[datetime]:
+    def _find_available_days(
+        self,
+        session: Session,
+        new_reservation: 'Reservation',
+        first_day: Optional[date] = None,
+        last_day: Optional[date] = None
+    ) -> List[datetime]:
+        """Available days from now (or first_day) to the end of the horizon (or last_day)"""
         now = datetime.now(LOCAL_TIMEZONE)
+        start_date = now
         end_date = now + timedelta(days=days_lookforward)
-        
-        # Get existing reservations
-        existing_reservations = self._get_existing_reservations(
+        if first_day is not None and first_day > now.date():
+            start_date = LOCAL_TIMEZONE.localize(datetime.combine(first_day, time()))
+        if last_day is not None:
+            end_date = min(end_date, LOCAL_TIMEZONE.localize(datetime.combine(last_day, time.max)))
+
+        all_places = places.get(new_reservation.type)
+        if not all_places:
+            return []
+
+        # Get existing reservations grouped by day
+        since = self.availability_cache.generation()
+        rows_by_day = {}
+        for day, time_from, time_to, place in self._get_existing_reservations(
             session,
             new_reservation.type,
-            now,
+            start_date,
             end_date
-        )
-        
-        # Generate possible days
-        days_to_check = self._generate_days_range(now, end_date)
-        
+        ):
+            rows_by_day.setdefault(day, []).append((time_from, time_to, place))
+
+        workday_start = self.config.workday_settings['workday_start']
+        workday_end = self.config.workday_settings['workday_end']
+        length = period_to_slots(new_reservation.period, stride_mins)
+        not_before = now + timedelta(minutes=time_buffer_mins)
+
         available_days = []
-        for day in days_to_check:
-            if self._has_available_slots(day, new_reservation, existing_reservations):
+        for day in self._generate_days_range(start_date, end_date):
+            day_start = datetime.combine(day.date(), time(hour=workday_start))
+            day_end = datetime.combine(day.date(), time(hour=workday_end))
+            occupancy = DayOccupancy(day_start, day_end, stride_mins).add_all(rows_by_day.get(day.date(), ()))
+            free_slots = occupancy.free_slots(all_places, length)
+            # Whole-day result is what get_available_timeslots needs, keep it
+            self.availability_cache.set(
+                (new_reservation.type, float(new_reservation.period), day.date()), free_slots, since=since
+            )
+
+            first_slot = first_bookable_slot(day_start, stride_mins, not_before, LOCAL_TIMEZONE)
+            if any(slot >= first_slot for slot in free_slots):
                 available_days.append(day)
-                
+
         return available_days
 
+    def _find_available_days_sql(
+        self,
+        session: Session,
+        new_reservation: 'Reservation',
+        first_day: Optional[date] = None,
+        last_day: Optional[date] = None
+    ) -> List[datetime]:
+        all_places = places.get(new_reservation.type)
+        if not all_places:
+            return []
+
+        workday_start = self.config.workday_settings['workday_start']
+        now = datetime.now(LOCAL_TIMEZONE)
+        not_before = now + timedelta(minutes=time_buffer_mins)
+
+        rows = session.execute(AVAILABLE_DAYS_SQL, {
+            'type': new_reservation.type,
+            'places': list(all_places),
+            'period_mins': float(new_reservation.period) * 60,
+            'workday_start': workday_start,
+            'workday_end': self.config.workday_settings['workday_end'],
+            'stride_mins': stride_mins,
+            'first_day': max(first_day or now.date(), now.date()),
+            'last_day': min(last_day or date.max, (now + timedelta(days=days_lookforward)).date()),
+            'not_before': not_before.replace(tzinfo=None),
+        }).all()
+
+        return [
+            LOCAL_TIMEZONE.localize(datetime.combine(row.day, time(hour=workday_start)))
+            for row in rows
+        ]
+
     def _get_existing_reservations(
         self,
         session: Session,
         reservation_type: str,
         start_date: datetime,
         end_date: datetime
-    ) -> pd.DataFrame:
+    ) -> List[tuple]:
+        """(day, time_from, time_to, place) rows of one type in the date range"""
         query = (
-            session.query(models.Reservation)
-            .filter(
-                and_(
-                    models.Reservation.type == reservation_type,
-                    models.Reservation.day >= start_date.date(),
-                    models.Reservation.day <= end_date.date()
-                )
+            select(
+                models.Reservation.day,
+                models.Reservation.time_from,
+                models.Reservation.time_to,
+                models.Reservation.place
+            )
+            .where(
+                models.Reservation.type == reservation_type,
+                models.Reservation.day >= start_date.date(),
+                models.Reservation.day <= end_date.date()
             )
             .order_by(models.Reservation.day, models.Reservation.time_from)
         )
-        
-        reservations = query.all()
-        
-        if not reservations:
-            return pd.DataFrame(columns=['day', 'time_from', 'time_to', 'place'])
-            
-        data = [{
-            'day': r.day,
-            'time_from': r.time_from,
-            'time_to': r.time_to,
-            'place': r.place
-        } for r in reservations]
-            
-        return pd.DataFrame(data)
+        return session.execute(query).all()
 
     def _generate_days_range(
         self,
@@ -880,63 +1385,6 @@ class Database:
             
         return days
 
-    def _has_available_slots(
-        self,
-        day: datetime,
-        new_reservation: 'Reservation',
-        existing_reservations: pd.DataFrame
-    ) -> bool:
-        day_reservations = existing_reservations[
-            existing_reservations['day'] == day.date()
-        ]
-        
-        all_places = places.get(new_reservation.type)
-        if not all_places:
-            return False
-            
-        duration = timedelta(hours=new_reservation.period)
-        workday_start = self.config.workday_settings['workday_start']
-        workday_end = self.config.workday_settings['workday_end']
-        
-        current_time = day.replace(hour=workday_start, minute=0)
-        end_time = day.replace(hour=workday_end, minute=0)
-        
-        while current_time + duration <= end_time:
-            if current_time <= datetime.now(LOCAL_TIMEZONE):
-                current_time += timedelta(minutes=30)
-                continue
-                
-            for place in all_places:
-                if self._is_slot_available(
-                    current_time,
-                    current_time + duration,
-                    place,
-                    day_reservations
-                ):
-                    return True
-                    
-            current_time += timedelta(minutes=30)
-            
-        return False
-
-    def _is_slot_available(
-        self,
-        start_time: datetime,
-        end_time: datetime,
-        place: int,
-        day_reservations: pd.DataFrame
-    ) -> bool:
-        place_reservations = day_reservations[
-            day_reservations['place'] == place
-        ]
-        
-        for _, reservation in place_reservations.iterrows():
-            if (start_time < reservation['time_to'] and 
-                end_time > reservation['time_from']):
-                return False
-                
-        return True
-
     # [Previous methods remain unchanged...]
     @contextmanager
     def get_db(self) -> Generator[Session, None, None]:
@@ -969,47 +1417,37 @@ class Database:
             raise
 
     
-    def to_dataframe(self) -> pd.DataFrame:
+    def iter_reservation_batches(self, batch_size: int = 1000) -> Generator[List[tuple], None, None]:
+        """
+        Yield all reservations as lists of EXPORT_COLUMNS tuples, batch_size rows at a time.
+
+        Uses a server-side cursor, so memory stays constant no matter how large the table is.
+        The connection is held until the generator is exhausted or closed.
+        """
+        query = (
+            select(*(getattr(models.Reservation, column) for column in EXPORT_COLUMNS))
+            .order_by(models.Reservation.id)
+        )
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+            for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+    def to_dataframe(self) -> 'pd.DataFrame':
         """Convert all reservations to a pandas DataFrame with localized times"""
+        # Only the admin export uses pandas, importing it here keeps it out of the bot's startup
+        import pandas as pd
+
         try:
             with self.get_db() as session:
-                reservations = session.query(models.Reservation).all()
-                
-                if not reservations:
-                    return pd.DataFrame(columns=[
-                        'id', 'created_at', 'order_id', 'telegram_id', 'name',
-                        'type', 'place', 'day', 'time_from', 'time_to', 'period',
-                        'sum', 'payed', 'payment_confirmation_link'
-                    ])
-                
-                data = []
-                for r in reservations:
-                    data.append({
-                        'id': r.id,
-                        'created_at': r.created_at,
-                        'order_id': r.order_id,
-                        'telegram_id': r.telegram_id,
-                        'name': r.name,
-                        'type': r.type,
-                        'place': r.place, 
-                        'day': r.day,
-                        'time_from': r.time_from,
-                        'time_to': r.time_to,
-                        'period': r.period,
-                        'sum': r.sum,
-                        'payed': r.payed,
-                        'payment_confirmation_link': r.payment_confirmation_link
-                    })
-                
-                return pd.DataFrame(data)
-            
+                rows = session.execute(
+                    select(*(getattr(models.Reservation, column) for column in EXPORT_COLUMNS))
+                ).all()
+            return pd.DataFrame.from_records(rows, columns=EXPORT_COLUMNS)
+        
         except Exception as e:
             logger.error(f"Error converting to dataframe: {str(e)}")
-            return pd.DataFrame(columns=[
-                'id', 'created_at', 'order_id', 'telegram_id', 'name',
-                'type', 'place', 'day', 'time_from', 'time_to', 'period',
-                'sum', 'payed', 'payment_confirmation_link'
-            ])
+            return pd.DataFrame(columns=EXPORT_COLUMNS)
 
 class DatabaseError(Exception):
     pass
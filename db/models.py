@@ -1,9 +1,41 @@
-from sqlalchemy import Column, Integer, Float, Boolean, String, DateTime, Date
+from sqlalchemy import (
+    Column, Integer, BigInteger, Float, Boolean, String, DateTime, Date, Computed, ForeignKey, Index,
+    UniqueConstraint, text
+)
+from sqlalchemy.dialects.postgresql import JSONB, TSTZRANGE, ExcludeConstraint
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declarative_base
 
-class Reservation(declarative_base()):
+Base = declarative_base()
+
+
+class Reservation(Base):
     __tablename__ = "reservations"
+    __table_args__ = (
+        # Same place can't be booked twice for overlapping times (see MIGRATE_NO_OVERLAP_SQL)
+        ExcludeConstraint(
+            ('type', '='), ('place', '='), ('time_range', '&&'),
+            name='reservations_no_overlap',
+            using='gist'
+        ),
+        # Access paths of the Database query methods (see CREATE_INDEXES_CONCURRENTLY_SQL)
+        Index('idx_reservations_type_day_place', 'type', 'day', 'place'),
+        Index('idx_reservations_day_time_id', 'day', 'time_from', 'id'),
+        Index('idx_reservations_telegram_day_time', 'telegram_id', 'day', 'time_from'),
+        Index(
+            'idx_reservations_unpaid_upcoming', 'day', 'time_from',
+            postgresql_where=text("payment_confirmation_link IS NULL OR payment_confirmation_link = ''")
+        ),
+        Index(
+            'idx_reservations_paid_unconfirmed', 'day', 'time_from',
+            postgresql_where=text(
+                "payed = false AND payment_confirmation_link IS NOT NULL AND payment_confirmation_link <> ''"
+            )
+        ),
+    )
+    # Fetch server-generated columns with INSERT ... RETURNING instead of a refresh
+    __mapper_args__ = {'eager_defaults': True}
 
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -19,4 +51,46 @@ class Reservation(declarative_base()):
     sum = Column(Float)
     payed = Column(Boolean)
     payment_confirmation_link = Column(String)
-    payment_confirmation_file_id = Column(String)
\ No newline at end of file
+    payment_confirmation_file_id = Column(String)
+    time_range = deferred(Column(TSTZRANGE, Computed("tstzrange(time_from, time_to, '[)')")))
+
+
+class ReminderJob(Base):
+    """
+    Pending reminder of an unpaid reservation, consumed by ReminderSystem workers.
+
+    kind is 'creation' or 'start' for a user reminder of the given level and
+    'expire' for the run of expire_unpaid_reservations().
+    """
+    __tablename__ = "reminder_jobs"
+    __table_args__ = (
+        UniqueConstraint('order_id', 'kind', 'level', name='reminder_jobs_unique'),
+        # "What is due now" is an index range scan however long the queue is
+        Index('idx_reminder_jobs_due_at', 'due_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(String, ForeignKey('reservations.order_id', ondelete='CASCADE'), nullable=False)
+    kind = Column(String, nullable=False)
+    level = Column(Integer, nullable=False, default=0)
+    due_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class TelegramFile(Base):
+    """file_id Telegram assigned to an uploaded static image, keyed by the sha256 of its content"""
+    __tablename__ = "telegram_files"
+
+    content_hash = Column(String, primary_key=True)
+    file_id = Column(String, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class BotState(Base):
+    """telebot FSM state and data of one user in one chat (see tg_bot.state_storage)"""
+    __tablename__ = "bot_states"
+
+    chat_id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    state = Column(String)
+    data = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
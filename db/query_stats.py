@@ -0,0 +1,177 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('db.slow_queries')
+
+# Queries one bot update or HTTP request may issue before it is reported
+MAX_QUERIES_PER_SCOPE = int(os.getenv("MAX_QUERIES_PER_UPDATE", "10"))
+
+# Distinct fingerprints tracked, later ones are counted under OTHER
+MAX_FINGERPRINTS = 1000
+OTHER = '<other>'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_BIND = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_TUPLE = r"\(\s*\?(?:\s*,\s*\?)*\s*\)"
+# IN-lists and VALUES rows of any length, so one statement keeps one fingerprint
+_LIST = re.compile(rf"\b(IN)\s*{_TUPLE}", re.IGNORECASE)
+_ROWS = re.compile(rf"\b(VALUES)\s*{_TUPLE}(?:\s*,\s*{_TUPLE})*", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """SQL with literals and bind parameters replaced by ?, lists collapsed, whitespace normalised"""
+    sql = _STRING.sub('?', statement)
+    sql = _BIND.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub(r'\1 (?+)', sql)
+    sql = _ROWS.sub(r'\1 (?+)+', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def parameter_shape(value) -> str:
+    """Type of a bind value without the value itself, lists and strings with their length"""
+    if value is None:
+        return 'None'
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}[{len(value)}]'
+    if isinstance(value, (list, tuple, set)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def parameters_shape(parameters, executemany: bool) -> str:
+    if executemany and parameters:
+        return f'{len(parameters)} x {parameters_shape(parameters[0], False)}'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {parameter_shape(value)}' for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(parameter_shape(value) for value in parameters) + ')'
+    return parameter_shape(parameters)
+
+
+class QueryScope:
+    """Queries issued while handling one bot update or HTTP request"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints: Counter = Counter()
+
+    def report(self, max_queries: int) -> None:
+        if self.count <= max_queries:
+            return
+        # The same statement over and over is the usual N+1 signature
+        repeated = [(sql, n) for sql, n in self.fingerprints.most_common(3) if n > 1]
+        logger.warning(
+            f"{self.name} issued {self.count} queries ({self.duration * 1000:.1f} ms), more than {max_queries}"
+            + ''.join(f"\n    {n} x {sql[:200]}" for sql, n in repeated)
+        )
+
+
+_current_scope: ContextVar[Optional[QueryScope]] = ContextVar('query_scope', default=None)
+
+
+def begin_scope(name: str):
+    """Start counting queries for `name`, returns the token for end_scope (None inside another scope)"""
+    if _current_scope.get() is not None:
+        return None
+    return _current_scope.set(QueryScope(name))
+
+
+def end_scope(token, max_queries: int = MAX_QUERIES_PER_SCOPE) -> Optional[QueryScope]:
+    """Stop the scope begun with `token` and warn if it issued more than `max_queries` queries"""
+    if token is None:
+        return None
+    scope = _current_scope.get()
+    _current_scope.reset(token)
+    scope.report(max_queries)
+    return scope
+
+
+@contextmanager
+def query_scope(name: str, max_queries: int = MAX_QUERIES_PER_SCOPE):
+    """Count the queries of the block, nested scopes count towards the outermost one"""
+    token = begin_scope(name)
+    try:
+        yield _current_scope.get()
+    finally:
+        end_scope(token, max_queries)
+
+
+class QueryStats:
+    """
+    Per-fingerprint statement timing collected from engine events.
+
+    Statements slower than `slow_query_ms` go to the db.slow_queries logger
+    (and `slow_query_log` if set) with the shape of their parameters, never
+    their values. Every statement also counts towards the current QueryScope.
+    """
+
+    def __init__(self, slow_query_ms: float = 200, slow_query_log: Optional[str] = None):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self._stats: Dict[str, list] = {}  # fingerprint -> [count, total seconds, max seconds]
+        self._lock = threading.Lock()
+        if slow_query_log and not any(
+            isinstance(handler, logging.FileHandler) and handler.baseFilename == os.path.abspath(slow_query_log)
+            for handler in slow_query_logger.handlers
+        ):
+            slow_query_logger.addHandler(logging.FileHandler(slow_query_log))
+
+    def install(self, engine: Engine) -> None:
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        sql = fingerprint(statement)
+
+        with self._lock:
+            key = sql if sql in self._stats or len(self._stats) < MAX_FINGERPRINTS else OTHER
+            stats = self._stats.setdefault(key, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.count += 1
+            scope.duration += elapsed
+            scope.fingerprints[sql] += 1
+
+        if elapsed >= self.slow_query_seconds:
+            slow_query_logger.warning(
+                f"{elapsed * 1000:.1f} ms{f' in {scope.name}' if scope else ''}: {sql} "
+                f"params {parameters_shape(parameters, executemany)}"
+            )
+
+    def top(self, n: int = 20) -> List[Tuple[str, int, float, float]]:
+        """(fingerprint, count, total ms, max ms) of the statements with the most total time"""
+        with self._lock:
+            rows = [(sql, count, total * 1000, longest * 1000) for sql, (count, total, longest) in self._stats.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)[:n]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
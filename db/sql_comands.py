@@ -9,6 +9,8 @@ load_dotenv()
 # SQL for creating the reservations table
 # Updated table creation SQL with new schema
 CREATE_TABLE_SQL = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 CREATE TABLE IF NOT EXISTS reservations (
     id SERIAL PRIMARY KEY,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
@@ -24,11 +26,58 @@ CREATE TABLE IF NOT EXISTS reservations (
     sum FLOAT,
     payed BOOLEAN,
     payment_confirmation_link VARCHAR,
-    payment_confirmation_file_id VARCHAR
+    payment_confirmation_file_id VARCHAR,
+    time_range TSTZRANGE GENERATED ALWAYS AS (tstzrange(time_from, time_to, '[)')) STORED,
+    CONSTRAINT reservations_no_overlap
+        EXCLUDE USING gist (type WITH =, place WITH =, time_range WITH &&)
 );
 CREATE INDEX IF NOT EXISTS idx_order_id ON reservations(order_id);
+CREATE INDEX IF NOT EXISTS idx_reservations_type_day_place ON reservations(type, day, place);
+CREATE INDEX IF NOT EXISTS idx_reservations_day_time_id ON reservations(day, time_from, id);
+CREATE INDEX IF NOT EXISTS idx_reservations_telegram_day_time ON reservations(telegram_id, day, time_from);
+CREATE INDEX IF NOT EXISTS idx_reservations_unpaid_upcoming ON reservations(day, time_from)
+    WHERE payment_confirmation_link IS NULL OR payment_confirmation_link = '';
+CREATE INDEX IF NOT EXISTS idx_reservations_paid_unconfirmed ON reservations(day, time_from)
+    WHERE payed = false AND payment_confirmation_link IS NOT NULL AND payment_confirmation_link <> '';
 """
 
+# Durable reminder queue, one row per pending reminder of an unpaid reservation.
+# Rows go away with their reservation (ON DELETE CASCADE).
+CREATE_REMINDER_JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS reminder_jobs (
+    id SERIAL PRIMARY KEY,
+    order_id VARCHAR NOT NULL REFERENCES reservations(order_id) ON DELETE CASCADE,
+    kind VARCHAR NOT NULL,
+    level INTEGER NOT NULL DEFAULT 0,
+    due_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    CONSTRAINT reminder_jobs_unique UNIQUE (order_id, kind, level)
+);
+CREATE INDEX IF NOT EXISTS idx_reminder_jobs_due_at ON reminder_jobs(due_at);
+"""
+
+# Conversation state of the bot users, shared by all bot processes (PostgresStateStorage)
+CREATE_BOT_STATES_SQL = """
+CREATE TABLE IF NOT EXISTS bot_states (
+    chat_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    state VARCHAR,
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (chat_id, user_id)
+);
+"""
+
+# file_id of the static images the bot sends (tg_bot.assets.AssetCache), uploaded once per content
+CREATE_TELEGRAM_FILES_SQL = """
+CREATE TABLE IF NOT EXISTS telegram_files (
+    content_hash VARCHAR PRIMARY KEY,
+    file_id VARCHAR NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+CREATE_TABLE_SQL += CREATE_REMINDER_JOBS_SQL + CREATE_BOT_STATES_SQL + CREATE_TELEGRAM_FILES_SQL
+
 MIGRATE_TIME_TABLE_SQL = """
 -- 1. First create new columns
 ALTER TABLE reservations 
@@ -67,8 +116,49 @@ ALTER TABLE reservations
 RENAME COLUMN time_to_new TO time_to;
 """
 
-TRUNCATE_TABLE_SQL = "TRUNCATE TABLE reservations RESTART IDENTITY;"
-DROP_TABLE_SQL = "DROP TABLE IF EXISTS reservations;"
+# Let Postgres reject overlapping reservations of the same place.
+# Fails if the table already contains overlapping rows - clean them up first.
+MIGRATE_NO_OVERLAP_SQL = """
+-- 1. GiST needs btree_gist for the equality parts of the constraint
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- 2. Range column kept in sync by Postgres
+ALTER TABLE reservations
+ADD COLUMN IF NOT EXISTS time_range TSTZRANGE
+    GENERATED ALWAYS AS (tstzrange(time_from, time_to, '[)')) STORED;
+
+-- 3. No two reservations of the same type may overlap on one place
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'reservations_no_overlap') THEN
+        ALTER TABLE reservations
+        ADD CONSTRAINT reservations_no_overlap
+            EXCLUDE USING gist (type WITH =, place WITH =, time_range WITH &&);
+    END IF;
+END $$;
+"""
+
+# Indexes matching the Database query methods. CONCURRENTLY keeps the table writable
+# while they are built, so every statement has to run outside a transaction.
+CREATE_INDEXES_CONCURRENTLY_SQL = [
+    # Availability: type + day range (+ place for the SQL-side days probe)
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_type_day_place ON reservations(type, day, place);",
+    # Timeslots, admin listing of one day and keyset pages ordered by (day, time_from, id)
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_day_time_id ON reservations(day, time_from, id);",
+    # Superseded by idx_reservations_day_time_id
+    "DROP INDEX CONCURRENTLY IF EXISTS idx_reservations_day_time_from;",
+    # "My reservations" and per-user unpaid lookups
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_telegram_day_time ON reservations(telegram_id, day, time_from);",
+    # Reminder system: upcoming rows without payment confirmation
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_unpaid_upcoming ON reservations(day, time_from)
+        WHERE payment_confirmation_link IS NULL OR payment_confirmation_link = '';""",
+    # Reminder system: confirmation sent, admin hasn't approved yet
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_paid_unconfirmed ON reservations(day, time_from)
+        WHERE payed = false AND payment_confirmation_link IS NOT NULL AND payment_confirmation_link <> '';""",
+]
+
+TRUNCATE_TABLE_SQL = "TRUNCATE TABLE reminder_jobs, reservations RESTART IDENTITY;"
+DROP_TABLE_SQL = "DROP TABLE IF EXISTS reminder_jobs; DROP TABLE IF EXISTS reservations;"
 
 def get_db_connection() -> connection:
     """Create and return a database connection"""
@@ -126,6 +216,124 @@ def reset_table(conn: Optional[connection] = None) -> bool:
         if should_close_conn and conn:
             conn.close()
 
+def migrate_no_overlap(conn: Optional[connection] = None) -> bool:
+    """Add the time_range column and the no-overlap exclusion constraint"""
+    should_close_conn = conn is None
+    try:
+        if conn is None:
+            conn = get_db_connection()
+
+        cur = conn.cursor()
+        cur.execute(MIGRATE_NO_OVERLAP_SQL)
+        conn.commit()
+        print("Successfully added no-overlap constraint to reservations table")
+        return True
+
+    except Exception as e:
+        print(f"Error adding no-overlap constraint: {e}")
+        if conn:
+            conn.rollback()
+        return False
+
+    finally:
+        if should_close_conn and conn:
+            conn.close()
+
+def create_indexes(conn: Optional[connection] = None) -> bool:
+    """Create the query indexes without locking the reservations table for writes"""
+    should_close_conn = conn is None
+    autocommit = None
+    try:
+        if conn is None:
+            conn = get_db_connection()
+
+        autocommit = conn.autocommit
+        conn.autocommit = True
+        cur = conn.cursor()
+        for statement in CREATE_INDEXES_CONCURRENTLY_SQL:
+            cur.execute(statement)
+        print("Successfully created reservations indexes")
+        return True
+
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+        return False
+
+    finally:
+        if conn and autocommit is not None:
+            conn.autocommit = autocommit
+        if should_close_conn and conn:
+            conn.close()
+
+def create_reminder_jobs(conn: Optional[connection] = None) -> bool:
+    """Create the reminder_jobs queue table, ReminderSystem fills it for existing reservations on start"""
+    should_close_conn = conn is None
+    try:
+        if conn is None:
+            conn = get_db_connection()
+
+        cur = conn.cursor()
+        cur.execute(CREATE_REMINDER_JOBS_SQL)
+        conn.commit()
+        print("Successfully created reminder_jobs table")
+        return True
+
+    except Exception as e:
+        print(f"Error creating reminder_jobs table: {e}")
+        if conn:
+            conn.rollback()
+        return False
+
+    finally:
+        if should_close_conn and conn:
+            conn.close()
+
+def create_bot_states(conn: Optional[connection] = None) -> bool:
+    """Create the bot_states table used by STATE_STORAGE=postgres"""
+    should_close_conn = conn is None
+    try:
+        if conn is None:
+            conn = get_db_connection()
+
+        cur = conn.cursor()
+        cur.execute(CREATE_BOT_STATES_SQL)
+        conn.commit()
+        print("Successfully created bot_states table")
+        return True
+
+    except Exception as e:
+        print(f"Error creating bot_states table: {e}")
+        if conn:
+            conn.rollback()
+        return False
+
+    finally:
+        if should_close_conn and conn:
+            conn.close()
+
+def create_telegram_files(conn: Optional[connection] = None) -> bool:
+    """Create the telegram_files table of the uploaded images' file_ids"""
+    should_close_conn = conn is None
+    try:
+        if conn is None:
+            conn = get_db_connection()
+
+        cur = conn.cursor()
+        cur.execute(CREATE_TELEGRAM_FILES_SQL)
+        conn.commit()
+        print("Successfully created telegram_files table")
+        return True
+
+    except Exception as e:
+        print(f"Error creating telegram_files table: {e}")
+        if conn:
+            conn.rollback()
+        return False
+
+    finally:
+        if should_close_conn and conn:
+            conn.close()
+
 if __name__ == "__main__":
     # Example usage
     try:
@@ -133,6 +341,11 @@ if __name__ == "__main__":
         
         # Choose one of these operations:
         # clear_table(conn)  # Just delete all records
+        # migrate_no_overlap(conn)  # Add DB-enforced no-overlap constraint
+        # create_indexes(conn)  # Add query indexes online
+        # create_reminder_jobs(conn)  # Add the durable reminder queue
+        # create_bot_states(conn)  # Add the shared bot state storage
+        # create_telegram_files(conn)  # Add the file_id cache of the seat images
         reset_table(conn)  # Drop and recreate table
         
     except Exception as e:
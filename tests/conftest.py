@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Import the project's packages from the root, like bot_run.py and admin/app.py
+sys.path.insert(0, str(Path(__file__).parent.parent))
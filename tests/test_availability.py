@@ -0,0 +1,141 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from db.availability import DayOccupancy, first_bookable_slot, period_to_slots
+
+STRIDE = 30
+PLACES = (1, 2)
+DAY = datetime(2024, 5, 6)
+DAY_START = DAY.replace(hour=9)
+DAY_END = DAY.replace(hour=21)
+PRAGUE = pytz.timezone('Europe/Prague')
+
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return DAY.replace(hour=hour, minute=minute)
+
+
+def slot_of(hour: int, minute: int = 0) -> int:
+    return int((at(hour, minute) - DAY_START).total_seconds() // 60) // STRIDE
+
+
+def occupancy(*rows) -> DayOccupancy:
+    return DayOccupancy(DAY_START, DAY_END, STRIDE).add_all(rows)
+
+
+def scan_free_slots(rows, all_places, period_hours, first_slot=0):
+    """Reference: check every candidate against every reservation"""
+    result = {}
+    start = DAY_START + timedelta(minutes=first_slot * STRIDE)
+    slot = first_slot
+    while start + timedelta(hours=period_hours) <= DAY_END:
+        end = start + timedelta(hours=period_hours)
+        free = [
+            place for place in all_places
+            if not any(row_place == place and time_from < end and time_to > start for time_from, time_to, row_place in rows)
+        ]
+        if free:
+            result[slot] = free
+        start += timedelta(minutes=STRIDE)
+        slot += 1
+    return result
+
+
+def test_period_to_slots_rounds_up():
+    assert period_to_slots(1, STRIDE) == 2
+    assert period_to_slots(1.25, STRIDE) == 3
+    assert period_to_slots(0.1, STRIDE) == 1
+
+
+def test_empty_day_offers_every_start_that_ends_by_workday_end():
+    slots = occupancy().free_slots(PLACES, period_to_slots(1, STRIDE))
+    assert min(slots) == 0
+    assert max(slots) == slot_of(20)  # 20:00-21:00 ends exactly at workday_end
+    assert all(places == list(PLACES) for places in slots.values())
+
+
+def test_period_not_a_multiple_of_stride_ends_by_workday_end():
+    # 75 minutes take 3 slots, 19:30 is the last start that fits
+    slots = occupancy().free_slots(PLACES, period_to_slots(1.25, STRIDE))
+    assert max(slots) == slot_of(19, 30)
+
+
+def test_full_day_period_fits_only_at_workday_start():
+    assert occupancy().free_slots(PLACES, period_to_slots(12, STRIDE)) == {0: list(PLACES)}
+
+
+def test_reservation_blocks_overlapping_starts_only():
+    slots = occupancy((at(10), at(11), 1)).free_slots(PLACES, period_to_slots(1, STRIDE))
+    assert slots[slot_of(9)] == [1, 2]
+    assert slots[slot_of(9, 30)] == [2]
+    assert slots[slot_of(10, 30)] == [2]
+    assert slots[slot_of(11)] == [1, 2]  # Starts when the booking ends
+
+
+def test_reservation_off_the_grid_blocks_the_slots_it_touches():
+    # 10:00-11:15 reaches into the 11:00 slot
+    slots = occupancy((at(10), at(11, 15), 1)).free_slots(PLACES, period_to_slots(0.5, STRIDE))
+    assert slots[slot_of(11)] == [2]
+    assert slots[slot_of(11, 30)] == [1, 2]
+
+
+def test_reservation_beyond_the_working_day_is_clipped():
+    slots = occupancy((at(7), at(9, 30), 1), (at(20, 30), at(23), 2)).free_slots(PLACES, period_to_slots(0.5, STRIDE))
+    assert slots[slot_of(9)] == [2]
+    assert slots[slot_of(9, 30)] == [1, 2]
+    assert slots[slot_of(20, 30)] == [1]
+
+
+def test_aware_rows_are_compared_as_utc():
+    slots = occupancy((pytz.utc.localize(at(10)), pytz.utc.localize(at(11)), 1)).free_slots(PLACES, period_to_slots(1, STRIDE))
+    assert slots[slot_of(10)] == [2]
+
+
+def test_fully_booked_day_has_no_slots():
+    assert occupancy((at(9), at(21), 1), (at(9), at(21), 2)).free_slots(PLACES, period_to_slots(1, STRIDE)) == {}
+
+
+@pytest.mark.parametrize('period_hours', [0.5, 1, 1.25, 3, 12])
+def test_bitmap_matches_scan(period_hours):
+    rng = random.Random(period_hours)
+    for _ in range(50):
+        # On the stride grid, the bitmap rounds other rows out to whole slots where the scan is exact
+        rows = []
+        for _ in range(rng.randint(0, 6)):
+            start = at(8) + timedelta(minutes=STRIDE * rng.randint(0, 26))
+            rows.append((start, start + timedelta(minutes=STRIDE * rng.randint(1, 6)), rng.choice(PLACES)))
+        first_slot = rng.randint(0, 10)
+        expected = scan_free_slots(rows, PLACES, period_hours, first_slot)
+        assert occupancy(*rows).free_slots(PLACES, period_to_slots(period_hours, STRIDE), first_slot) == expected
+
+
+def test_first_bookable_slot_today_cuts_past_slots():
+    # 10:10 local: 9:00, 9:30 and 10:00 have started, 10:30 is the first offered
+    now = PRAGUE.localize(at(10, 10))
+    first_slot = first_bookable_slot(DAY_START, STRIDE, now, PRAGUE)
+    assert first_slot == slot_of(10, 30)
+
+    slots = occupancy().free_slots(PLACES, period_to_slots(1, STRIDE), first_slot)
+    assert min(slots) == slot_of(10, 30)
+    assert max(slots) == slot_of(20)
+
+
+def test_first_bookable_slot_is_strictly_after_now():
+    assert first_bookable_slot(DAY_START, STRIDE, PRAGUE.localize(at(10)), PRAGUE) == slot_of(10, 30)
+
+
+def test_first_bookable_slot_late_in_the_day_leaves_nothing():
+    first_slot = first_bookable_slot(DAY_START, STRIDE, PRAGUE.localize(at(20, 5)), PRAGUE)
+    assert occupancy().free_slots(PLACES, period_to_slots(1, STRIDE), first_slot) == {}
+
+
+@pytest.mark.parametrize('now', [
+    None,
+    PRAGUE.localize(at(8)),                       # Before the working day
+    PRAGUE.localize(at(10) - timedelta(days=1)),  # Another day
+])
+def test_first_bookable_slot_offers_the_whole_day(now):
+    assert first_bookable_slot(DAY_START, STRIDE, now, PRAGUE) == 0
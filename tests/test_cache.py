@@ -0,0 +1,101 @@
+from datetime import date, datetime
+
+from classes.metrics import Registry, register_cache_metrics
+from db.cache import AvailabilityCache, TTLCache
+
+DAY = date(2024, 5, 6)
+OTHER_DAY = date(2024, 6, 3)
+
+
+def test_ttl_cache_counts_hits_misses_and_evictions():
+    cache = TTLCache(maxsize=2, ttl_seconds=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1    # 'b' is now the least recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.stats() == {
+        'size': 2, 'maxsize': 2, 'ttl_seconds': 60, 'hits': 1, 'misses': 1, 'evictions': 1,
+    }
+
+
+def test_ttl_cache_entries_expire():
+    cache = TTLCache(ttl_seconds=0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_invalidate_day_drops_day_month_and_horizon_entries():
+    cache = AvailabilityCache()
+    keys = {
+        'day': ('hall', 1, DAY),
+        'month': ('hall', 1, (2024, 5)),
+        'horizon': ('hall', 1, None),
+        'other day': ('hall', 1, OTHER_DAY),
+        'other month': ('hall', 1, (2024, 6)),
+    }
+    for key in keys.values():
+        cache.set(key, 'cached')
+
+    cache.invalidate_day(datetime(2024, 5, 6, 10))  # Datetimes count as their day
+
+    assert [name for name, key in keys.items() if cache.get(key)] == ['other day', 'other month']
+    assert cache.stats()['invalidations'] == 3
+
+
+def test_result_read_before_an_invalidation_is_not_cached():
+    cache = AvailabilityCache()
+    since = cache.generation()
+    cache.invalidate_day(DAY)  # A booking committed while the query ran
+
+    for key in (('hall', 1, DAY), ('hall', 1, (2024, 5)), ('hall', 1, None)):
+        cache.set(key, 'stale', since=since)
+        assert cache.get(key) is None
+    assert cache.stats()['stale_sets'] == 3
+
+
+def test_invalidation_of_another_scope_does_not_block_set():
+    cache = AvailabilityCache()
+    since = cache.generation()
+    cache.invalidate_day(OTHER_DAY)
+
+    cache.set(('hall', 1, DAY), 'fresh', since=since)
+    assert cache.get(('hall', 1, DAY)) == 'fresh'
+    # The horizon covers every day, its entries are stale whichever day was written
+    cache.set(('hall', 1, None), 'stale', since=since)
+    assert cache.get(('hall', 1, None)) is None
+
+
+def test_result_read_after_the_invalidation_is_cached():
+    cache = AvailabilityCache()
+    cache.invalidate_day(DAY)
+    since = cache.generation()
+    cache.set(('hall', 1, DAY), 'fresh', since=since)
+    assert cache.get(('hall', 1, DAY)) == 'fresh'
+
+
+def test_clear_makes_every_earlier_read_stale():
+    cache = AvailabilityCache()
+    since = cache.generation()
+    cache.clear()
+    cache.set(('hall', 1, OTHER_DAY), 'stale', since=since)
+    assert cache.get(('hall', 1, OTHER_DAY)) is None
+    cache.set(('hall', 1, OTHER_DAY), 'unconditional')
+    assert cache.get(('hall', 1, OTHER_DAY)) == 'unconditional'
+
+
+def test_cache_stats_are_exported_as_gauges():
+    registry = Registry('bot')
+    availability, plain = AvailabilityCache(maxsize=8), TTLCache(maxsize=4)
+    register_cache_metrics(registry, {'availability': availability, 'calendar': plain})
+    availability.get(('hall', 1, DAY))
+    plain.set('a', 1)
+    plain.get('a')
+
+    rendered = registry.render()
+    assert 'bot_cache_misses{cache="availability"} 1' in rendered
+    assert 'bot_cache_hits{cache="calendar"} 1' in rendered
+    assert 'bot_cache_maxsize{cache="calendar"} 4' in rendered
+    assert 'bot_cache_stale_sets{cache="availability"} 0' in rendered
+    assert 'bot_cache_stale_sets{cache="calendar"}' not in rendered
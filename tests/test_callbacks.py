@@ -0,0 +1,69 @@
+from datetime import time
+
+import pytest
+
+from tg_bot import callbacks, config
+
+
+def test_time_slot_round_trip():
+    data = callbacks.time_slot('09:30', [1, 2])
+    assert data.startswith('~1t')
+    assert callbacks.decode(data) == callbacks.Callback(callbacks.TIME_SLOT, slot=time(9, 30), places=(1, 2))
+
+
+def test_time_slot_widest_values():
+    places = range(20)  # All of 0..19 is the widest mask PLACES_WIDTH holds
+    callback = callbacks.decode(callbacks.time_slot('23:55', places))
+    assert callback.slot == time(23, 55)
+    assert callback.places == tuple(places)
+
+
+def test_time_slot_rejects_places_beyond_the_width():
+    with pytest.raises(ValueError):
+        callbacks.time_slot('09:00', range(21))
+
+
+def test_time_slot_rejects_off_grid_start():
+    with pytest.raises(ValueError):
+        callbacks.time_slot('09:07', [1])
+
+
+def test_configured_places_fit_the_codec():
+    for type_places in config.places.values():
+        for place in type_places:
+            assert callbacks.decode(callbacks.seat(place)).places == (place,)
+        callbacks.time_slot('09:00', type_places)
+
+
+@pytest.mark.parametrize('action', [
+    callbacks.VIEW, callbacks.PAY, callbacks.CHANGE_PAY, callbacks.DELETE,
+    callbacks.CONFIRM_PAYMENT, callbacks.REJECT_PAYMENT,
+])
+@pytest.mark.parametrize('reservation_id', [0, 7, 123456, 2**31 - 1])
+def test_reservation_round_trip(action, reservation_id):
+    data = callbacks.reservation(action, reservation_id)
+    assert len(data.encode()) <= 64
+    assert callbacks.decode(data) == callbacks.Callback(action, handle=reservation_id)
+    assert callbacks.action(data) == action
+
+
+@pytest.mark.parametrize('data, action', [
+    ('view_reservation_2024-05-01_1h_10-00_p1_42', callbacks.VIEW),
+    ('change-pay_2024-05-01_1h_10-00_p1_42', callbacks.CHANGE_PAY),
+    ('pay_2024-05-01_1h_10-00_p1_42', callbacks.PAY),
+    ('delete_2024-05-01_1h_10-00_p1_42', callbacks.DELETE),
+    ('confirm_payment_2024-05-01_1h_10-00_p1_42', callbacks.CONFIRM_PAYMENT),
+    ('reject_payment_2024-05-01_1h_10-00_p1_42', callbacks.REJECT_PAYMENT),
+])
+def test_legacy_buttons_decode_to_order_id(data, action):
+    """Buttons sent before the codec are still in users' chats and admin messages"""
+    assert callbacks.decode(data) == callbacks.Callback(action, handle='2024-05-01_1h_10-00_p1_42')
+
+
+@pytest.mark.parametrize('data', [
+    None, '', 'pay_now', 'pay_later', 'cb_back', 'cb_new_reservation', 'cbcal_0_s_d_2024_5_1',
+    'pay_', '~', '~1', '~2v1', '~1x1', '~1vzz!', '~1t', '~1s',
+])
+def test_plain_and_malformed_data_decode_to_none(data):
+    assert callbacks.decode(data) is None
+    assert callbacks.action(data) is None
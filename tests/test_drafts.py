@@ -0,0 +1,169 @@
+import threading
+from datetime import datetime
+
+import pytest
+from telebot import TeleBot
+from telebot.storage import StateMemoryStorage
+
+from classes.classes import Reservation
+from tg_bot import drafts
+from tg_bot.drafts import DraftStore, StateDraftStore
+
+
+class Clock:
+    """Stands in for the time module of tg_bot.drafts"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(drafts, 'time', clock)
+    return clock
+
+
+def booked(draft: Reservation) -> Reservation:
+    draft.type = 'hall'
+    draft.place = 3
+    draft.period = 1.5
+    draft.day = datetime(2024, 5, 6)
+    draft.time_from = datetime(2024, 5, 6, 10, 30)
+    draft.time_to = datetime(2024, 5, 6, 12)
+    draft.sum = 450.0
+    draft.available_places = [1, 3]
+    return draft
+
+
+def test_drafts_of_two_users_are_independent(clock):
+    store = DraftStore()
+    first = store.new(1, 'First')
+    second = store.new(2, 'Second')
+    first.place = 5
+
+    assert store.get(1).place == 5
+    assert store.get(2) is second and second.place is None
+    store.discard(1)
+    assert store.get(1) is None
+    assert store.get(2) is second
+
+
+def test_concurrent_users_never_see_each_others_draft():
+    store = DraftStore(maxsize=1000)
+    mixups = []
+
+    def book(user_id: int):
+        for _ in range(200):
+            store.new(user_id, str(user_id)).place = user_id
+            draft = store.get(user_id)
+            if draft is None or draft.name != str(user_id) or draft.place != user_id:
+                mixups.append(user_id)
+
+    threads = [threading.Thread(target=book, args=(user_id,)) for user_id in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert mixups == []
+    assert len(store) == 16
+
+
+def test_new_draft_replaces_the_previous_one(clock):
+    store = DraftStore()
+    store.new(1, 'First').place = 5
+    assert store.new(1, 'First').place is None
+    assert len(store) == 1
+
+
+def test_draft_expires_after_ttl(clock):
+    store = DraftStore(ttl_seconds=60)
+    store.new(1, 'First')
+    clock.now += 60
+    assert store.get(1) is None
+    assert len(store) == 0
+
+
+@pytest.mark.parametrize('touch', ['get', 'save'])
+def test_get_and_save_refresh_the_ttl(clock, touch):
+    store = DraftStore(ttl_seconds=60)
+    draft = store.new(1, 'First')
+    clock.now += 50
+    store.get(1) if touch == 'get' else store.save(1, draft)
+    clock.now += 50
+    assert store.get(1) is draft
+
+
+def test_save_does_not_bring_back_a_discarded_draft(clock):
+    store = DraftStore()
+    draft = store.new(1, 'First')
+    store.discard(1)
+    store.save(1, draft)
+    assert store.get(1) is None
+
+
+def test_maxsize_evicts_the_least_recently_used_draft(clock):
+    store = DraftStore(maxsize=2)
+    store.new(1, 'First')
+    store.new(2, 'Second')
+    store.get(1)  # 2 is now the least recently used
+    store.new(3, 'Third')
+
+    assert len(store) == 2
+    assert store.get(2) is None
+    assert store.get(1) is not None and store.get(3) is not None
+
+
+def test_reservation_state_round_trip():
+    draft = booked(Reservation(telegramId=1, name='First'))
+    restored = Reservation.from_state(draft.to_state())
+    assert {slot: getattr(restored, slot) for slot in Reservation.__slots__} == \
+        {slot: getattr(draft, slot) for slot in Reservation.__slots__}
+
+
+@pytest.fixture
+def state_bot() -> TeleBot:
+    bot = TeleBot('1:test', state_storage=StateMemoryStorage())
+    for user_id in (1, 2):
+        bot.set_state(user_id, 'booking')
+    return bot
+
+
+def test_state_draft_store_round_trips_the_draft(clock, state_bot):
+    store = StateDraftStore(state_bot)
+    draft = booked(store.new(1, 'First'))
+    store.save(1, draft)
+
+    restored = store.get(1)
+    assert restored is not draft  # A copy, as another process would read it
+    assert restored.to_state() == draft.to_state()
+    assert restored.time_from == datetime(2024, 5, 6, 10, 30)
+
+
+def test_state_draft_store_keeps_users_apart(clock, state_bot):
+    store = StateDraftStore(state_bot)
+    store.save(1, booked(store.new(1, 'First')))
+    store.new(2, 'Second')
+
+    assert store.get(1).place == 3
+    assert store.get(2).place is None
+    store.discard(2)
+    assert store.get(2) is None
+    assert store.get(1).name == 'First'
+
+
+def test_state_draft_store_expires_unsaved_drafts(clock, state_bot):
+    store = StateDraftStore(state_bot, ttl_seconds=60)
+    draft = store.new(1, 'First')
+    clock.now += 50
+    store.save(1, draft)
+    clock.now += 50
+    assert store.get(1) is not None
+    clock.now += 10
+    assert store.get(1) is None
@@ -0,0 +1,24 @@
+import json
+from pathlib import Path
+
+from benchmarks.import_time import FORBIDDEN, measure_once
+
+BASELINE = Path(__file__).parent.parent / 'benchmarks' / 'baselines' / 'import_time.json'
+
+
+def test_bot_startup_imports_no_heavy_modules():
+    _, probe, _, _ = measure_once('bot_run')
+    assert probe['forbidden'] == []
+
+
+def test_probe_reports_forbidden_modules():
+    _, probe, _, _ = measure_once('telegram_bot_calendar')
+    assert 'telegram_bot_calendar' in probe['forbidden']
+
+
+def test_baseline_is_committed():
+    baseline = json.loads(BASELINE.read_text())
+    assert baseline['meta']['module'] == 'bot_run'
+    assert baseline['forbidden'] == []
+    assert baseline['import_ms'] > 0 and baseline['rss_mb'] > 0
+    assert set(FORBIDDEN).isdisjoint(baseline['slowest'])
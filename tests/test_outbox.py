@@ -0,0 +1,160 @@
+import io
+import threading
+import time
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+from classes.metrics import Registry
+from tg_bot.metrics import register_outbox_metrics
+from tg_bot.outbox import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, SendQueue, TokenBucket
+
+
+class StubBot:
+    """Records send_message / send_photo calls, `errors` are raised by the first calls"""
+
+    def __init__(self, errors=()):
+        self.calls = []
+        self.errors = list(errors)
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self._call(chat_id, text)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        return self._call(chat_id, photo.read())
+
+    def _call(self, chat_id, content):
+        with self._lock:
+            self.calls.append((chat_id, content))
+            if self.errors:
+                raise self.errors.pop(0)
+        return {'chat_id': chat_id, 'content': content}
+
+
+def flood_limit(retry_after: float) -> ApiTelegramException:
+    return ApiTelegramException('sendPhoto', None, {
+        'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': retry_after},
+    })
+
+
+@pytest.fixture
+def queues():
+    started = []
+
+    def make(bot: StubBot, start: bool = True, **kwargs) -> SendQueue:
+        queue = SendQueue(bot, **kwargs)
+        if start:
+            queue.start()
+        started.append(queue)
+        return queue
+
+    yield make
+    for queue in started:
+        queue.stop(0)
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, capacity=2)
+    now = bucket.updated
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.wait_time(now + 0.5) == 0
+    assert bucket.is_full(now + 10)
+
+
+def test_token_bucket_pause_delays_the_next_token():
+    bucket = TokenBucket(rate=1, capacity=3)
+    now = bucket.updated
+    bucket.pause(5, now)
+    assert bucket.wait_time(now) == pytest.approx(5)
+
+
+def test_chat_without_tokens_is_parked_without_blocking_others(queues):
+    bot = StubBot()
+    queue = queues(bot, start=False, workers=1, chat_rate=1, chat_burst=1)
+    busy = [queue.send_message(1, f'busy {i}') for i in range(3)]
+    other = queue.send_message(2, 'other')
+    queue.start()
+
+    other.result(timeout=0.5)  # Long before chat 1 gets its next token
+    assert bot.calls[:2] == [(1, 'busy 0'), (2, 'other')]
+    assert not busy[1].done()
+    assert busy[2].result(timeout=5)['content'] == 'busy 2'
+
+
+def test_interactive_sends_go_before_background(queues):
+    bot = StubBot()
+    queue = queues(bot, start=False, workers=1)
+    background = [queue.send_message(chat_id, 'reminder', priority=PRIORITY_BACKGROUND) for chat_id in (1, 2, 3)]
+    interactive = queue.send_message(4, 'reply', priority=PRIORITY_INTERACTIVE)
+    queue.start()
+
+    for future in background + [interactive]:
+        future.result(timeout=5)
+    assert bot.calls[0] == (4, 'reply')
+    assert [chat_id for chat_id, _ in bot.calls[1:]] == [1, 2, 3]
+
+
+def test_flood_limit_is_retried_with_the_file_rewound(queues):
+    bot = StubBot(errors=[flood_limit(0.1)])
+    queue = queues(bot, workers=1)
+
+    started = time.monotonic()
+    result = queue.send_photo(1, io.BytesIO(b'image')).result(timeout=5)
+    assert time.monotonic() - started >= 0.1
+    assert result['content'] == b'image'  # Read from the start again
+    assert bot.calls == [(1, b'image'), (1, b'image')]
+    assert queue.stats()['retried'] == 1
+    assert queue.stats()['sent'] == 1
+
+
+def test_other_errors_fail_the_future(queues):
+    error = ApiTelegramException('sendMessage', None, {'error_code': 403, 'description': 'Forbidden'})
+    queue = queues(StubBot(errors=[error]), workers=1)
+    future = queue.send_message(1, 'text')
+    assert future.exception(timeout=5) is error
+    assert queue.stats()['failed'] == 1
+
+
+def test_cancelled_send_is_dropped(queues):
+    bot = StubBot()
+    queue = queues(bot, start=False, workers=1)
+    cancelled = queue.send_message(1, 'cancelled')
+    kept = queue.send_message(2, 'kept')
+    assert cancelled.cancel()
+    queue.start()
+
+    kept.result(timeout=5)
+    assert bot.calls == [(2, 'kept')]
+
+
+def test_stop_without_timeout_fails_queued_sends(queues):
+    bot = StubBot()
+    queue = queues(bot, start=False)
+    futures = [queue.send_message(chat_id, 'text') for chat_id in (1, 2)]
+    queue.stop(0)
+
+    for future in futures:
+        assert isinstance(future.exception(timeout=1), RuntimeError)
+    assert bot.calls == []
+    assert isinstance(queue.send_message(3, 'late').exception(timeout=1), RuntimeError)
+
+
+def test_outbox_metrics_are_exported(queues):
+    queue = queues(StubBot(), start=False)
+    registry = Registry('bot')
+    register_outbox_metrics(registry, queue)
+    queue.send_message(1, 'queued', priority=PRIORITY_BACKGROUND)
+
+    rendered = registry.render()
+    assert 'bot_outbox_depth{priority="background"} 1' in rendered
+    assert 'bot_outbox_depth{priority="interactive"} 0' in rendered
+    assert 'bot_outbox_latency_seconds{' not in rendered  # Nothing sent yet
+
+    queue.start()
+    queue.stop(None)
+    rendered = registry.render()
+    assert 'bot_outbox_sent 1' in rendered
+    assert 'bot_outbox_latency_seconds{priority="background",quantile="0.95"}' in rendered
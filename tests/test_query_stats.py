@@ -0,0 +1,104 @@
+import logging
+
+import pytest
+from sqlalchemy import column, create_engine, select, table, text
+
+from db.query_stats import QueryStats, fingerprint, parameters_shape, query_scope
+
+
+@pytest.mark.parametrize('statement, expected', [
+    # String literals, '' is an escaped quote inside the literal
+    ("SELECT * FROM t WHERE name = 'Anna'", "SELECT * FROM t WHERE name = ?"),
+    ("SELECT * FROM t WHERE name = 'it''s' AND note = ''", "SELECT * FROM t WHERE name = ? AND note = ?"),
+    ("SELECT 'a''b''' || 'c'", "SELECT ? || ?"),
+    # Numbers, not digits that are part of identifiers
+    ("SELECT * FROM t WHERE a = 5 AND b = -3.5 AND c = 1e5", "SELECT * FROM t WHERE a = ? AND b = ? AND c = ?"),
+    ("SELECT idx_1, t1.col2 FROM t1 LIMIT 10", "SELECT idx_1, t1.col2 FROM t1 LIMIT ?"),
+    ('SELECT "col1" FROM "table_2"', 'SELECT "col1" FROM "table_2"'),
+    # Binds of every paramstyle the drivers use
+    ("SELECT * FROM t WHERE a = %(a_1)s AND b = %(day)s", "SELECT * FROM t WHERE a = ? AND b = ?"),
+    ("SELECT * FROM t WHERE a = %s AND b = %s", "SELECT * FROM t WHERE a = ? AND b = ?"),
+    ("SELECT * FROM t WHERE a = $1 AND b = $12", "SELECT * FROM t WHERE a = ? AND b = ?"),
+    # IN-lists of any length
+    ("SELECT * FROM t WHERE id IN (%(id_1_1)s)", "SELECT * FROM t WHERE id IN (?+)"),
+    ("SELECT * FROM t WHERE id IN (%(id_1_1)s, %(id_1_2)s, %(id_1_3)s)", "SELECT * FROM t WHERE id IN (?+)"),
+    ("SELECT * FROM t WHERE id not in (1,2)", "SELECT * FROM t WHERE id not in (?+)"),
+    # VALUES with one or many rows
+    ("INSERT INTO t (a, b) VALUES (%(a)s, %(b)s)", "INSERT INTO t (a, b) VALUES (?+)+"),
+    ("INSERT INTO t (a, b) VALUES (%(a__0)s, %(b__0)s), (%(a__1)s, %(b__1)s)", "INSERT INTO t (a, b) VALUES (?+)+"),
+    # Function arguments are left alone, whitespace is normalised
+    ("SELECT coalesce(a, 0),\n       lower(%(x)s)\n  FROM t", "SELECT coalesce(a, ?), lower(?) FROM t"),
+])
+def test_fingerprint(statement, expected):
+    assert fingerprint(statement) == expected
+
+
+@pytest.mark.parametrize('parameters, executemany, expected', [
+    ({'name': 'Anna', 'ids': [1, 2, 3], 'paid': None}, False, '{name: str[4], ids: list[3], paid: None}'),
+    (('secret', 42), False, '(str[6], int)'),
+    ([{'a': 1}, {'a': 2}], True, '2 x {a: int}'),
+])
+def test_parameters_shape_hides_values(parameters, executemany, expected):
+    assert parameters_shape(parameters, executemany) == expected
+
+
+@pytest.fixture
+def stats() -> QueryStats:
+    return QueryStats(slow_query_ms=10000)
+
+
+@pytest.fixture
+def engine(stats):
+    engine = create_engine('sqlite://')
+    stats.install(engine)
+    return engine
+
+
+def test_in_lists_of_different_length_share_a_fingerprint(engine, stats):
+    t = table('t', column('id'))
+    with engine.connect() as connection:
+        connection.execute(text('CREATE TABLE t (id INTEGER)'))
+        for ids in ([1], [1, 2, 3], list(range(50))):
+            connection.execute(select(t.c.id).where(t.c.id.in_(ids)))
+
+    counts = {sql: count for sql, count, _, _ in stats.top()}
+    assert counts['SELECT t.id FROM t WHERE t.id IN (?+)'] == 3
+
+
+def test_nested_scopes_count_towards_the_outer_one(engine):
+    with engine.connect() as connection, query_scope('outer', max_queries=100) as outer:
+        connection.execute(text('SELECT 1'))
+        with query_scope('inner') as inner:
+            assert inner is outer
+            connection.execute(text('SELECT 2'))
+            connection.execute(text('SELECT 3'))
+
+    assert outer.name == 'outer'
+    assert outer.count == 3
+    assert outer.fingerprints == {'SELECT ?': 3}
+
+
+def test_queries_outside_a_scope_are_not_counted(engine):
+    with query_scope('update') as scope:
+        pass
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    assert scope.count == 0
+
+
+def test_report_warns_above_max_queries(engine, caplog):
+    caplog.set_level(logging.WARNING, logger='db.query_stats')
+    with engine.connect() as connection:
+        with query_scope('callback_query:pay', max_queries=3):
+            for i in range(3):
+                connection.execute(text(f'SELECT {i}'))
+        assert caplog.records == []
+
+        with query_scope('callback_query:pay', max_queries=3):
+            for i in range(4):
+                connection.execute(text(f'SELECT {i}'))
+
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert message.startswith('callback_query:pay issued 4 queries')
+    assert '4 x SELECT ?' in message  # The repeated statement is named
@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from db.connection import ClaimedReminderJobs, finish_claim_statements
+from tg_bot.reminder import ReminderSystem
+
+NOW = datetime(2024, 5, 6, 12)
+
+
+def reminders(timeout: float = 0.05) -> ReminderSystem:
+    system = ReminderSystem(SimpleNamespace(reservations_db=None))
+    system.send_timeout = timedelta(seconds=timeout)
+    return system
+
+
+def resolved(result=None, error=None) -> Future:
+    future = Future()
+    future.set_running_or_notify_cancel()
+    if error:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+def test_only_delivered_sends_count_as_sent():
+    queued = Future()
+    sends = {
+        'sent': resolved('message'),
+        'failed': resolved(error=RuntimeError('Forbidden: bot was blocked by the user')),
+        'not queued': None,
+        'queued': queued,
+    }
+    assert reminders().unsent(sends) == ['failed', 'not queued', 'queued']
+    assert queued.cancelled()  # Won't go out after the job was postponed
+
+
+def test_send_in_progress_is_waited_for():
+    running = Future()
+    running.set_running_or_notify_cancel()  # Can't be cancelled any more
+    system = reminders(timeout=0)
+
+    threading.Timer(0.05, running.set_result, ['message']).start()
+    assert system.unsent({'job': running}) == []
+
+
+def test_claim_deletes_handled_jobs_and_moves_postponed_ones():
+    jobs = [SimpleNamespace(id=i) for i in (1, 2, 3)]
+    claimed = ClaimedReminderJobs([(job, None) for job in jobs])
+    claimed.postpone(jobs[1])
+
+    delete, update = finish_claim_statements(claimed, now=NOW, retry_in=timedelta(minutes=5))
+    assert delete.compile().params['id_1'] == [1, 3]
+    assert update.compile().params['id_1'] == [2]
+
+
+def test_claim_without_jobs_runs_nothing():
+    assert finish_claim_statements(ClaimedReminderJobs([]), now=NOW, retry_in=timedelta(minutes=5)) == []
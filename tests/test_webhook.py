@@ -0,0 +1,137 @@
+import http.client
+import json
+import random
+import threading
+import time
+
+import pytest
+
+from tg_bot.webhook import MAX_BODY_BYTES, SECRET_HEADER, WebhookServer
+
+SECRET = 'test-secret'
+
+
+class StubBot:
+    """Records the updates WebhookServer hands to process_new_updates"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.updates = []
+        self.started = threading.Event()  # Set when the first update is being handled
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def process_new_updates(self, updates):
+        self.started.set()
+        self.release.wait()
+        time.sleep(random.uniform(0, self.delay))
+        with self._lock:
+            self.updates.extend(updates)
+
+
+def message_update(update_id: int, user_id: int) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'User'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': str(update_id),
+            'from': user, 'chat': {**user, 'type': 'private'},
+        },
+    }
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def serve(bot: StubBot, **kwargs) -> WebhookServer:
+        server = WebhookServer(bot, SECRET, host='127.0.0.1', port=0, **kwargs)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield serve
+    for server in servers:
+        server.stop()
+
+
+def post(server: WebhookServer, body, secret=SECRET, headers=None) -> http.client.HTTPResponse:
+    connection = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+    body = body if isinstance(body, bytes) else json.dumps(body).encode()
+    headers = {'Content-Type': 'application/json', **(headers or {})}
+    if secret is not None:
+        headers[SECRET_HEADER] = secret
+    connection.request('POST', '/', body=body, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize('secret', [None, '', 'wrong-secret'])
+def test_wrong_or_missing_secret_is_forbidden(serve, secret):
+    bot = StubBot()
+    server = serve(bot)
+    assert post(server, message_update(1, 10), secret=secret).status == 403
+    assert server.stats()['received'] == 0
+
+
+def test_oversized_body_is_refused_unread(serve):
+    server = serve(StubBot())
+    connection = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+    connection.putrequest('POST', '/')
+    connection.putheader(SECRET_HEADER, SECRET)
+    connection.putheader('Content-Length', str(MAX_BODY_BYTES + 1))
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == 413
+    assert response.getheader('Connection') == 'close'
+    connection.close()
+
+
+@pytest.mark.parametrize('body', [b'not json', b'[1, 2]', b'"update"', b'{"message": {}}'])
+def test_body_that_is_not_an_update_is_a_bad_request(serve, body):
+    server = serve(StubBot())
+    assert post(server, body).status == 400
+
+
+def test_updates_of_one_user_are_handled_in_order(serve):
+    bot = StubBot(delay=0.005)
+    server = serve(bot, workers=4)
+    sent = {10: [], 11: [], 12: []}
+    for update_id in range(1, 61):
+        user = random.choice(list(sent))
+        assert post(server, message_update(update_id, user)).status == 200
+        sent[user].append(update_id)
+
+    wait_for(lambda: len(bot.updates) == 60)
+    for user, update_ids in sent.items():
+        assert [update.update_id for update in bot.updates if update.message.from_user.id == user] == update_ids
+    assert server.stats()['processed'] == 60
+
+
+def test_full_worker_queue_answers_503(serve):
+    bot = StubBot()
+    bot.release.clear()
+    server = serve(bot, workers=1, queue_size=1, enqueue_timeout=0.05)
+
+    assert post(server, message_update(1, 10)).status == 200
+    assert bot.started.wait(5)  # The worker is stuck on update 1
+    assert post(server, message_update(2, 10)).status == 200  # Fills the queue
+
+    response = post(server, message_update(3, 10))
+    assert response.status == 503
+    assert response.getheader('Retry-After') == '1'
+    assert server.stats()['rejected'] == 1
+
+    bot.release.set()
+    wait_for(lambda: len(bot.updates) == 2)
+    assert [update.update_id for update in bot.updates] == [1, 2]
@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from telebot.apihelper import ApiTelegramException
+
+from db.connection import Database
+
+
+def is_rejected_file_id(error: ApiTelegramException) -> bool:
+    """Telegram doesn't know (or no longer accepts) the file_id we sent"""
+    return error.error_code == 400 and 'file' in (error.description or '').lower()
+
+
+class AssetCache:
+    """
+    Static images sent by file_id instead of being uploaded every time.
+
+    The first send of an image uploads it and stores the file_id Telegram
+    returns in the telegram_files table, keyed by the sha256 of the content,
+    so a changed image is uploaded again and restarts or other bot processes
+    reuse the id. A file_id Telegram rejects is dropped and the image is
+    uploaded again.
+    """
+
+    def __init__(self, db: Database, send_photo: Callable):
+        """
+        Args:
+            db: Database holding the telegram_files table
+            send_photo: bot.send_photo-like callable returning the sent Message
+        """
+        self.db = db
+        self.send = send_photo
+        self.logger = logging.getLogger(__name__)
+        self._hashes: Dict[str, Tuple[Tuple[float, int], str]] = {}  # path -> ((mtime, size), sha256)
+        self._file_ids: Dict[str, Optional[str]] = {}  # sha256 -> file_id, None once known to be missing
+        self._lock = threading.Lock()
+        self._upload_lock = threading.Lock()
+        self.uploads = 0
+
+    def content_hash(self, path: str) -> str:
+        """sha256 of the file, recomputed only when its mtime or size changes"""
+        stat = os.stat(path)
+        version = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            self._hashes[path] = (version, digest)
+        return digest
+
+    def file_id(self, content_hash: str) -> Optional[str]:
+        with self._lock:
+            if content_hash in self._file_ids:
+                return self._file_ids[content_hash]
+        file_id = self.db.get_telegram_file_id(content_hash)
+        with self._lock:
+            self._file_ids[content_hash] = file_id
+        return file_id
+
+    def _remember(self, content_hash: str, file_id: Optional[str]) -> None:
+        with self._lock:
+            self._file_ids[content_hash] = file_id
+        if file_id:
+            self.db.save_telegram_file_id(content_hash, file_id)
+
+    def send_photo(self, chat_id, path: str, **kwargs):
+        """Send the image at `path` by file_id, uploading it when there is no usable one"""
+        content_hash = self.content_hash(path)
+        file_id = self.file_id(content_hash)
+        if file_id:
+            try:
+                return self.send(chat_id=chat_id, photo=file_id, **kwargs)
+            except ApiTelegramException as e:
+                if not is_rejected_file_id(e):
+                    raise
+                self.logger.warning(f"file_id of {path} rejected, uploading it again: {e.description}")
+                with self._lock:
+                    if self._file_ids.get(content_hash) == file_id:
+                        self._file_ids[content_hash] = None
+
+        # One upload per image at a time, users arriving meanwhile get the fresh file_id
+        with self._upload_lock:
+            fresh = self._file_ids.get(content_hash)
+            if fresh and fresh != file_id:
+                return self.send(chat_id=chat_id, photo=fresh, **kwargs)
+            with open(path, 'rb') as f:
+                # Bytes instead of the file object, a flood-limited send is retried from the start
+                message = self.send(chat_id=chat_id, photo=f.read(), **kwargs)
+            self.uploads += 1
+            self._remember(content_hash, message.photo[-1].file_id)
+            return message
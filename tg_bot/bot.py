@@ -1,31 +1,38 @@
 import logging
-import pandas as pd
 import telebot # telebot
 from datetime import datetime as dt, timedelta
 import json
 from time import sleep
 import time
-import re
-from typing import Optional
+import threading
+from urllib.parse import urlparse
+from typing import Optional, Tuple
 
-from telebot import custom_filters, TeleBot
+from telebot import apihelper, custom_filters, TeleBot
 from tg_bot.states import BotStates
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup
-from telegram_bot_calendar import DetailedTelegramCalendar, WMonthTelegramCalendar, LSTEP
-from telegram.constants import ParseMode
 
 # States storage
-from telebot.storage import StateMemoryStorage
+from telebot.storage import StateMemoryStorage, StateStorageBase
 from telebot.handler_backends import State
 from telebot.types import ReactionTypeEmoji
 from tg_bot import messages
 from classes.classes import Reservation
-import ast
 
 from tg_bot.messages import *
+from tg_bot.messages import ParseMode
 from db.connection import Database
+from db.cache import TTLCache
 from tg_bot import config
 from tg_bot.reminder import ReminderSystem
+from tg_bot.outbox import SendQueue, PRIORITY_INTERACTIVE, PRIORITY_ADMIN
+from tg_bot.drafts import DraftStore, StateDraftStore
+from tg_bot.state_storage import PostgresStateStorage
+from tg_bot.assets import AssetCache
+from tg_bot.webhook import WebhookServer
+from tg_bot import metrics
+from tg_bot import callbacks
+from concurrent.futures import Future
 import math
 
 logging.basicConfig(
@@ -35,18 +42,62 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# callback_data of a selectable day on a telegram_bot_calendar page, followed by Y_M_D
+CALENDAR_DAY_PREFIX = 'cbcal_0_s_d_'
+
+
+def calendar_day(callback_data: str):
+    """Date of a day button of the calendar"""
+    return dt.strptime(callback_data[len(CALENDAR_DAY_PREFIX):], '%Y_%m_%d').date()
+
+
+def calendar_month(json_calendar: dict) -> Optional[Tuple[int, int]]:
+    """(year, month) of a calendar day page, None for month and year pages"""
+    for week in json_calendar['inline_keyboard']:
+        for button in week:
+            if button.get('callback_data', '').startswith(CALENDAR_DAY_PREFIX):
+                day = calendar_day(button['callback_data'])
+                return day.year, day.month
+    return None
+
+
 class TelegramBot:
-    state_storage : StateMemoryStorage
+    state_storage : StateStorageBase
     reservations_db : Database
     bot : telebot.TeleBot
     reminder_system : ReminderSystem
+    outbox : SendQueue
+    drafts : DraftStore | StateDraftStore
+    calendar_cache : TTLCache
+    assets : AssetCache
 
-    def __init__(self, bot_token:str, reservations_db:Database) -> None:
-        self.state_storage = StateMemoryStorage()
+    def __init__(self, bot_token:str, reservations_db:Database, state_storage:StateStorageBase|None = None) -> None:
+        self.state_storage = state_storage or StateMemoryStorage()
         self.reservations_db = reservations_db
+        if isinstance(self.state_storage, PostgresStateStorage):
+            # Read before TeleBot() sets up its middleware lists
+            apihelper.ENABLE_MIDDLEWARE = True
         self.bot = telebot.TeleBot(token=bot_token, state_storage=self.state_storage)
+        if isinstance(self.state_storage, PostgresStateStorage):
+            # Another worker may have changed the state since this process cached it
+            self.bot.add_middleware_handler(self.state_storage.start_update)
         self.admin_messages = {}
+        if isinstance(self.state_storage, StateMemoryStorage):
+            self.drafts = DraftStore(maxsize=config.drafts_max, ttl_seconds=config.draft_ttl_mins * 60)
+        else:
+            # Shared state storage, the next step of a booking may land on another worker
+            self.drafts = StateDraftStore(self.bot, ttl_seconds=config.draft_ttl_mins * 60)
+        self.calendar_cache = TTLCache(maxsize=config.calendar_cache_size, ttl_seconds=config.calendar_cache_ttl)
+        self.outbox = SendQueue(
+            self.bot,
+            workers=config.send_workers,
+            global_rate=config.send_rate_global,
+            chat_rate=config.send_rate_per_chat,
+            chat_burst=config.send_burst_per_chat,
+            max_retries=config.send_max_retries
+        )
 
+        self.assets = AssetCache(self.reservations_db, send_photo=self.send_photo)
         self.reminder_system = ReminderSystem(self)
         self.logger = logging.getLogger(__name__)
 
@@ -54,20 +105,65 @@ class TelegramBot:
         self.register_handlers()
         self.register_callback_handlers()
         self.register_admin_payment_handlers()
+        metrics.instrument_handlers(self.bot)
 
 
     def run_bot(self):
-        """Start both the bot and reminder system"""
+        """Start the send queue, the reminder system and the bot"""
+        self.outbox.start()
+
         # Start reminder system
         self.reminder_system.start()
         
-        # Start bot polling
+        # Start bot polling, getUpdates is refused while a webhook is set
         try:
             self.logger.info("Starting bot...")
+            self.bot.remove_webhook()
             self.bot.polling(non_stop=True)
         finally:
             # Ensure reminder system is stopped if bot exits
             self.reminder_system.stop()
+            self.outbox.stop()
+
+    def run_webhook(self, url: str, secret_token: str, host: str = '0.0.0.0', port: int = 8443):
+        """
+        Start the send queue, the reminder system and a webhook receiver instead of polling.
+
+        Args:
+            url: Public HTTPS URL Telegram posts updates to, its path is served by the receiver
+            secret_token: Telegram sends it back in every request, other requests are refused
+            host: Interface the receiver listens on
+            port: Port the receiver listens on
+        """
+        # The receiver runs the handlers in its own bounded pool, telebot's pool would queue without limit
+        self.bot.threaded = False
+        self.bot.worker_pool.close()
+
+        server = WebhookServer(
+            self.bot,
+            secret_token=secret_token,
+            host=host,
+            port=port,
+            path=urlparse(url).path or '/',
+            workers=config.webhook_workers,
+            queue_size=config.webhook_queue_size,
+            enqueue_timeout=config.webhook_enqueue_timeout,
+        )
+        self.outbox.start()
+        self.reminder_system.start()
+        server.start()
+        try:
+            self.logger.info("Starting bot with webhook...")
+            self.bot.set_webhook(
+                url=url,
+                secret_token=secret_token,
+                max_connections=config.webhook_max_connections,
+            )
+            threading.Event().wait()
+        finally:
+            server.stop()
+            self.reminder_system.stop()
+            self.outbox.stop()
 
 
     def set_state(self, user_id: int, new_state: State, store_prev_state: bool = True):
@@ -83,53 +179,82 @@ class TelegramBot:
 
         self.bot.set_state(user_id, new_state)
 
+    def get_draft(self, call) -> Optional[Reservation]:
+        """Booking draft of the user behind a callback, back to the main menu if it expired"""
+        draft = self.drafts.get(call.from_user.id)
+        if draft is None:
+            self.bot.answer_callback_query(call.id, text=DRAFT_EXPIRED_MESSAGE)
+            self.set_state(call.from_user.id, BotStates.state_main_menu)
+            self.show_main_menu(self.bot, call.message)
+        return draft
+
+    def find_reservation(self, handle: callbacks.Handle):
+        """Reservation a button refers to, by id or by the order_id of a legacy button"""
+        if isinstance(handle, int):
+            return self.reservations_db.get_reservation_by_id(handle)
+        return self.reservations_db.get_reservation_by_order_id(handle)
+
     def get_previous_state(self, user_id: int) -> Optional[State]:
         state_data = self.bot.retrieve_data(user_id)
         return state_data.data.get('prev_state') if state_data else None
 
-    def notify_admin(self, text:str, reservation:Reservation|None = None, save_msg_id = False):
+    def send_message(self, *args, **kwargs):
+        """bot.send_message through the outbound queue, waits for the sent message"""
+        return self.outbox.send_message(*args, priority=PRIORITY_INTERACTIVE, **kwargs).result()
+
+    def send_photo(self, *args, **kwargs):
+        """bot.send_photo through the outbound queue, waits for the sent message"""
+        return self.outbox.send_photo(*args, priority=PRIORITY_INTERACTIVE, **kwargs).result()
+
+    def reply_to(self, *args, **kwargs):
+        """bot.reply_to through the outbound queue, waits for the sent message"""
+        return self.outbox.reply_to(*args, priority=PRIORITY_INTERACTIVE, **kwargs).result()
+
+    def notify_admin(self, text:str, reservation:Reservation|None = None, save_msg_id = False) -> Future:
+        """Queue a notification to the admin chat, returns the Future of the sent message"""
         if not reservation:
-            msg = self.bot.send_message(chat_id=config.admin_chat_id, text=text, parse_mode=ParseMode.MARKDOWN)
-        else:
-            keyboard = messages.get_admin_payment_keyboard(reservation.order_id)
-            msg = self.bot.send_photo(
-                chat_id=config.admin_chat_id,
-                photo=reservation.payment_confirmation_file_id,
-                caption=messages.format_payment_confirm_receive_admin_notification(reservation),
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=keyboard
+            return self.outbox.send_message(
+                chat_id=config.admin_chat_id, text=text, parse_mode=ParseMode.MARKDOWN, priority=PRIORITY_ADMIN
             )
 
-            if save_msg_id:
-                if reservation.order_id not in self.admin_messages:
+        keyboard = messages.get_admin_payment_keyboard(reservation.id)
+        sent = self.outbox.send_photo(
+            chat_id=config.admin_chat_id,
+            photo=reservation.payment_confirmation_file_id,
+            caption=messages.format_payment_confirm_receive_admin_notification(reservation),
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=keyboard,
+            priority=PRIORITY_ADMIN
+        )
+
+        if save_msg_id:
+            def save_msg_id_when_sent(future: Future):
+                if future.exception() is None and reservation.order_id not in self.admin_messages:
                     self.admin_messages[reservation.order_id] = []
-                    self.admin_messages[reservation.order_id].append(msg.message_id)
+                    self.admin_messages[reservation.order_id].append(future.result().message_id)
+            sent.add_done_callback(save_msg_id_when_sent)
 
-        return msg.message_id
+        return sent
 
 
     def register_admin_payment_handlers(self):
-        @self.bot.callback_query_handler(func=lambda call: call.data.startswith(('confirm_payment_', 'reject_payment_')))
+        @self.bot.callback_query_handler(
+            func=lambda call: callbacks.action(call.data) in (callbacks.CONFIRM_PAYMENT, callbacks.REJECT_PAYMENT)
+        )
         def handle_admin_payment_confirmation(call):
             # Verify it's coming from admin chat
             if call.message.chat.id != int(config.admin_chat_id):
                 return
             
-            action = None
-            reservation_id = None
-
-            if str(call.data).startswith('confirm_payment_'):
-                action = 'confirm'
-                reservation_id = re.sub('^confirm_payment_', '', call.data)
-            elif str(call.data).startswith('reject_payment_'):
-                action = 'reject'
-                reservation_id = re.sub('^reject_payment_', '', call.data)
-                
-            reservation = self.reservations_db.get_reservation_by_order_id(reservation_id)
+            callback = callbacks.decode(call.data)
+            action = 'confirm' if callback.action == callbacks.CONFIRM_PAYMENT else 'reject'
+            reservation = self.find_reservation(callback.handle)
             
             if not reservation:
                 self.bot.answer_callback_query(call.id, text="Reservation not found")
                 return
+
+            reservation_id = reservation.order_id
                 
             if action == 'confirm':
                 # Update reservation status
@@ -144,7 +269,7 @@ class TelegramBot:
                     )
                     
                     # Notify user
-                    self.bot.send_message(
+                    self.send_message(
                         chat_id=reservation.telegram_id,
                         text=messages.format_reservation_confirmed_by_admin(reservation, action=action),
                         parse_mode=ParseMode.MARKDOWN
@@ -167,10 +292,10 @@ class TelegramBot:
                         parse_mode=ParseMode.MARKDOWN
                     )
                     logging.info(f'Reservation {reservation_id} rejected ')
-                    markup = messages.get_user_reminder_keyboard(str(reservation_id))
+                    markup = messages.get_user_reminder_keyboard(reservation.id)
                     
                     # Notify user about rejection
-                    self.bot.send_message(
+                    self.send_message(
                         chat_id=reservation.telegram_id,
                         text=messages.format_reservation_confirmed_by_admin(reservation, action=action),
                         parse_mode=ParseMode.MARKDOWN,
@@ -206,7 +331,7 @@ class TelegramBot:
         )
         def handle_message(msg):
             if msg.text == "Hi":
-                self.bot.send_message(msg.chat.id, "Hello!")
+                self.send_message(msg.chat.id, "Hello!")
             else:
                 self.bot.forward_message(
                     chat_id=config.admin_chat_id,
@@ -228,7 +353,7 @@ class TelegramBot:
                 markup.add(InlineKeyboardButton(BACK_BUTTON, callback_data='cb_back'))
 
                 sleep(1.0)
-                self.bot.send_message(
+                self.send_message(
                     msg.chat.id,
                     "Что-нибудь еще?",
                     reply_markup=markup
@@ -257,11 +382,11 @@ class TelegramBot:
                                                                                      payment_confirmation_file_id=file_id)
                 
                 # Reply to user
-                self.bot.reply_to(message, text=messages.format_payment_confirm_receive(payed_reservation))
+                self.reply_to(message, text=messages.format_payment_confirm_receive(payed_reservation))
                 
                 # Notify admin
-                keyboard = messages.get_admin_payment_keyboard(str(payed_reservation.order_id))
-                self.bot.send_photo(
+                keyboard = messages.get_admin_payment_keyboard(payed_reservation.id)
+                self.send_photo(
                     chat_id=config.admin_chat_id,
                     photo=file_id,
                     caption=messages.format_payment_confirm_receive_admin_notification(payed_reservation),
@@ -277,11 +402,11 @@ class TelegramBot:
                 payed_reservation = self.reservations_db.update_payment_confirmation(str(last_reservation.order_id), file_url, file_id)
 
                 # Reply to user
-                self.bot.reply_to(message, text=messages.format_payment_confirm_receive(payed_reservation))
+                self.reply_to(message, text=messages.format_payment_confirm_receive(payed_reservation))
                 
                 # Notify Admin
-                keyboard = messages.get_admin_payment_keyboard(payed_reservation.order_id)
-                self.bot.send_photo(
+                keyboard = messages.get_admin_payment_keyboard(payed_reservation.id)
+                self.send_photo(
                     chat_id=config.admin_chat_id,
                     photo=file_id,
                     caption=messages.format_payment_confirm_receive_admin_notification(payed_reservation),
@@ -295,21 +420,21 @@ class TelegramBot:
                 unpaid_reservations = self.reservations_db.get_unpaid_reservations_by_telegram_id(str(message.from_user.id))
                 
                 if len(unpaid_reservations) == 0:
-                    self.bot.reply_to(message, text=messages.format_no_pending_payments())
+                    self.reply_to(message, text=messages.format_no_pending_payments())
                     return
                 elif len(unpaid_reservations) > 1:
-                    self.bot.reply_to(message, text=messages.format_multiple_pending_payments())
+                    self.reply_to(message, text=messages.format_multiple_pending_payments())
                     return
                 else:
                     reservation = unpaid_reservations[0]
                     self.reservations_db.update_payment_confirmation(str(reservation.order_id), file_url, file_id)
 
                     # Reply to user
-                    self.bot.reply_to(message, messages.format_payment_confirm_receive(reservation))
+                    self.reply_to(message, messages.format_payment_confirm_receive(reservation))
                     
                     # Notify admin
-                    keyboard = messages.get_admin_payment_keyboard(reservation.order_id)
-                    self.bot.send_photo(
+                    keyboard = messages.get_admin_payment_keyboard(reservation.id)
+                    self.send_photo(
                         chat_id=config.admin_chat_id,
                         photo=file_id,
                         caption=messages.format_payment_confirm_receive_admin_notification(reservation),
@@ -322,18 +447,16 @@ class TelegramBot:
     def register_callback_handlers(self):
         """Register all callback query handlers"""
 
-        @self.bot.callback_query_handler(func=lambda call: call.data.startswith('view_reservation_'))
+        @self.bot.callback_query_handler(func=lambda call: callbacks.action(call.data) == callbacks.VIEW)
         def handle_reminder_callback(call):
             try:
-                # Extract reservation ID from callback data
-                reservation_id = call.data.replace('view_reservation_', '')
-                logging.info(f'Clicked {reservation_id} in reminder callback')
-                call.data = reservation_id
+                handle = callbacks.decode(call.data).handle
+                logging.info(f'Clicked {handle} in reminder callback')
                 
                 # Set state to my_reservation
                 self.set_state(call.from_user.id, BotStates.state_my_reservation)
                 # Show the reservation details
-                self.show_my_reservation(bot=self.bot, callback=call)
+                self.show_my_reservation(bot=self.bot, callback=call, handle=handle)
             except Exception as e:
                 # If any error occurs, delete the old message and send a new one
                 logging.error(f"Error in handle_reminder_callback: {e}")
@@ -412,7 +535,7 @@ class TelegramBot:
 
     def admin(self, message):
         chat_id = message.chat.id
-        self.bot.send_message(chat_id=chat_id, text='Hello')
+        self.send_message(chat_id=chat_id, text='Hello')
 
 
     def show_my_reservations(self, callback):
@@ -441,7 +564,7 @@ class TelegramBot:
                     button_text = f'{messages.get_status_string(r)} {day_str} {time_from_str} - {time_to_str} '
                     markup.add(InlineKeyboardButton(
                         text=button_text,
-                        callback_data=r.order_id
+                        callback_data=callbacks.reservation(callbacks.VIEW, r.id)
                     ))
             else:
                 reservation_message_text = MY_RESERVATIONS_MESSAGE_NO_RESERVATIONS
@@ -465,7 +588,7 @@ class TelegramBot:
                         chat_id=callback.message.chat.id,
                         message_id=callback.message.message_id
                     )
-                    self.bot.send_message(
+                    self.send_message(
                         chat_id=callback.message.chat.id,
                         text=reservation_message_text,
                         reply_markup=markup
@@ -486,7 +609,7 @@ class TelegramBot:
                         chat_id=callback.message.chat.id,
                         message_id=callback.message.message_id
                     )
-                    self.bot.send_message(
+                    self.send_message(
                         chat_id=callback.message.chat.id,
                         text=reservation_message_text,
                         reply_markup=markup
@@ -499,8 +622,11 @@ class TelegramBot:
             self.set_state(call.from_user.id, BotStates.state_main_menu)
             self.show_main_menu(self.bot, call.message)
         else:
+            # Lists sent before the callback codec carry the bare order_id
+            callback = callbacks.decode(call.data)
+            handle = callback.handle if callback else call.data
             self.set_state(call.from_user.id, BotStates.state_my_reservation)
-            self.show_my_reservation(self.bot, call)
+            self.show_my_reservation(self.bot, call, handle)
 
 
     def show_main_menu(self, bot:TeleBot, message):
@@ -512,12 +638,11 @@ class TelegramBot:
             InlineKeyboardButton(ABOUT_US_BUTTON, callback_data='cb_info')
         )
         bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-        bot.send_message(message.chat.id, WELCOME_MESSAGE, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+        self.send_message(message.chat.id, WELCOME_MESSAGE, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
 
     def callback_in_main_menu(self, call):
-        global new_reservation
         if call.data == "cb_new_reservation":
-            new_reservation = Reservation(telegramId=call.from_user.id, name=f'{call.from_user.full_name} ({call.from_user.username})')
+            self.drafts.new(call.from_user.id, name=f'{call.from_user.full_name} ({call.from_user.username})')
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_type)
             self.show_reservation_type(self.bot, call)
         elif call.data == 'cb_my_reservations':
@@ -543,11 +668,10 @@ class TelegramBot:
             self.show_main_menu(self.bot, call.message)
 
 
-    def show_my_reservation(self, bot:TeleBot, callback):
+    def show_my_reservation(self, bot:TeleBot, callback, handle: callbacks.Handle):
         chatId = callback.message.chat.id
         messageId = callback.message.message_id
-        reservation_id = callback.data
-        reservation = self.reservations_db.get_reservation_by_order_id(order_id=reservation_id)
+        reservation = self.find_reservation(handle)
         if not reservation:
             bot.edit_message_text(chat_id=chatId, message_id=messageId, text=RESERVATION_NOT_FOUND_MESSAGE)
             return
@@ -556,14 +680,14 @@ class TelegramBot:
         markup.row_width = 1
 
         if not reservation.payment_confirmation_file_id:
-            markup.add(InlineKeyboardButton(PAY_NOW_BUTTON, callback_data=f'pay_{reservation_id}'),
-                       InlineKeyboardButton(CANCEL_RESERVATION_BUTTON, callback_data=f'delete_{reservation_id}'),
+            markup.add(InlineKeyboardButton(PAY_NOW_BUTTON, callback_data=callbacks.reservation(callbacks.PAY, reservation.id)),
+                       InlineKeyboardButton(CANCEL_RESERVATION_BUTTON, callback_data=callbacks.reservation(callbacks.DELETE, reservation.id)),
                        InlineKeyboardButton(BACK_BUTTON, callback_data='cb_back'),
                        )
             reservation_info = format_reservation_info(reservation)
             bot.edit_message_text(chat_id=chatId, message_id=messageId, text=reservation_info, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
         else:
-            markup.add(InlineKeyboardButton(CHANGE_PAYCHECK_BUTTON, callback_data=f'change-pay_{reservation_id}'),
+            markup.add(InlineKeyboardButton(CHANGE_PAYCHECK_BUTTON, callback_data=callbacks.reservation(callbacks.CHANGE_PAY, reservation.id)),
                        InlineKeyboardButton(BACK_BUTTON, callback_data='cb_back'),
                        )
             bot.delete_message(chat_id=chatId, message_id=messageId)
@@ -572,7 +696,7 @@ class TelegramBot:
 
 
             try:
-                bot.send_photo(
+                self.send_photo(
                     chat_id=chatId,
                     photo=reservation.payment_confirmation_file_id,
                     caption=reservation_info,
@@ -583,7 +707,7 @@ class TelegramBot:
                 # If there's an error sending the photo (e.g., expired link),
                 # fall back to text-only message
                 logging.error(f"Error sending payment confirmation photo: {e}")
-                bot.send_message(
+                self.send_message(
                     chat_id=chatId,
                     text=f"{reservation_info}\n\n⚠️ Payment confirmation image unavailable",
                     reply_markup=markup
@@ -592,18 +716,18 @@ class TelegramBot:
 
 
     def callback_in_my_reservation(self, call):
+        callback = callbacks.decode(call.data)
         if call.data == 'cb_back':
             self.set_state(call.from_user.id, BotStates.state_my_reservation_list)
             self.show_my_reservations(call)
-        elif call.data.startswith('pay_') or call.data.startswith('change-pay_'):
-            order_id = '_'.join(call.data.split('_')[1:])
+        elif callback and callback.action in (callbacks.PAY, callbacks.CHANGE_PAY):
             self.set_state(call.from_user.id, BotStates.state_pay)
-            reservation_to_pay = self.reservations_db.get_reservation_by_order_id(order_id)
+            reservation_to_pay = self.find_reservation(callback.handle)
             self.show_pay(self.bot, callback=call, reservation=reservation_to_pay)
 
-        elif call.data.startswith('delete_'):
-            order_id = '_'.join(call.data.split('_')[1:])
-            deleted_reservation = self.reservations_db.delete_reservation(order_id)
+        elif callback and callback.action == callbacks.DELETE:
+            reservation = self.find_reservation(callback.handle)
+            deleted_reservation = self.reservations_db.delete_reservation(reservation.order_id) if reservation else None
             ## AG: TODO logics here
             self.set_state(call.from_user.id, BotStates.state_my_reservation_list)
             self.show_my_reservations(call)
@@ -626,13 +750,16 @@ class TelegramBot:
         bot.edit_message_text(chat_id=chatId, message_id=messageId, text=SELECT_WORKPLACE_MESSAGE, reply_markup=markup)
 
     def callback_in_reservation_menu_type(self, call):
-        global new_reservation
         if call.data == 'cb_back':
             self.set_state(call.from_user.id, BotStates.state_main_menu)
             self.show_main_menu(self.bot, call.message)
         else:
+            new_reservation = self.get_draft(call)
+            if new_reservation is None:
+                return
             spec = call.data[0]
             new_reservation.type = spec
+            self.drafts.save(call.from_user.id, new_reservation)
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_hours)
             self.show_hours(self.bot, call)
 
@@ -654,7 +781,6 @@ class TelegramBot:
         bot.edit_message_text(chat_id=chatId, message_id=messageId, text=SELECT_TIME_MESSAGE, reply_markup=markup)
 
     def callback_in_reservation_menu_hours(self, call):
-        global new_reservation
         if call.data == 'cb_back':
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_type)
             self.show_reservation_type(self.bot, call)
@@ -663,9 +789,13 @@ class TelegramBot:
             self.set_state(call.from_user.id, BotStates.state_admin_chat)
             self.show_admin_chat(self.bot, call)
         else:
+            new_reservation = self.get_draft(call)
+            if new_reservation is None:
+                return
             hours = int(call.data)
             new_reservation.period = hours
             new_reservation.sum = config.prices[new_reservation.type][hours]  # AG TODO: Move to Reservation class
+            self.drafts.save(call.from_user.id, new_reservation)
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_date)
             self.show_date(self.bot, call, new_reservation)
 
@@ -690,28 +820,42 @@ class TelegramBot:
 
 
     def format_calendar(self, calendar, new_reservation: Reservation):
+        """
+        Calendar keyboard with the days without a free timeslot crossed out.
+
+        Only the month on the page is looked up. The finished keyboard is kept
+        per (type, period, page) and reused as long as that month's available
+        days, which reservation writes invalidate, are the same.
+        """
         json_calendar = json.loads(calendar)
-        calendar = InlineKeyboardMarkup(InlineKeyboardMarkup.de_json(json_calendar).keyboard)
-        calendar.add(InlineKeyboardButton(BACK_BUTTON, callback_data='cb_back'),)
+        month = calendar_month(json_calendar)
+        if month is None:
+            # Month and year pages have no days to cross out
+            available_days = frozenset()
+        else:
+            available_days = frozenset(self.reservations_db.find_available_days_in_month(new_reservation, *month))
 
-        available_days = self.reservations_db.find_available_days(new_reservation)
+        cache_key = (new_reservation.type, float(new_reservation.period), calendar)
+        cached = self.calendar_cache.get(cache_key)
+        if cached is not None and cached[0] == available_days:
+            return cached[1]
 
-        date_format = '%Y_%m_%d'
+        markup = InlineKeyboardMarkup(InlineKeyboardMarkup.de_json(json_calendar).keyboard)
+        markup.add(InlineKeyboardButton(BACK_BUTTON, callback_data='cb_back'),)
 
-        for week in calendar.keyboard:
+        for week in markup.keyboard:
             for day in week:
-                if day.callback_data.startswith('cbcal_0_s_d_'):
-                    parts = day.callback_data.split('_')
-                    date_str = '_'.join(parts[-3:])
-                    date_str = dt.strptime(date_str, date_format).date().strftime(date_format)
-                    
-                    if date_str not in [date_obj.strftime(date_format) for date_obj in available_days]:
+                if day.callback_data.startswith(CALENDAR_DAY_PREFIX):
+                    if calendar_day(day.callback_data) not in available_days:
                         day.text = '✖️'
                         day.callback_data = 'cb_no_timeslots'
-                    
-        return calendar
+
+        self.calendar_cache.set(cache_key, (available_days, markup))
+        return markup
 
     def show_date(self, bot:TeleBot, callback, new_reservation:Reservation):
+        from telegram_bot_calendar import WMonthTelegramCalendar
+
         calendar, step = WMonthTelegramCalendar().build()
         calendar = self.format_calendar(calendar, new_reservation)
 
@@ -724,7 +868,13 @@ class TelegramBot:
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_hours)
             self.show_hours(self.bot, call)
             return
-        
+
+        new_reservation = self.get_draft(call)
+        if new_reservation is None:
+            return
+
+        from telegram_bot_calendar import DetailedTelegramCalendar, LSTEP
+
         result, key, step = DetailedTelegramCalendar().process(call.data)
         if not result and key:
             key = self.format_calendar(key, new_reservation=new_reservation)
@@ -735,11 +885,12 @@ class TelegramBot:
         elif result:
             if new_reservation.period < 12:
                 self.set_state(user_id=call.from_user.id, new_state=BotStates.state_reservation_menu_time)
-                day = pd.to_datetime(result)
+                day = dt.combine(result, dt.min.time())
                 new_reservation.day = day
+                self.drafts.save(call.from_user.id, new_reservation)
                 self.show_time(self.bot, call, new_reservation)
             elif new_reservation.period % 12 == 0:
-                day = pd.to_datetime(result)
+                day = dt.combine(result, dt.min.time())
                 new_reservation.day = day
                 new_reservation.time_from = dt.combine(new_reservation.day.date(), config.workday_start)
                 new_reservation.time_to = new_reservation.time_from + timedelta(hours=new_reservation.period)
@@ -749,11 +900,12 @@ class TelegramBot:
 
                 buttons = []
                 for timeslot, places in timeslots.items():
-                    buttons.append(InlineKeyboardButton(timeslot, callback_data=f'{timeslot}_p{places}'))
+                    buttons.append(InlineKeyboardButton(timeslot, callback_data=callbacks.time_slot(timeslot, places)))
                     available_places.append(places)
 
                 new_reservation.available_places = available_places[0]
-                
+                self.drafts.save(call.from_user.id, new_reservation)
+
                 self.set_state(call.from_user.id, BotStates.state_reservation_menu_place)
                 self.show_place(self.bot, call, new_reservation=new_reservation)
 
@@ -806,7 +958,7 @@ class TelegramBot:
 
         buttons = []
         for timeslot, places in timeslots.items():
-            buttons.append(InlineKeyboardButton(timeslot, callback_data=f'{timeslot}_p{places}'))
+            buttons.append(InlineKeyboardButton(timeslot, callback_data=callbacks.time_slot(timeslot, places)))
             available_places.append(places)
 
         # new_reservation.available_places = available_places
@@ -819,26 +971,30 @@ class TelegramBot:
             chatId = callback.message.chat.id
             messageId = callback.message.message_id
             bot.delete_message(chat_id=chatId, message_id=messageId)
-            bot.send_message(callback.message.chat.id, text=SELECT_TIME_SLOT_MESSAGE, reply_markup=markup)
+            self.send_message(callback.message.chat.id, text=SELECT_TIME_SLOT_MESSAGE, reply_markup=markup)
         else:
             chatId = callback.message.chat.id
             messageId = callback.message.message_id
             bot.edit_message_text(chat_id=chatId, message_id=messageId, text=SELECT_TIME_SLOT_MESSAGE, reply_markup=markup)
 
     def callback_in_reservation_menu_time(self, call):
-        global new_reservation
+        new_reservation = self.get_draft(call)
+        if new_reservation is None:
+            return
         if call.data == 'cb_back':
             new_reservation.day = ''
+            self.drafts.save(call.from_user.id, new_reservation)
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_date)
             self.show_date(self.bot, call, new_reservation)
         else:
-            callback_data = call.data.split('_p')
-            time = pd.to_datetime(callback_data[0])
-            available_places = ast.literal_eval(callback_data[1])
+            callback = callbacks.decode(call.data)
+            if callback is None or callback.action != callbacks.TIME_SLOT:
+                return
 
-            new_reservation.available_places = available_places
-            new_reservation.time_from = dt.combine(new_reservation.day.date(), time.time())
+            new_reservation.available_places = list(callback.places)
+            new_reservation.time_from = dt.combine(new_reservation.day.date(), callback.slot)
             new_reservation.time_to = new_reservation.time_from + timedelta(hours=new_reservation.period)
+            self.drafts.save(call.from_user.id, new_reservation)
 
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_place)
             self.show_place(self.bot, call, new_reservation=new_reservation)
@@ -848,25 +1004,30 @@ class TelegramBot:
         markup = InlineKeyboardMarkup()
         markup.row_width = 4
         for place in new_reservation.available_places:
-            markup.add(InlineKeyboardButton(f'Место {place}', callback_data=f'place_{place}'),)
+            markup.add(InlineKeyboardButton(f'Место {place}', callback_data=callbacks.seat(place)),)
 
         markup.add(InlineKeyboardButton(BACK_BUTTON, callback_data='cb_back'),)
         chatId = callback.message.chat.id
         messageId = callback.message.message_id
         bot.delete_message(chat_id=chatId, message_id=messageId)
-        bot.send_photo(chat_id=chatId, 
-                       caption=SELECT_SEAT_MESSAGE, 
-                       photo=open(config.place_images[new_reservation.type], 'rb'), 
-                       reply_markup=markup)
+        self.assets.send_photo(chatId,
+                               config.place_images[new_reservation.type],
+                               caption=SELECT_SEAT_MESSAGE,
+                               reply_markup=markup)
 
     def callback_in_reservation_menu_place(self, call):
-        global new_reservation
+        new_reservation = self.get_draft(call)
+        if new_reservation is None:
+            return
         if call.data == 'cb_back':
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_time)
             self.show_time(self.bot, call, new_reservation, going_back=True)
         else:
-            place = int(call.data.split('_')[1])
-            new_reservation.place = place
+            callback = callbacks.decode(call.data)
+            if callback is None or callback.action != callbacks.SEAT:
+                return
+            new_reservation.place = callback.places[0]
+            self.drafts.save(call.from_user.id, new_reservation)
 
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_recap)
             self.show_recap(self.bot, call, new_reservation=new_reservation)
@@ -889,10 +1050,12 @@ class TelegramBot:
         messageId = callback.message.message_id
         bot.delete_message(chat_id=chatId, message_id=messageId)
         # bot.send_photo(callback.message.chat.id, caption=recap_string, photo=open(img_path, 'rb'), reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
-        bot.send_message(callback.message.chat.id, text=recap_string, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+        self.send_message(callback.message.chat.id, text=recap_string, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
 
     def callback_in_reservation_menu_recap(self, call):
-        global new_reservation
+        new_reservation = self.get_draft(call)
+        if new_reservation is None:
+            return
         if call.data == 'cb_back':
             self.set_state(call.from_user.id, BotStates.state_reservation_menu_place)
             self.show_place(self.bot, call, new_reservation)
@@ -902,6 +1065,7 @@ class TelegramBot:
             new_reservation.payment_confirmation_link = None
             save_result_ok = self.reservations_db.create_reservation(new_reservation)
             if save_result_ok:
+                self.drafts.discard(call.from_user.id)
                 self.set_state(call.from_user.id, BotStates.state_pay)
                 self.show_pay(self.bot, call, new_reservation)
                 self.notify_admin(text=messages.format_reservation_created_admin_notification(new_reservation))
@@ -914,9 +1078,10 @@ class TelegramBot:
             new_reservation.payment_confirmation_link = None
             save_result_ok = self.reservations_db.create_reservation(new_reservation)
             if save_result_ok:
+                self.drafts.discard(call.from_user.id)
                 self.bot.delete_message(chat_id=call.message.chat.id, message_id=call.message.id)
                 self.set_state(call.from_user.id, BotStates.state_start)
-                self.bot.send_message(call.message.chat.id, messages.format_reservation_created(new_reservation), parse_mode=ParseMode.MARKDOWN)
+                self.send_message(call.message.chat.id, messages.format_reservation_created(new_reservation), parse_mode=ParseMode.MARKDOWN)
                 self.notify_admin(text=messages.format_reservation_created_admin_notification(new_reservation))
             else:
                 ...
@@ -947,13 +1112,15 @@ class TelegramBot:
         chatId = callback.message.chat.id
         messageId = callback.message.message_id
         bot.delete_message(chat_id=chatId, message_id=messageId)
-        bot.send_message(callback.message.chat.id, text=recap_string, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+        self.send_message(callback.message.chat.id, text=recap_string, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
 
     def callback_in_pay(self, call):
-        global new_reservation
         if call.data == 'cb_back':
             prev_state = self.get_previous_state(call.from_user.id)
             if prev_state == BotStates.state_reservation_menu_recap.name:
+                new_reservation = self.get_draft(call)
+                if new_reservation is None:
+                    return
                 self.set_state(call.from_user.id, BotStates.state_reservation_menu_recap)
                 self.show_recap(self.bot, call, new_reservation)
             elif prev_state == BotStates.state_my_reservation.name:
@@ -0,0 +1,160 @@
+"""
+Compact callback_data of the inline buttons.
+
+Telegram allows 64 bytes of callback_data. Buttons carrying data are encoded
+as PREFIX + version + action code + fixed-width base36 fields:
+
+    ~1t<slot:2><places:4>   time slot: 5-minute index from midnight, bitmask of free places
+    ~1s<place:2>            seat
+    ~1v<handle>             open a reservation
+    ~1p<handle>             pay for a reservation
+    ~1c<handle>             send another payment confirmation
+    ~1d<handle>             cancel a reservation
+    ~1a<handle>             admin confirms the payment
+    ~1r<handle>             admin rejects the payment
+
+<handle> is the reservation's primary key. Buttons sent before this format
+('view_reservation_<order_id>', 'pay_<order_id>', ...) still decode, with the
+order_id as the handle, so old reminders and admin messages keep working.
+"""
+from datetime import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple, Union
+
+PREFIX = '~'
+VERSION = '1'
+
+TIME_SLOT = 'time_slot'
+SEAT = 'seat'
+VIEW = 'view'
+PAY = 'pay'
+CHANGE_PAY = 'change_pay'
+DELETE = 'delete'
+CONFIRM_PAYMENT = 'confirm_payment'
+REJECT_PAYMENT = 'reject_payment'
+
+SLOT_MINS = 5
+SLOT_WIDTH = 2    # 36**2 five-minute slots cover a day
+PLACES_WIDTH = 4  # Bitmask of places 0..19 (36**4 < 2**21)
+PLACE_WIDTH = 2
+
+Handle = Union[int, str]  # Reservation id, or order_id of a button in the legacy format
+
+
+class Callback(NamedTuple):
+    action: str
+    handle: Optional[Handle] = None
+    slot: Optional[time] = None
+    places: Tuple[int, ...] = ()  # Free places of a time slot, the chosen place of a seat
+
+
+def _base36(value: int, width: int = 0) -> str:
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        value, digit = divmod(value, 36)
+        encoded = digits[digit] + encoded
+        if not value:
+            break
+    if width and len(encoded) > width:
+        raise ValueError(f'{encoded} does not fit in {width} base36 digits')
+    return encoded.rjust(width, '0')
+
+
+def _encode(code: str, payload: str) -> str:
+    return f'{PREFIX}{VERSION}{code}{payload}'
+
+
+def _places_mask(places: Iterable[int]) -> int:
+    mask = 0
+    for place in places:
+        mask |= 1 << place
+    return mask
+
+
+def time_slot(label: str, places: Iterable[int]) -> str:
+    """Button of the time picker, `label` is the 'HH:MM' start of the slot"""
+    minutes = int(label[:2]) * 60 + int(label[3:5])
+    if minutes % SLOT_MINS:
+        raise ValueError(f'{label} is not on the {SLOT_MINS}-minute grid')
+    return _encode(CODES[TIME_SLOT], _base36(minutes // SLOT_MINS, SLOT_WIDTH) + _base36(_places_mask(places), PLACES_WIDTH))
+
+
+def seat(place: int) -> str:
+    """Button of the seat picker"""
+    return _encode(CODES[SEAT], _base36(place, PLACE_WIDTH))
+
+
+def reservation(action: str, reservation_id: int) -> str:
+    """Button acting on a stored reservation: VIEW, PAY, CHANGE_PAY, DELETE, CONFIRM_PAYMENT or REJECT_PAYMENT"""
+    return _encode(CODES[action], _base36(reservation_id))
+
+
+def _decode_time_slot(payload: str) -> dict:
+    minutes = int(payload[:SLOT_WIDTH], 36) * SLOT_MINS
+    mask = int(payload[SLOT_WIDTH:SLOT_WIDTH + PLACES_WIDTH], 36)
+    return {
+        'slot': time(minutes // 60, minutes % 60),
+        'places': tuple(place for place in range(mask.bit_length()) if mask >> place & 1),
+    }
+
+
+def _decode_seat(payload: str) -> dict:
+    return {'places': (int(payload, 36),)}
+
+
+def _decode_handle(payload: str) -> dict:
+    return {'handle': int(payload, 36)}
+
+
+# Action code -> (action, payload parser)
+DECODERS: Dict[str, Tuple[str, Callable[[str], dict]]] = {
+    't': (TIME_SLOT, _decode_time_slot),
+    's': (SEAT, _decode_seat),
+    'v': (VIEW, _decode_handle),
+    'p': (PAY, _decode_handle),
+    'c': (CHANGE_PAY, _decode_handle),
+    'd': (DELETE, _decode_handle),
+    'a': (CONFIRM_PAYMENT, _decode_handle),
+    'r': (REJECT_PAYMENT, _decode_handle),
+}
+CODES = {action: code for code, (action, _) in DECODERS.items()}
+
+# Callback data of the buttons sent before the codec, the rest of the string is an order_id.
+# The recap buttons share the pay_ prefix and are not reservation buttons.
+LEGACY_PLAIN = frozenset({'pay_now', 'pay_later'})
+LEGACY_PREFIXES = (
+    ('view_reservation_', VIEW),
+    ('change-pay_', CHANGE_PAY),
+    ('pay_', PAY),
+    ('delete_', DELETE),
+    ('confirm_payment_', CONFIRM_PAYMENT),
+    ('reject_payment_', REJECT_PAYMENT),
+)
+
+
+@lru_cache(maxsize=4096)
+def decode(data: Optional[str]) -> Optional[Callback]:
+    """Callback of encoded (or legacy) callback_data, None for plain buttons and malformed data"""
+    if not data:
+        return None
+    if data.startswith(PREFIX):
+        if data[1:2] != VERSION or len(data) < 4 or data[2] not in DECODERS:
+            return None
+        action, parse = DECODERS[data[2]]
+        try:
+            return Callback(action, **parse(data[3:]))
+        except ValueError:
+            return None
+    if data in LEGACY_PLAIN:
+        return None
+    for prefix, action in LEGACY_PREFIXES:
+        if data.startswith(prefix) and len(data) > len(prefix):
+            return Callback(action, handle=data[len(prefix):])
+    return None
+
+
+def action(data: Optional[str]) -> Optional[str]:
+    """Action of the callback_data, for handler filters"""
+    callback = decode(data)
+    return callback.action if callback else None
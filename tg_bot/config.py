@@ -25,6 +25,38 @@ reminder_thresholds_from_start = [
 ]
 
 admin_reminder_cooldown = timedelta(minutes=30)
+reminder_poll_interval = timedelta(minutes=1)  # Longest sleep between reminder_jobs claims
+reminder_batch_size = 100  # reminder_jobs claimed per transaction
+reminder_send_timeout = timedelta(seconds=60)  # Wait for a claimed batch to be sent before postponing the rest
+reminder_retry_delay = timedelta(minutes=5)  # Failed and unsent reminders are claimed again after this
+
+# Outbound send queue, Telegram allows about 30 messages/s per bot and 1/s per chat
+send_workers = 4
+send_rate_global = 30
+send_rate_per_chat = 1
+send_burst_per_chat = 3
+send_max_retries = 5  # Retries of a send answered with 429 (retry_after)
+
+# PostgresStateStorage read cache, a user's entry is dropped when their next update arrives
+state_cache_size = 1024
+state_cache_ttl = 2  # seconds
+
+# Booking drafts per user, in the state data with a shared state storage
+draft_ttl_mins = 60
+drafts_max = 10000  # Drafts kept in memory with StateMemoryStorage
+
+# Rendered date picker keyboards per (type, period, calendar page)
+calendar_cache_size = 256
+calendar_cache_ttl = 300  # seconds
+
+# Webhook receiver (BOT_MODE=webhook), updates of one user always go to the same worker
+webhook_workers = 8
+webhook_queue_size = 100  # Updates waiting per worker
+webhook_enqueue_timeout = 1  # seconds before a full worker answers 503 and Telegram redelivers
+webhook_max_connections = 40  # Concurrent connections Telegram opens to the receiver
+
+# Prometheus metrics of the bot process, the admin app serves them on its /metrics
+metrics_port = 9101
 
 stride_mins = 30
 time_step = 30  # min
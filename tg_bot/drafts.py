@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Optional
+
+from telebot import TeleBot
+
+from classes.classes import Reservation
+
+
+class DraftStore:
+    """
+    Reservations being booked, one per Telegram user.
+
+    Drafts untouched for ttl_seconds are dropped (abandoned bookings) and at
+    most maxsize are kept, the least recently used goes first. Safe to use
+    from the handler threads.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl_seconds: float = 3600):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._drafts: 'OrderedDict[int, tuple[float, Reservation]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> None:
+        """Drafts are ordered by last use, expired ones are at the front. Caller holds the lock."""
+        while self._drafts:
+            touched_at, _ = next(iter(self._drafts.values()))
+            if now - touched_at < self.ttl_seconds:
+                return
+            self._drafts.popitem(last=False)
+
+    def new(self, telegram_id: int, name: str) -> Reservation:
+        """Start a new draft for the user, replacing any previous one"""
+        draft = Reservation(telegramId=telegram_id, name=name)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._drafts[telegram_id] = (now, draft)
+            self._drafts.move_to_end(telegram_id)
+            while len(self._drafts) > self.maxsize:
+                self._drafts.popitem(last=False)
+        return draft
+
+    def get(self, telegram_id: int) -> Optional[Reservation]:
+        """The user's draft or None if there is none or it expired, refreshes its TTL"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._drafts.get(telegram_id)
+            if entry is None:
+                return None
+            self._drafts[telegram_id] = (now, entry[1])
+            self._drafts.move_to_end(telegram_id)
+            return entry[1]
+
+    def save(self, telegram_id: int, draft: Reservation) -> None:
+        """Handlers change the draft in place, saving only refreshes its TTL"""
+        with self._lock:
+            if telegram_id in self._drafts:
+                self._drafts[telegram_id] = (time.monotonic(), draft)
+                self._drafts.move_to_end(telegram_id)
+
+    def discard(self, telegram_id: int) -> None:
+        with self._lock:
+            self._drafts.pop(telegram_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._drafts)
+
+
+class StateDraftStore:
+    """
+    Reservations being booked, kept in the telebot state data of the user.
+
+    Used with a shared state storage (PostgresStateStorage): whichever bot
+    process handles the next step of a booking finds the draft another one
+    saved. Handlers change the draft and save() writes it back. Drafts not
+    saved for ttl_seconds are dropped (abandoned bookings).
+    """
+
+    KEY = 'draft'
+
+    def __init__(self, bot: TeleBot, ttl_seconds: float = 3600):
+        self.bot = bot
+        self.ttl_seconds = ttl_seconds
+
+    def new(self, telegram_id: int, name: str) -> Reservation:
+        """Start a new draft for the user, replacing any previous one"""
+        draft = Reservation(telegramId=telegram_id, name=name)
+        self.save(telegram_id, draft)
+        return draft
+
+    def get(self, telegram_id: int) -> Optional[Reservation]:
+        """The user's draft or None if there is none or it expired"""
+        data = self.bot.retrieve_data(telegram_id).data or {}
+        entry = data.get(self.KEY)
+        # Wall clock, the draft may have been saved by another process
+        if not entry or time.time() - entry['saved_at'] >= self.ttl_seconds:
+            return None
+        return Reservation.from_state(entry['reservation'])
+
+    def save(self, telegram_id: int, draft: Reservation) -> None:
+        self.bot.add_data(user_id=telegram_id, **{self.KEY: {'saved_at': time.time(), 'reservation': draft.to_state()}})
+
+    def discard(self, telegram_id: int) -> None:
+        self.bot.add_data(user_id=telegram_id, **{self.KEY: None})
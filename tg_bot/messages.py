@@ -3,6 +3,12 @@ import datetime
 from datetime import date, time
 import pytz
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from tg_bot import callbacks
+
+
+class ParseMode:
+    """parse_mode values of the Bot API, python-telegram-bot was imported only for its enum of these"""
+    MARKDOWN = 'Markdown'
 
 
 # Message texts
@@ -24,6 +30,7 @@ INFO_MESSAGE = '''*Beauty Coworking Ikigai* - это рабочее простр
 MY_RESERVATIONS_MESSAGE = 'Ваши резервации:'
 MY_RESERVATIONS_MESSAGE_NO_RESERVATIONS = 'У Вас пока нет ни одной активной резервации.'
 RESERVATION_NOT_FOUND_MESSAGE = "Резервация не найдена..."
+DRAFT_EXPIRED_MESSAGE = 'Время на бронирование истекло, пожалуйста, начните заново.'
 
 ADMIN_CHAT_MESSAGE = 'Оставьте свое сообщение здесь и мы перешлем его администратору.'
 PATMENT_CONFIRM_REQUEST = 'Пожалуйста, пришлите нам подтверждение об оплате. Это может быть скриншот с суммой и адресом перевода.'
@@ -286,22 +293,22 @@ def format_reservation_info(reservation: Reservation):
 *Сумма*: {reservation.sum}
 """
 
-def get_admin_payment_keyboard(reservation_id: str) -> InlineKeyboardMarkup:
+def get_admin_payment_keyboard(reservation_id: int) -> InlineKeyboardMarkup:
     """Create keyboard for admin payment confirmation"""
     markup = InlineKeyboardMarkup()
     markup.row_width = 2
     markup.add(
-        InlineKeyboardButton("✅ Подтвердить", callback_data=f'confirm_payment_{reservation_id}'),
-        InlineKeyboardButton("❌ Отклонить", callback_data=f'reject_payment_{reservation_id}')
+        InlineKeyboardButton("✅ Подтвердить", callback_data=callbacks.reservation(callbacks.CONFIRM_PAYMENT, reservation_id)),
+        InlineKeyboardButton("❌ Отклонить", callback_data=callbacks.reservation(callbacks.REJECT_PAYMENT, reservation_id))
     )
     return markup
 
 
-def get_user_reminder_keyboard(reservation_id: str) -> InlineKeyboardMarkup:
+def get_user_reminder_keyboard(reservation_id: int) -> InlineKeyboardMarkup:
     markup = InlineKeyboardMarkup()
     markup.add(InlineKeyboardButton(
         "Перейти к резервации",
-        callback_data=f"view_reservation_{reservation_id}"
+        callback_data=callbacks.reservation(callbacks.VIEW, reservation_id)
     ))
     return markup
 
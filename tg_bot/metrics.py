@@ -0,0 +1,85 @@
+import functools
+
+from telebot import TeleBot
+
+from classes.metrics import Registry
+from db.query_stats import query_scope
+
+REGISTRY = Registry('bot')
+
+HANDLER_DURATION = REGISTRY.histogram(
+    'handler_duration_seconds', 'Time spent in a telebot handler', ('kind', 'handler')
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    'handler_errors', 'Exceptions raised by a telebot handler', ('kind', 'handler')
+)
+HANDLER_IN_FLIGHT = REGISTRY.gauge(
+    'handler_in_flight', 'Updates a telebot handler is working on right now', ('kind', 'handler')
+)
+
+REMINDER_PASS_DURATION = REGISTRY.histogram(
+    'reminder_pass_duration_seconds', 'Duration of one ReminderSystem pass over the due reminder jobs'
+)
+REMINDER_JOBS = REGISTRY.counter('reminder_jobs', 'Reminder jobs claimed and processed')
+
+# SendQueue latency percentiles and their quantile label
+OUTBOX_QUANTILES = (('p50', '0.5'), ('p95', '0.95'), ('max', '1'))
+
+# telebot handler lists and the update kind they handle
+HANDLER_LISTS = {
+    'message': 'message_handlers',
+    'callback_query': 'callback_query_handlers',
+}
+
+
+def instrument(function, kind: str, name: str):
+    """Wrap a handler with the latency, error and in-flight metrics and count its SQL queries"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        HANDLER_IN_FLIGHT.inc(kind=kind, handler=name)
+        try:
+            with HANDLER_DURATION.time(kind=kind, handler=name), query_scope(f'{kind}:{name}'):
+                return function(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(kind=kind, handler=name)
+            raise
+        finally:
+            HANDLER_IN_FLIGHT.dec(kind=kind, handler=name)
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_handlers(bot: TeleBot) -> None:
+    """Instrument every message and callback query handler registered so far"""
+    for kind, attribute in HANDLER_LISTS.items():
+        for handler in getattr(bot, attribute):
+            function = handler['function']
+            if not getattr(function, 'instrumented', False):
+                handler['function'] = instrument(function, kind, function.__name__)
+
+
+def register_outbox_metrics(registry: Registry, outbox) -> None:
+    """Queue depth, counters and send latency gauges of a tg_bot.outbox.SendQueue"""
+    registry.gauge(
+        'outbox_depth', 'Sends queued or parked, not yet handed to a sender', ('priority',),
+        callback=lambda: {(name,): depth for name, depth in outbox.stats()['depth_by_priority'].items()}
+    )
+    for stat, documentation in (
+        ('in_flight', 'Sends a sender thread is making right now'),
+        ('sent', 'Sends that succeeded'),
+        ('failed', 'Sends that failed for good'),
+        ('retried', 'Sends retried after a 429 flood limit answer'),
+    ):
+        registry.gauge(f'outbox_{stat}', documentation, callback=lambda stat=stat: outbox.stats()[stat])
+
+    def latency():
+        values = {}
+        for priority, summary in outbox.stats()['latency_seconds'].items():
+            for stat, quantile in OUTBOX_QUANTILES:
+                if summary[stat] is not None:
+                    values[(priority, quantile)] = summary[stat]
+        return values
+    registry.gauge(
+        'outbox_latency_seconds', 'Time from submit to sent over the last 1000 sends', ('priority', 'quantile'),
+        callback=latency
+    )
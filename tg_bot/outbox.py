@@ -0,0 +1,296 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+
+
+# Lower value is sent first
+PRIORITY_INTERACTIVE = 0  # Replies to the user who is using the bot right now
+PRIORITY_ADMIN = 1        # Admin chat notifications
+PRIORITY_BACKGROUND = 2   # Reminders and other bulk sends
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_ADMIN: 'admin',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+# Per-chat buckets kept before idle (full) ones are dropped
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Classic token bucket, `rate` tokens per second up to `capacity`. Not thread safe."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float, now: float) -> None:
+        """Make the next token available in `seconds` at the earliest (Telegram retry_after)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Send:
+    __slots__ = ('method', 'chat_id', 'priority', 'args', 'kwargs', 'future', 'submitted_at', 'attempts')
+
+    def __init__(self, method: str, chat_id, priority: int, args: tuple, kwargs: dict):
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+        self.attempts = 0
+
+
+class SendQueue:
+    """
+    Outbound queue for Telegram API sends.
+
+    A small pool of sender threads drains the queue by priority, then FIFO.
+    Every send takes a token from a global bucket and from the bucket of its
+    chat, so bursts stay under Telegram's flood limits; a chat without tokens
+    is parked until its next token instead of blocking a sender. 429 responses
+    park the chat for retry_after seconds and the send is retried.
+
+    submit() returns a Future with the TeleBot method result, callers that need
+    the sent Message (or its exception) wait on it, the others fire and forget.
+    Cancelling the Future drops a send that hasn't started yet.
+    """
+
+    def __init__(
+        self,
+        bot: TeleBot,
+        workers: int = 4,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        max_retries: int = 5,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        self._ready: List[tuple] = []    # (priority, seq, send)
+        self._delayed: List[tuple] = []  # (ready_at, seq, send)
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopped = False
+        self._in_flight = 0
+
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._latencies = {priority: deque(maxlen=1000) for priority in PRIORITY_NAMES}
+
+    # Public API
+
+    def submit(self, method: str, chat_id, priority: int, /, *args, **kwargs) -> Future:
+        """Queue bot.<method>(*args, **kwargs), rate limited on `chat_id`"""
+        send = _Send(method, chat_id, priority, args, kwargs)
+        with self._condition:
+            if self._stopped:
+                send.future.set_exception(RuntimeError("Send queue is stopped"))
+                return send.future
+            heapq.heappush(self._ready, (priority, next(self._counter), send))
+            self._condition.notify()
+        return send.future
+
+    def send_message(self, chat_id, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        return self.submit('send_message', chat_id, priority, chat_id=chat_id, text=text, **kwargs)
+
+    def send_photo(self, chat_id, photo, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        return self.submit('send_photo', chat_id, priority, chat_id=chat_id, photo=photo, **kwargs)
+
+    def reply_to(self, message, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        return self.submit('reply_to', message.chat.id, priority, message=message, text=text, **kwargs)
+
+    def start(self) -> None:
+        with self._condition:
+            self._stopped = False
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, daemon=True, name=f'send-queue-{len(self._threads)}')
+            thread.start()
+            self._threads.append(thread)
+        self.logger.info(f"Send queue started with {self.workers} senders")
+
+    def stop(self, timeout: Optional[float] = 10) -> None:
+        """Send what is queued within `timeout` seconds (None waits until it is sent, 0 sends nothing more), fail the rest"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while (self._ready or self._delayed or self._in_flight) and (deadline is None or time.monotonic() < deadline):
+                self._condition.wait(0.1)
+            self._stopped = True
+            dropped = [send for _, _, send in self._ready + self._delayed]
+            self._ready.clear()
+            self._delayed.clear()
+            self._condition.notify_all()
+
+        for send in dropped:
+            if not send.future.cancelled():
+                send.future.set_exception(RuntimeError("Send queue stopped before sending"))
+        if dropped:
+            self.logger.warning(f"Send queue stopped with {len(dropped)} unsent messages")
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def stats(self) -> dict:
+        """Queue depth, counters and send latency (submit to sent) per priority"""
+        with self._condition:
+            depth_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+            for _, _, send in self._ready + self._delayed:
+                depth_by_priority[PRIORITY_NAMES[send.priority]] += 1
+            latency = {}
+            for priority, samples in self._latencies.items():
+                ordered = sorted(samples)
+                latency[PRIORITY_NAMES[priority]] = {
+                    'count': len(ordered),
+                    'p50': ordered[len(ordered) // 2] if ordered else None,
+                    'p95': ordered[int(len(ordered) * 0.95)] if ordered else None,
+                    'max': ordered[-1] if ordered else None,
+                }
+            return {
+                'depth': len(self._ready) + len(self._delayed),
+                'depth_by_priority': depth_by_priority,
+                'in_flight': self._in_flight,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retried': self.retried,
+                'latency_seconds': latency,
+            }
+
+    # Sender threads
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_full(now)
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _take(self) -> Optional[_Send]:
+        """Next send allowed by both buckets, None once stopped. Caller holds the lock."""
+        while not self._stopped:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, send = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (send.priority, seq, send))
+
+            if not self._ready:
+                self._condition.wait(self._delayed[0][0] - now if self._delayed else None)
+                continue
+
+            priority, seq, send = heapq.heappop(self._ready)
+            if send.future.cancelled():
+                continue
+            chat_wait = self._chat_bucket(send.chat_id, now).wait_time(now)
+            if chat_wait > 0:
+                # Park it, the sender moves on to other chats
+                heapq.heappush(self._delayed, (now + chat_wait, seq, send))
+                continue
+
+            global_wait = self._global_bucket.wait_time(now)
+            if global_wait > 0:
+                heapq.heappush(self._ready, (priority, seq, send))
+                self._condition.wait(global_wait)
+                continue
+
+            # A retried send is running already, a first attempt may have been cancelled meanwhile
+            if send.attempts == 0 and not send.future.set_running_or_notify_cancel():
+                continue
+            self._chat_buckets[send.chat_id].take()
+            self._global_bucket.take()
+            self._in_flight += 1
+            return send
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._condition:
+                send = self._take()
+            if send is None:
+                return
+
+            send.attempts += 1
+            try:
+                result = getattr(self.bot, send.method)(*send.args, **send.kwargs)
+            except ApiTelegramException as e:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after')
+                if e.error_code == 429 and retry_after and send.attempts <= self.max_retries:
+                    self._retry(send, retry_after)
+                else:
+                    self._fail(send, e)
+            except Exception as e:
+                self._fail(send, e)
+            else:
+                self._done(send, result)
+
+    def _retry(self, send: _Send, retry_after: float) -> None:
+        self.logger.warning(f"Flood limit on chat {send.chat_id}, retrying {send.method} in {retry_after}s")
+        # Files were read by the failed attempt
+        for value in list(send.args) + list(send.kwargs.values()):
+            if hasattr(value, 'seek'):
+                value.seek(0)
+        with self._condition:
+            now = time.monotonic()
+            self._chat_bucket(send.chat_id, now).pause(retry_after, now)
+            heapq.heappush(self._delayed, (now + retry_after, next(self._counter), send))
+            self._in_flight -= 1
+            self.retried += 1
+            self._condition.notify_all()
+
+    def _fail(self, send: _Send, error: Exception) -> None:
+        self.logger.error(f"Failed to {send.method} to chat {send.chat_id}: {error}")
+        with self._condition:
+            self._in_flight -= 1
+            self.failed += 1
+            self._condition.notify_all()
+        send.future.set_exception(error)
+
+    def _done(self, send: _Send, result) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            self.sent += 1
+            self._latencies[send.priority].append(time.monotonic() - send.submitted_at)
+            self._condition.notify_all()
+        send.future.set_result(result)
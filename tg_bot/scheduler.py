@@ -0,0 +1,109 @@
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+_REMOVED = object()  # Placeholder key of a cancelled heap entry
+
+
+class DeadlineScheduler:
+    """
+    Runs a handler at wall-clock deadlines from a single thread.
+
+    Pending events live in a heap ordered by due time and the thread sleeps
+    exactly until the earliest one (or until an event is added). Every event
+    belongs to a key, e.g. an order id, and cancel(key) drops all of its
+    pending events: the entries are marked removed and skipped when they
+    reach the top of the heap.
+    """
+
+    def __init__(self, handler: Callable[[Hashable, Any], None], clock: Callable[[], datetime]):
+        """
+        Args:
+            handler: Called as handler(key, payload) for every due event, outside the lock
+            clock: Returns the current aware datetime, comparable with the due times
+        """
+        self.logger = logging.getLogger(__name__)
+        self.handler = handler
+        self.clock = clock
+
+        self._heap: List[list] = []
+        self._entries: Dict[Hashable, List[list]] = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, key: Hashable, due: datetime, payload: Any = None) -> None:
+        """Add an event for `key`, due at `due` (past due times run immediately)"""
+        entry = [due, next(self._counter), key, payload]
+        with self._condition:
+            heapq.heappush(self._heap, entry)
+            self._entries.setdefault(key, []).append(entry)
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def cancel(self, key: Hashable) -> None:
+        """Drop every pending event of `key`"""
+        with self._condition:
+            for entry in self._entries.pop(key, ()):
+                entry[2] = _REMOVED
+
+    def clear(self) -> None:
+        """Drop every pending event"""
+        with self._condition:
+            self._heap.clear()
+            self._entries.clear()
+
+    def pending(self) -> int:
+        with self._condition:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def _pop_due(self, now: datetime) -> List[Tuple[Hashable, Any]]:
+        """Remove and return the (key, payload) of due events, caller holds the lock"""
+        due_events = []
+        while self._heap and (self._heap[0][2] is _REMOVED or self._heap[0][0] <= now):
+            _, _, key, payload = entry = heapq.heappop(self._heap)
+            if key is _REMOVED:
+                continue
+            entries = self._entries[key]
+            entries.remove(entry)
+            if not entries:
+                del self._entries[key]
+            due_events.append((key, payload))
+        return due_events
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                now = self.clock()
+                due_events = self._pop_due(now)
+                if not due_events:
+                    # Sleep until the earliest event, schedule() and stop() wake us earlier
+                    timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                    self._condition.wait(timeout)
+                    continue
+
+            for key, payload in due_events:
+                try:
+                    self.handler(key, payload)
+                except Exception as e:
+                    self.logger.error(f"Scheduled event {key} {payload} failed: {e}")
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
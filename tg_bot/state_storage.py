@@ -0,0 +1,154 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from telebot.storage import StateStorageBase
+from telebot.storage.base_storage import StateContext
+
+from db import models
+from db.connection import Database
+
+
+def _compact(data: dict) -> dict:
+    """Drop None values, the handlers treat a missing key and None the same"""
+    return {key: value for key, value in data.items() if value is not None}
+
+
+class PostgresStateStorage(StateStorageBase):
+    """
+    telebot state storage in the bot_states table.
+
+    Every bot process reads and writes the same rows, so users keep their place
+    in the booking flow across restarts and between workers. Each write is one
+    UPSERT/UPDATE ... RETURNING that also refreshes a small in-process cache;
+    reads go through the cache, which saves the repeated get_state calls of the
+    state filters while one update is handled. Register start_update as a
+    middleware so every update drops the user's entry and starts from what
+    other workers wrote, cache_ttl only bounds how long an entry can live.
+    """
+
+    def __init__(self, db: Database, cache_size: int = 1024, cache_ttl: float = 2):
+        super().__init__()
+        self.db = db
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: 'OrderedDict[Tuple[int, int], Tuple[float, Optional[tuple]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Cache
+
+    def _cached(self, key: Tuple[int, int]):
+        """(hit, row) where row is (state, data) or None for a missing record"""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return False, None
+            self._cache.move_to_end(key)
+            return True, entry[1]
+
+    def _remember(self, key: Tuple[int, int], row: Optional[tuple]) -> None:
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, row)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def forget(self, chat_id: int, user_id: int) -> None:
+        with self._lock:
+            self._cache.pop((chat_id, user_id), None)
+
+    def start_update(self, bot, update) -> None:
+        """telebot middleware, the next read of the user's state goes to the database"""
+        event = update.message or update.callback_query
+        if event is None:
+            return
+        user_id = event.from_user.id
+        message = event if update.message else event.message
+        # The handlers address private chats by user id alone
+        self.forget(user_id, user_id)
+        if message is not None and message.chat.id != user_id:
+            self.forget(message.chat.id, user_id)
+
+    def _row(self, chat_id: int, user_id: int) -> Optional[tuple]:
+        """(state, data) of a user, read through the cache"""
+        key = (chat_id, user_id)
+        hit, row = self._cached(key)
+        if hit:
+            return row
+
+        with self.db.get_db() as session:
+            row = session.execute(
+                select(models.BotState.state, models.BotState.data)
+                .where(models.BotState.chat_id == chat_id, models.BotState.user_id == user_id)
+            ).first()
+        row = tuple(row) if row else None
+        self._remember(key, row)
+        return row
+
+    def _write(self, chat_id: int, user_id: int, statement) -> bool:
+        """Run a write returning (state, data) and cache the result, False if no record matched"""
+        statement = statement.returning(models.BotState.state, models.BotState.data)
+        with self.db.get_db() as session:
+            row = session.execute(statement).first()
+            session.commit()
+        row = tuple(row) if row else None
+        self._remember((chat_id, user_id), row)
+        return row is not None
+
+    def _update(self, chat_id: int, user_id: int, **values):
+        return update(models.BotState).where(
+            models.BotState.chat_id == chat_id,
+            models.BotState.user_id == user_id
+        ).values(updated_at=func.now(), **values)
+
+    # StateStorageBase
+
+    def set_state(self, chat_id, user_id, state):
+        if hasattr(state, 'name'):
+            state = state.name
+        statement = pg_insert(models.BotState).values(chat_id=chat_id, user_id=user_id, state=state, data={})
+        statement = statement.on_conflict_do_update(
+            index_elements=[models.BotState.chat_id, models.BotState.user_id],
+            set_={'state': statement.excluded.state, 'updated_at': func.now()}
+        )
+        return self._write(chat_id, user_id, statement)
+
+    def delete_state(self, chat_id, user_id):
+        with self.db.get_db() as session:
+            deleted = session.execute(
+                delete(models.BotState)
+                .where(models.BotState.chat_id == chat_id, models.BotState.user_id == user_id)
+            ).rowcount
+            session.commit()
+        self._remember((chat_id, user_id), None)
+        return deleted > 0
+
+    def get_state(self, chat_id, user_id):
+        row = self._row(chat_id, user_id)
+        return row[0] if row else None
+
+    def get_data(self, chat_id, user_id):
+        row = self._row(chat_id, user_id)
+        return row[1] if row else None
+
+    def reset_data(self, chat_id, user_id):
+        return self._write(chat_id, user_id, self._update(chat_id, user_id, data={}))
+
+    def set_data(self, chat_id, user_id, key, value):
+        # Merged in SQL, concurrent writers of other keys are kept
+        if value is None:
+            data = models.BotState.data.op('-')(key)
+        else:
+            data = models.BotState.data.op('||')(literal({key: value}, JSONB))
+        if not self._write(chat_id, user_id, self._update(chat_id, user_id, data=data)):
+            raise RuntimeError('chat_id {} and user_id {} does not exist'.format(chat_id, user_id))
+        return True
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    def save(self, chat_id, user_id, data):
+        self._write(chat_id, user_id, self._update(chat_id, user_id, data=_compact(data or {})))
@@ -0,0 +1,187 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from telebot import TeleBot
+from telebot.types import Update
+
+
+# Telegram updates are small, anything bigger is not from Telegram
+MAX_BODY_BYTES = 1024 * 1024
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def update_key(data: dict) -> int:
+    """User the update comes from (update_id if there is none), updates of one user are handled in order"""
+    for value in data.values():
+        if isinstance(value, dict):
+            sender = value.get('from') or value.get('chat') or value.get('user')
+            if isinstance(sender, dict) and 'id' in sender:
+                return sender['id']
+    return data.get('update_id', 0)
+
+
+class WebhookServer:
+    """
+    HTTP receiver for Telegram webhook updates.
+
+    The receiver only checks the secret token, parses the update and queues it,
+    handlers run in a fixed pool of worker threads. Every worker has its own
+    bounded queue and updates are routed by user, so the updates of one user
+    are handled one by one and in order while different users are served in
+    parallel. When the queue of a user's worker stays full for
+    `enqueue_timeout` seconds the update is answered with 503 and Telegram
+    delivers it again later, which slows Telegram down instead of piling up
+    updates in memory.
+    """
+
+    def __init__(
+        self,
+        bot: TeleBot,
+        secret_token: str,
+        host: str = '0.0.0.0',
+        port: int = 8443,
+        path: str = '/',
+        workers: int = 8,
+        queue_size: int = 100,
+        enqueue_timeout: float = 1,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.bot = bot
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self.workers = workers
+        self.enqueue_timeout = enqueue_timeout
+
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads: List[threading.Thread] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    # Public API
+
+    def start(self) -> None:
+        """Start the workers and listen in a background thread"""
+        self._threads = [
+            threading.Thread(target=self._worker, args=(updates,), daemon=True, name=f'webhook-{i}')
+            for i, updates in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]  # The bound one when started on port 0
+        threading.Thread(target=self._server.serve_forever, daemon=True, name='webhook-http').start()
+        self.logger.info(f"Webhook receiver listening on {self.host}:{self.port}{self.path} with {self.workers} workers")
+
+    def stop(self) -> None:
+        """Stop accepting updates and handle the ones already queued"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for updates in self._queues:
+            updates.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'depth': sum(updates.qsize() for updates in self._queues),
+                'received': self.received,
+                'rejected': self.rejected,
+                'processed': self.processed,
+                'failed': self.failed,
+            }
+
+    def submit(self, data: dict) -> bool:
+        """Queue a raw update, False if the worker of its user stayed busy for enqueue_timeout"""
+        update = Update.de_json(data)
+        updates = self._queues[hash(update_key(data)) % self.workers]
+        try:
+            updates.put(update, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.received += 1
+        return True
+
+    # Workers
+
+    def _worker(self, updates: queue.Queue) -> None:
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                self.logger.error(f"Failed to handle update {update.update_id}: {e}")
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    self.processed += 1
+
+    # HTTP
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, Telegram reuses its connections
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(HTTPStatus.NOT_FOUND)
+                if not hmac.compare_digest(self.headers.get(SECRET_HEADER, ''), server.secret_token):
+                    return self._reply(HTTPStatus.FORBIDDEN)
+
+                length = int(self.headers.get('Content-Length') or 0)
+                if length > MAX_BODY_BYTES:
+                    return self._reply(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, close=True)
+                try:
+                    data = json.loads(self.rfile.read(length))
+                except ValueError:
+                    return self._reply(HTTPStatus.BAD_REQUEST)
+                if not isinstance(data, dict) or 'update_id' not in data:
+                    return self._reply(HTTPStatus.BAD_REQUEST)
+
+                if not server.submit(data):
+                    return self._reply(HTTPStatus.SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+                self._reply(HTTPStatus.OK)
+
+            def _reply(self, status: HTTPStatus, headers: Optional[dict] = None, close: bool = False):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', '0')
+                if close:
+                    self.send_header('Connection', 'close')
+                    self.close_connection = True
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                server.logger.debug(format % args)
+
+        return Handler